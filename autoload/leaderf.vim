@@ -655,6 +655,32 @@ function! leaderf#matchaddpos(group, pos) abort
     endfor
 endfunction
 
+" add the highlights of `pos` to the window `winid`, 0 means the current window.
+" `pos` - A list of the positions of matchaddpos(), the length is not limited.
+" return the list of the match ids.
+function! leaderf#matchaddposList(winid, group, pos) abort
+    let ids = []
+    " The maximum number of positions is 8 in matchaddpos().
+    for i in range(0, len(a:pos) - 1, 8)
+        if a:winid == 0
+            call add(ids, matchaddpos(a:group, a:pos[i : i + 7]))
+        else
+            call win_execute(a:winid, 'call add(ids, matchaddpos(a:group, a:pos[i : i + 7]))')
+        endif
+    endfor
+    return ids
+endfunction
+
+function! leaderf#matchdeleteList(winid, ids) abort
+    for id in a:ids
+        if a:winid == 0
+            silent! call matchdelete(id)
+        else
+            silent! call matchdelete(id, a:winid)
+        endif
+    endfor
+endfunction
+
 function! leaderf#closeAllFloatwin(input_win_id, content_win_id, statusline_win_id, show_statusline, id) abort
     if winbufnr(a:input_win_id) == -1
         silent! call nvim_win_close(g:Lf_PreviewWindowID[a:id], 0)
@@ -38,8 +38,26 @@ typedef struct FeString
 {
     char*    str;
     uint32_t len;
+    /* getCharBitmap() of str, all bits are set if it is unknown */
+    uint64_t bitmap;
 }FeString;
 
+/* the candidates are stored in one contiguous buffer */
+typedef struct CandidateStore
+{
+    char*     buffer;
+    size_t    size;
+    size_t    capacity;
+    /* offsets[i] is the start of the i-th candidate, offsets[count] is the end of the last one */
+    size_t*   offsets;
+    uint32_t  count;
+    uint32_t  offsets_capacity;
+    /* bitmaps[i] is getCharBitmap() of the i-th candidate */
+    uint64_t* bitmaps;
+    /* a list of the candidates themselves, the results are taken from it */
+    PyObject* items;
+}CandidateStore;
+
 typedef struct TaskItem
 {
     uint32_t function;
@@ -82,6 +100,24 @@ typedef struct PySetTaskItem
     PyObject* py_source;
 }PySetTaskItem;
 
+typedef struct TopKTaskItem
+{
+    uint32_t function;
+    uint32_t offset;
+    uint32_t length;
+    uint32_t top_k;
+}TopKTaskItem;
+
+typedef struct MatchJob MatchJob;
+
+typedef struct MatchTaskItem
+{
+    uint32_t  function;
+    uint32_t  offset;
+    uint32_t  length;
+    MatchJob* job;
+}MatchTaskItem;
+
 typedef struct FeCircularQueue
 {
     void**          buffer;
@@ -131,6 +167,39 @@ struct FuzzyEngine
         HighlightGroup** highlights;
     };
     FeCircularQueue task_queue;
+    /* the latest MatchJob created by fuzzyMatchAsync() */
+    MatchJob*       pJob;
+};
+
+/* fuzzyMatch() that runs in the worker threads while the caller goes on */
+struct MatchJob
+{
+    FuzzyEngine*     pEngine;
+    PatternContext*  pPattern_ctxt;
+    uint8_t          is_name_only;
+    uint8_t          sort_results;
+    volatile uint8_t cancelled;
+    uint32_t         top_k;
+    uint32_t         source_size;
+    uint32_t         task_count;
+    uint32_t         unfinished_tasks;
+    /* keeps pPattern_ctxt alive */
+    PyObject*        py_pattern;
+    /* source[begin:end], the results are taken from it */
+    PyObject*        py_items;
+    /* a copy of the candidates if source is a CandidateStore, which may be reallocated */
+    char*            buffer;
+    FeString*        source;
+    FeResult*        results;
+    MatchTaskItem*   tasks;
+    PyObject*        py_result;
+#if defined(_MSC_VER)
+    CRITICAL_SECTION cs;
+    HANDLE           all_done_event;
+#else
+    pthread_mutex_t  mutex;
+    pthread_cond_t   all_done_cond;
+#endif
 };
 
 #if defined(_MSC_VER)
@@ -229,6 +298,55 @@ struct FuzzyEngine
         LeaveCriticalSection(&(queue).cs);                                          \
     } while(0)
 
+/* the task is not counted by QUEUE_JOIN() */
+#define QUEUE_PUT_DETACHED(queue, pTask) QUEUE_PUT(queue, pTask)
+
+#define JOB_INIT(job, count, ret_val)                                               \
+    do {                                                                            \
+        (job).unfinished_tasks = (count);                                           \
+        InitializeCriticalSection(&(job).cs);                                       \
+        /* manual-reset event */                                                    \
+        (job).all_done_event = CreateEvent(NULL, TRUE, (count) == 0, NULL);         \
+        if ( !(job).all_done_event )                                                \
+        {                                                                           \
+            fprintf(stderr, "CreateEvent error: %d\n", GetLastError());             \
+            DeleteCriticalSection(&(job).cs);                                       \
+            ret_val = -1;                                                           \
+            break;                                                                  \
+        }                                                                           \
+    } while(0)
+
+#define JOB_DESTROY(job)                                                            \
+    do {                                                                            \
+        DeleteCriticalSection(&(job).cs);                                           \
+        CloseHandle((job).all_done_event);                                          \
+    } while(0)
+
+#define JOB_TASK_DONE(job)                                                          \
+    do {                                                                            \
+        EnterCriticalSection(&(job).cs);                                            \
+        --(job).unfinished_tasks;                                                   \
+        if ( (job).unfinished_tasks == 0 )                                          \
+            SetEvent((job).all_done_event);                                         \
+        LeaveCriticalSection(&(job).cs);                                            \
+    } while(0)
+
+#define JOB_JOIN(job)                                                               \
+    do {                                                                            \
+        if ( WaitForSingleObject((job).all_done_event, INFINITE) == WAIT_FAILED )   \
+        {                                                                           \
+            fprintf(stderr, "WaitForSingleObject error: %d\n", GetLastError());     \
+            break;                                                                  \
+        }                                                                           \
+    } while(0)
+
+#define JOB_IS_DONE(job, done)                                                      \
+    do {                                                                            \
+        EnterCriticalSection(&(job).cs);                                            \
+        done = (job).unfinished_tasks == 0;                                         \
+        LeaveCriticalSection(&(job).cs);                                            \
+    } while(0)
+
 #else
 
 #define QUEUE_INIT(queue, queue_capacity, ret_val)                                  \
@@ -317,6 +435,66 @@ struct FuzzyEngine
         pthread_mutex_unlock(&(queue).mutex);                                       \
     } while(0)
 
+/* the task is not counted by QUEUE_JOIN() */
+#define QUEUE_PUT_DETACHED(queue, pTask)                                            \
+    do {                                                                            \
+        pthread_mutex_lock(&(queue).mutex);                                         \
+        (queue).buffer[(queue).tail] = (void*)(pTask);                              \
+        (queue).tail = ((queue).tail + 1) % (queue).capacity;                       \
+        pthread_cond_signal(&(queue).not_empty_cond);                               \
+        pthread_mutex_unlock(&(queue).mutex);                                       \
+    } while(0)
+
+#define JOB_INIT(job, count, ret_val)                                               \
+    do {                                                                            \
+        (job).unfinished_tasks = (count);                                           \
+        if ( pthread_mutex_init(&(job).mutex, NULL) != 0 )                          \
+        {                                                                           \
+            fprintf(stderr, "pthread_mutex_init error!\n");                         \
+            ret_val = -1;                                                           \
+            break;                                                                  \
+        }                                                                           \
+        if ( pthread_cond_init(&(job).all_done_cond, NULL) != 0 )                   \
+        {                                                                           \
+            fprintf(stderr, "pthread_cond_init error!\n");                          \
+            pthread_mutex_destroy(&(job).mutex);                                    \
+            ret_val = -1;                                                           \
+            break;                                                                  \
+        }                                                                           \
+    } while(0)
+
+#define JOB_DESTROY(job)                                                            \
+    do {                                                                            \
+        pthread_mutex_destroy(&(job).mutex);                                        \
+        pthread_cond_destroy(&(job).all_done_cond);                                 \
+    } while(0)
+
+#define JOB_TASK_DONE(job)                                                          \
+    do {                                                                            \
+        pthread_mutex_lock(&(job).mutex);                                           \
+        --(job).unfinished_tasks;                                                   \
+        if ( (job).unfinished_tasks == 0 )                                          \
+            pthread_cond_broadcast(&(job).all_done_cond);                           \
+        pthread_mutex_unlock(&(job).mutex);                                         \
+    } while(0)
+
+#define JOB_JOIN(job)                                                               \
+    do {                                                                            \
+        pthread_mutex_lock(&(job).mutex);                                           \
+        while ( (job).unfinished_tasks > 0 )                                        \
+        {                                                                           \
+            pthread_cond_wait(&(job).all_done_cond, &(job).mutex);                  \
+        }                                                                           \
+        pthread_mutex_unlock(&(job).mutex);                                         \
+    } while(0)
+
+#define JOB_IS_DONE(job, done)                                                      \
+    do {                                                                            \
+        pthread_mutex_lock(&(job).mutex);                                           \
+        done = (job).unfinished_tasks == 0;                                         \
+        pthread_mutex_unlock(&(job).mutex);                                         \
+    } while(0)
+
 #endif
 
 #define MIN(a, b) ((a) < (b) ? (a) : (b))
@@ -333,7 +511,9 @@ enum
     MERGE,
     MERGE_2,
     PY_SET_ITEM,
-    PY_SET_ITEM_2
+    PY_SET_ITEM_2,
+    TOP_K,
+    MATCH_JOB
 };
 
 /* sort in descending order */
@@ -353,6 +533,64 @@ static int compare2(const void* a, const void* b)
     return (int)wb - (int)wa;
 }
 
+/* sift down the item at `i` of a min-heap */
+static void siftDown(FeResult* heap, uint32_t size, uint32_t i)
+{
+    FeResult item = heap[i];
+    while ( 1 )
+    {
+        uint32_t child = (i << 1) + 1;
+        if ( child >= size )
+            break;
+
+        if ( child + 1 < size && heap[child + 1].weight < heap[child].weight )
+        {
+            ++child;
+        }
+
+        if ( item.weight <= heap[child].weight )
+            break;
+
+        heap[i] = heap[child];
+        i = child;
+    }
+    heap[i] = item;
+}
+
+/**
+ * move the `k` results with the largest weight to the front of `results`
+ * in descending order, the rest are left unsorted.
+ */
+static void partialSort(FeResult* results, uint32_t length, uint32_t k)
+{
+    if ( k >= length )
+    {
+        qsort(results, length, sizeof(FeResult), compare);
+        return;
+    }
+
+    /* results[0, k) is a bounded min-heap of the winners so far */
+    int32_t i = (int32_t)(k >> 1) - 1;
+    for ( ; i >= 0; --i )
+    {
+        siftDown(results, k, (uint32_t)i);
+    }
+
+    uint32_t j = k;
+    for ( ; j < length; ++j )
+    {
+        if ( results[j].weight > results[0].weight )
+        {
+            FeResult tmp = results[0];
+            results[0] = results[j];
+            results[j] = tmp;
+            siftDown(results, k, 0);
+        }
+    }
+
+    qsort(results, k, sizeof(FeResult), compare);
+}
+
 #if defined(_MSC_VER)
 static DWORD WINAPI _worker(LPVOID pParam)
 #else
@@ -366,7 +604,28 @@ static void* _worker(void* pParam)
         TaskItem* pTask = NULL;
         QUEUE_GET(pEngine->task_queue, TaskItem*, pTask);
 
-        if ( pTask )
+        if ( pTask && pTask->function == MATCH_JOB )
+        {
+            /* pTask belongs to the job, it must not be accessed after JOB_TASK_DONE() */
+            MatchJob* pJob = ((MatchTaskItem*)pTask)->job;
+            FeString* tasks = pJob->source + pTask->offset;
+            FeResult* results = pJob->results + pTask->offset;
+            uint32_t length = pTask->length;
+            uint64_t char_bitmap = pJob->pPattern_ctxt->char_bitmap;
+            uint32_t i = 0;
+            for ( ; i < length && !pJob->cancelled; ++i )
+            {
+                if ( char_bitmap & ~tasks[i].bitmap )
+                    results[i].weight = MIN_WEIGHT;
+                else
+                    results[i].weight = getWeight(tasks[i].str, tasks[i].len,
+                                                  pJob->pPattern_ctxt, pJob->is_name_only);
+                results[i].index = pTask->offset + i;
+            }
+
+            JOB_TASK_DONE(*pJob);
+        }
+        else if ( pTask )
         {
             switch ( pTask->function )
             {
@@ -375,11 +634,16 @@ static void* _worker(void* pParam)
                     FeString* tasks = pEngine->source + pTask->offset;
                     FeResult* results = pEngine->results + pTask->offset;
                     uint32_t length = pTask->length;
+                    uint64_t char_bitmap = pEngine->pPattern_ctxt->char_bitmap;
                     uint32_t i = 0;
                     for ( ; i < length; ++i )
                     {
-                        results[i].weight = getWeight(tasks[i].str, tasks[i].len,
-                                                      pEngine->pPattern_ctxt, pEngine->is_name_only);
+                        /* the candidate lacks some characters of the pattern */
+                        if ( char_bitmap & ~tasks[i].bitmap )
+                            results[i].weight = MIN_WEIGHT;
+                        else
+                            results[i].weight = getWeight(tasks[i].str, tasks[i].len,
+                                                          pEngine->pPattern_ctxt, pEngine->is_name_only);
                         results[i].index = pTask->offset + i;
                     }
                 }
@@ -516,6 +780,12 @@ static void* _worker(void* pParam)
                     }
                 }
                 break;
+            case TOP_K:
+                {
+                    TopKTaskItem* pTopKTask = (TopKTaskItem*)pTask;
+                    partialSort(pEngine->results + pTopKTask->offset, pTopKTask->length, pTopKTask->top_k);
+                }
+                break;
             }
 
             QUEUE_TASK_DONE(pEngine->task_queue);
@@ -545,9 +815,11 @@ FuzzyEngine* createFuzzyEngine(uint32_t cpu_count)
     pEngine->threads = NULL;
     pEngine->pPattern_ctxt = NULL;
     pEngine->source = NULL;
+    pEngine->pJob = NULL;
 
     int32_t ret = 0;
-    QUEUE_INIT(pEngine->task_queue, MAX_TASK_COUNT(cpu_count) + cpu_count + 1, ret);
+    /* the tasks of a MatchJob may be in the queue at the same time as the others */
+    QUEUE_INIT(pEngine->task_queue, (MAX_TASK_COUNT(cpu_count) << 1) + cpu_count + 1, ret);
     if ( ret != 0 )
     {
         free(pEngine);
@@ -562,6 +834,13 @@ void closeFuzzyEngine(FuzzyEngine* pEngine)
     if ( !pEngine )
         return;
 
+    if ( pEngine->pJob )
+    {
+        pEngine->pJob->cancelled = 1;
+        JOB_JOIN(*pEngine->pJob);
+        pEngine->pJob->pEngine = NULL;
+    }
+
     /**
      * pEngine->threads is NULL if fuzzyMatch() is not called,
      * or fuzzyMatch() returns before malloc for pEngine->threads.
@@ -613,6 +892,200 @@ static int32_t pyObject_ToStringAndSize(PyObject* obj, char** buffer, uint32_t*
 #endif
 }
 
+static void delCandidateStore(PyObject* obj)
+{
+    CandidateStore* pStore = (CandidateStore*)PyCapsule_GetPointer(obj, "CandidateStore");
+    if ( !pStore )
+        return;
+
+    free(pStore->buffer);
+    free(pStore->offsets);
+    free(pStore->bitmaps);
+    Py_XDECREF(pStore->items);
+    free(pStore);
+}
+
+/**
+ * createCandidateStore()
+ *
+ * return a CandidateStore object, which keeps the utf-8 bytes of the candidates in
+ * one contiguous buffer, so that they are not converted again on each call of
+ * fuzzyMatch(), fuzzyMatchEx() and fuzzyMatchPart().
+ */
+static PyObject* fuzzyEngine_createCandidateStore(PyObject* self, PyObject* args)
+{
+    CandidateStore* pStore = (CandidateStore*)malloc(sizeof(CandidateStore));
+    if ( !pStore )
+    {
+        fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+        return NULL;
+    }
+
+    pStore->size = 0;
+    pStore->capacity = 1 << 16;
+    pStore->buffer = (char*)malloc(pStore->capacity);
+    pStore->count = 0;
+    pStore->offsets_capacity = 1 << 12;
+    pStore->offsets = (size_t*)malloc(pStore->offsets_capacity * sizeof(size_t));
+    pStore->bitmaps = (uint64_t*)malloc(pStore->offsets_capacity * sizeof(uint64_t));
+    pStore->items = PyList_New(0);
+    if ( !pStore->buffer || !pStore->offsets || !pStore->bitmaps || !pStore->items )
+    {
+        free(pStore->buffer);
+        free(pStore->offsets);
+        free(pStore->bitmaps);
+        Py_XDECREF(pStore->items);
+        free(pStore);
+        fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+        return NULL;
+    }
+    pStore->offsets[0] = 0;
+
+    return PyCapsule_New(pStore, "CandidateStore", delCandidateStore);
+}
+
+/**
+ * appendCandidates(store, items)
+ *
+ * append `items`, a list of strings, to the end of `store`.
+ * return the number of candidates in `store`.
+ */
+static PyObject* fuzzyEngine_appendCandidates(PyObject* self, PyObject* args)
+{
+    PyObject* py_store = NULL;
+    PyObject* py_items = NULL;
+
+    if ( !PyArg_ParseTuple(args, "OO:appendCandidates", &py_store, &py_items) )
+        return NULL;
+
+    CandidateStore* pStore = (CandidateStore*)PyCapsule_GetPointer(py_store, "CandidateStore");
+    if ( !pStore )
+        return NULL;
+
+    if ( !PyList_Check(py_items) )
+    {
+        PyErr_SetString(PyExc_TypeError, "parameter `items` must be a list.");
+        return NULL;
+    }
+
+    uint32_t items_size = (uint32_t)PyList_Size(py_items);
+    if ( pStore->count + items_size + 1 > pStore->offsets_capacity )
+    {
+        uint32_t capacity = pStore->offsets_capacity;
+        while ( pStore->count + items_size + 1 > capacity )
+        {
+            capacity <<= 1;
+        }
+        size_t* offsets = (size_t*)realloc(pStore->offsets, capacity * sizeof(size_t));
+        if ( !offsets )
+        {
+            fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+            return NULL;
+        }
+        pStore->offsets = offsets;
+        uint64_t* bitmaps = (uint64_t*)realloc(pStore->bitmaps, capacity * sizeof(uint64_t));
+        if ( !bitmaps )
+        {
+            fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+            return NULL;
+        }
+        pStore->bitmaps = bitmaps;
+        pStore->offsets_capacity = capacity;
+    }
+
+    size_t size = pStore->size;
+    uint32_t i = 0;
+    for ( ; i < items_size; ++i )
+    {
+        char* str = NULL;
+        uint32_t len = 0;
+        if ( pyObject_ToStringAndSize(PyList_GET_ITEM(py_items, i), &str, &len) < 0 )
+        {
+            fprintf(stderr, "pyObject_ToStringAndSize error!\n");
+            return NULL;
+        }
+
+        if ( size + len > pStore->capacity )
+        {
+            size_t capacity = pStore->capacity;
+            while ( size + len > capacity )
+            {
+                capacity <<= 1;
+            }
+            char* buffer = (char*)realloc(pStore->buffer, capacity);
+            if ( !buffer )
+            {
+                fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+                return NULL;
+            }
+            pStore->buffer = buffer;
+            pStore->capacity = capacity;
+        }
+
+        memcpy(pStore->buffer + size, str, len);
+        pStore->bitmaps[pStore->count + i] = getCharBitmap(str, len);
+        size += len;
+        pStore->offsets[pStore->count + i + 1] = size;
+    }
+
+    Py_ssize_t items_count = PyList_Size(pStore->items);
+    if ( PyList_SetSlice(pStore->items, items_count, items_count, py_items) < 0 )
+        return NULL;
+
+    pStore->size = size;
+    pStore->count += items_size;
+
+    return Py_BuildValue("I", pStore->count);
+}
+
+/**
+ * `py_source` is either a list or a CandidateStore, `*py_items` is set to the list
+ * that holds the candidates, and [*begin, *end) is clamped to the size of it.
+ */
+static int32_t parseSource(PyObject* py_source, CandidateStore** pStore, PyObject** py_items,
+                           uint32_t* begin, uint32_t* end)
+{
+    if ( PyList_Check(py_source) )
+    {
+        *pStore = NULL;
+        *py_items = py_source;
+    }
+    else if ( PyCapsule_IsValid(py_source, "CandidateStore") )
+    {
+        *pStore = (CandidateStore*)PyCapsule_GetPointer(py_source, "CandidateStore");
+        *py_items = (*pStore)->items;
+    }
+    else
+    {
+        PyErr_SetString(PyExc_TypeError, "parameter `source` must be a list or a CandidateStore.");
+        return -1;
+    }
+
+    uint32_t size = (uint32_t)PyList_Size(*py_items);
+    if ( *end > size )
+        *end = size;
+    if ( *begin > *end )
+        *begin = *end;
+
+    return 0;
+}
+
+static int32_t getCandidate(CandidateStore* pStore, PyObject* py_items, uint32_t index, FeString* s)
+{
+    if ( pStore )
+    {
+        s->str = pStore->buffer + pStore->offsets[index];
+        s->len = (uint32_t)(pStore->offsets[index + 1] - pStore->offsets[index]);
+        s->bitmap = pStore->bitmaps[index];
+        return 0;
+    }
+    else
+    {
+        s->bitmap = (uint64_t)-1;
+        return pyObject_ToStringAndSize(PyList_GET_ITEM(py_items, index), &s->str, &s->len);
+    }
+}
+
 static void delFuzzyEngine(PyObject* obj)
 {
     closeFuzzyEngine((FuzzyEngine*)PyCapsule_GetPointer(obj, NULL));
@@ -686,154 +1159,114 @@ static PyObject* createWeights(void* weights)
 }
 
 /**
- * fuzzyMatch(engine, source, pattern, is_name_only=False, sort_results=True)
- *
- * `is_name_only` is optional, it defaults to `False`, which indicates using the full path matching algorithm.
- * `sort_results` is optional, it defaults to `True`, which indicates whether to sort the results.
- *
- * return a tuple, (a list of corresponding weight, a sorted list of items from `source` that match `pattern`).
+ * the context of a weights object is the number of the leading results that are sorted,
+ * NULL means all the results are sorted.
  */
-static PyObject* fuzzyEngine_fuzzyMatch(PyObject* self, PyObject* args, PyObject* kwargs)
+static PyObject* createPartialWeights(void* weights, uint32_t sorted_count)
 {
-    PyObject* py_engine = NULL;
-    PyObject* py_source = NULL;
-    PyObject* py_patternCtxt = NULL;
-    uint8_t is_name_only = 0;
-    uint8_t sort_results = 1;
-    static char* kwlist[] = {"engine", "source", "pattern", "is_name_only", "sort_results", NULL};
-
-    if ( !PyArg_ParseTupleAndKeywords(args, kwargs, "OOO|bb:fuzzyMatch", kwlist, &py_engine,
-                                      &py_source, &py_patternCtxt, &is_name_only, &sort_results) )
-        return NULL;
+    PyObject* py_weights = createWeights(weights);
+    if ( py_weights && sorted_count > 0 )
+    {
+        PyCapsule_SetContext(py_weights, (void*)(uintptr_t)sorted_count);
+    }
+    return py_weights;
+}
 
-    FuzzyEngine* pEngine = (FuzzyEngine*)PyCapsule_GetPointer(py_engine, NULL);
-    if ( !pEngine )
-        return NULL;
+static uint32_t getSortedCount(PyObject* py_weights, uint32_t size)
+{
+    void* context = PyCapsule_GetContext(py_weights);
+    return context ? (uint32_t)(uintptr_t)context : size;
+}
 
-    if ( !PyList_Check(py_source) )
+/**
+ * move the `top_k` results with the largest weight to the front of pEngine->results
+ * in descending order, the rest are left unsorted.
+ * every chunk keeps a bounded heap of its own in a worker thread, then only the
+ * winners of the chunks are merged.
+ */
+static int32_t selectTopK(FuzzyEngine* pEngine, uint32_t results_count, uint32_t top_k, uint32_t task_count)
+{
+    FeResult* results = pEngine->results;
+    uint32_t chunk_size = (results_count + task_count - 1) / task_count;
+    if ( task_count == 1 || results_count < 60000 || chunk_size <= top_k )
     {
-        PyErr_SetString(PyExc_TypeError, "parameter `source` must be a list.");
-        return NULL;
+        partialSort(results, results_count, top_k);
+        return 0;
     }
 
-    uint32_t source_size = (uint32_t)PyList_Size(py_source);
-    if ( source_size == 0 )
+    task_count = (results_count + chunk_size - 1) / chunk_size;
+
+    TopKTaskItem* top_k_tasks = (TopKTaskItem*)malloc(task_count * sizeof(TopKTaskItem));
+    if ( !top_k_tasks )
     {
-        return Py_BuildValue("([],[])");
+        fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+        return -1;
     }
 
-    pEngine->pPattern_ctxt = (PatternContext*)PyCapsule_GetPointer(py_patternCtxt, NULL);
-    if ( !pEngine->pPattern_ctxt )
-        return NULL;
+    FeResult* buffer = (FeResult*)malloc(results_count * sizeof(FeResult));
+    if ( !buffer )
+    {
+        free(top_k_tasks);
+        fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+        return -1;
+    }
 
-    pEngine->is_name_only = is_name_only;
-
-    uint32_t max_task_count  = MAX_TASK_COUNT(pEngine->cpu_count);
-    uint32_t chunk_size = (source_size + max_task_count - 1) / max_task_count;
-    uint32_t task_count = (source_size + chunk_size - 1) / chunk_size;
-    if ( chunk_size == 1 || pEngine->cpu_count == 1 )
-    {
-        chunk_size = source_size;
-        task_count = 1;
-    }
-
-    pEngine->source = (FeString*)malloc(source_size * sizeof(FeString));
-    if ( !pEngine->source )
+#if defined(_MSC_VER)
+    QUEUE_SET_TASK_COUNT(pEngine->task_queue, task_count);
+#endif
+    uint32_t i = 0;
+    for ( ; i < task_count; ++i )
     {
-        fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
-        return NULL;
+        top_k_tasks[i].function = TOP_K;
+        top_k_tasks[i].offset = i * chunk_size;
+        top_k_tasks[i].length = MIN(chunk_size, results_count - top_k_tasks[i].offset);
+        top_k_tasks[i].top_k = top_k;
+        QUEUE_PUT(pEngine->task_queue, top_k_tasks + i);
     }
 
-    TaskItem* tasks = (TaskItem*)malloc(task_count * sizeof(TaskItem));
-    if ( !tasks )
-    {
-        free(pEngine->source);
-        fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
-        return NULL;
-    }
+    QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
 
-    pEngine->results = (FeResult*)malloc(source_size * sizeof(FeResult));
-    if ( !pEngine->results )
+    /* the winners of each chunk are at the front of it */
+    uint32_t count = 0;
+    for ( i = 0; i < task_count; ++i )
     {
-        free(pEngine->source);
-        free(tasks);
-        fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
-        return NULL;
+        uint32_t length = MIN(top_k, top_k_tasks[i].length);
+        memcpy(buffer + count, results + top_k_tasks[i].offset, length * sizeof(FeResult));
+        count += length;
     }
 
-    FeResult* results = pEngine->results;
+    qsort(buffer, count, sizeof(FeResult), compare);
 
-    if ( !pEngine->threads )
+    for ( i = 0; i < task_count; ++i )
     {
-#if defined(_MSC_VER)
-        pEngine->threads = (HANDLE*)malloc(pEngine->cpu_count * sizeof(HANDLE));
-#else
-        pEngine->threads = (pthread_t*)malloc(pEngine->cpu_count * sizeof(pthread_t));
-#endif
-        if ( !pEngine->threads )
-        {
-            free(pEngine->source);
-            free(tasks);
-            free(results);
-            fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
-            return NULL;
-        }
-
-        uint32_t i = 0;
-        for ( ; i < pEngine->cpu_count; ++i)
+        if ( top_k_tasks[i].length > top_k )
         {
-#if defined(_MSC_VER)
-            pEngine->threads[i] = CreateThread(NULL, 0, _worker, pEngine, 0, NULL);
-            if ( !pEngine->threads[i] )
-#else
-            int ret = pthread_create(&pEngine->threads[i], NULL, _worker, pEngine);
-            if ( ret != 0 )
-#endif
-            {
-                free(pEngine->source);
-                free(tasks);
-                free(results);
-                free(pEngine->threads);
-                fprintf(stderr, "pthread_create error!\n");
-                return NULL;
-            }
+            uint32_t length = top_k_tasks[i].length - top_k;
+            memcpy(buffer + count, results + top_k_tasks[i].offset + top_k, length * sizeof(FeResult));
+            count += length;
         }
     }
 
-#if defined(_MSC_VER)
-    QUEUE_SET_TASK_COUNT(pEngine->task_queue, task_count);
-#endif
-
-    uint32_t i = 0;
-    for ( ; i < task_count; ++i )
-    {
-        uint32_t offset = i * chunk_size;
-        uint32_t length = MIN(chunk_size, source_size - offset);
-
-        tasks[i].function = GET_WEIGHT;
-        tasks[i].offset = offset;
-        tasks[i].length = length;
-
-        uint32_t j = 0;
-        for ( ; j < length; ++j )
-        {
-            FeString *s = pEngine->source + offset + j;
-            PyObject* item = PyList_GET_ITEM(py_source, offset + j);
-            if ( pyObject_ToStringAndSize(item, &s->str, &s->len) < 0 )
-            {
-                free(pEngine->source);
-                free(tasks);
-                free(results);
-                fprintf(stderr, "pyObject_ToStringAndSize error!\n");
-                return NULL;
-            }
-        }
+    memcpy(results, buffer, results_count * sizeof(FeResult));
 
-        QUEUE_PUT(pEngine->task_queue, tasks + i);
-    }
+    free(buffer);
+    free(top_k_tasks);
 
-    QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
+    return 0;
+}
 
+/**
+ * the common part of fuzzyMatch() and getMatchJobResult().
+ * pEngine->results holds the weights of `source_size` items computed by `task_count` tasks,
+ * drop the items that do not match, sort the rest and build the return value of fuzzyMatch().
+ * `tasks` can be reused, its length is at least `task_count`.
+ */
+static PyObject* createMatchResult(FuzzyEngine* pEngine, TaskItem* tasks, uint32_t task_count, PyObject* py_source,
+                                   uint32_t begin, uint32_t source_size, uint8_t sort_results, uint32_t top_k)
+{
+    FeResult* results = pEngine->results;
+    uint32_t chunk_size = 0;
+    uint32_t i = 0;
     uint32_t results_count = 0;
     for ( i = 0; i < source_size; ++i )
     {
@@ -847,17 +1280,32 @@ static PyObject* fuzzyEngine_fuzzyMatch(PyObject* self, PyObject* args, PyObject
         }
     }
 
+    /* make the index point to the item of `source` */
+    if ( begin > 0 )
+    {
+        for ( i = 0; i < results_count; ++i )
+        {
+            results[i].index += begin;
+        }
+    }
+
     if ( results_count == 0 )
     {
-        free(pEngine->source);
-        free(tasks);
-        free(results);
         return Py_BuildValue("([],[])");
     }
 
+    uint32_t sorted_count = 0;
     if ( sort_results )
     {
-        if ( task_count == 1 || results_count < 60000 )
+        if ( top_k > 0 && top_k < results_count )
+        {
+            if ( selectTopK(pEngine, results_count, top_k, task_count) < 0 )
+            {
+                return NULL;
+            }
+            sorted_count = top_k;
+        }
+        else if ( task_count == 1 || results_count < 60000 )
         {
             qsort(results, results_count, sizeof(FeResult), compare);
         }
@@ -872,9 +1320,6 @@ static PyObject* fuzzyEngine_fuzzyMatch(PyObject* self, PyObject* args, PyObject
             FeResult* buffer = (FeResult*)malloc(chunk_size * (task_count >> 1) * sizeof(FeResult));
             if ( !buffer )
             {
-                free(pEngine->source);
-                free(tasks);
-                free(results);
                 fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
                 return NULL;
             }
@@ -898,9 +1343,6 @@ static PyObject* fuzzyEngine_fuzzyMatch(PyObject* self, PyObject* args, PyObject
             merge_tasks = (MergeTaskItem*)malloc(task_count * sizeof(MergeTaskItem));
             if ( !merge_tasks )
             {
-                free(pEngine->source);
-                free(tasks);
-                free(results);
                 free(buffer);
                 fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
                 return NULL;
@@ -946,9 +1388,6 @@ static PyObject* fuzzyEngine_fuzzyMatch(PyObject* self, PyObject* args, PyObject
     weight_t* weights = (weight_t*)malloc(results_count * sizeof(weight_t));
     if ( !weights )
     {
-        free(pEngine->source);
-        free(tasks);
-        free(results);
         fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
         return NULL;
     }
@@ -977,9 +1416,8 @@ static PyObject* fuzzyEngine_fuzzyMatch(PyObject* self, PyObject* args, PyObject
         py_set_tasks = (PySetTaskItem*)malloc(task_count * sizeof(PySetTaskItem));
         if ( !py_set_tasks )
         {
-            free(pEngine->source);
-            free(tasks);
-            free(results);
+            free(weights);
+            Py_DECREF(text_list);
             fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
             return NULL;
         }
@@ -1006,44 +1444,47 @@ static PyObject* fuzzyEngine_fuzzyMatch(PyObject* self, PyObject* args, PyObject
         free(py_set_tasks);
     }
 
-    free(pEngine->source);
-    free(tasks);
-    free(results);
-
-    return Py_BuildValue("(NN)", createWeights(weights), text_list);
+    return Py_BuildValue("(NN)", createPartialWeights(weights, sorted_count), text_list);
 }
 
 /**
- * fuzzyMatchEx(engine, source, pattern, is_name_only=False, sort_results=True, is_and_mode=False)
+ * fuzzyMatch(engine, source, pattern, is_name_only=False, sort_results=True, begin=0, end=len(source), top_k=0)
  *
- * same as fuzzyMatch(), the only difference is the return value.
- * return a tuple, (a list of corresponding weight, a sorted list of index to items from `source` that match `pattern`).
+ * `source` is a list or a CandidateStore created by createCandidateStore().
+ * `is_name_only` is optional, it defaults to `False`, which indicates using the full path matching algorithm.
+ * `sort_results` is optional, it defaults to `True`, which indicates whether to sort the results.
+ * `begin` and `end` are optional, only the items in source[begin:end] are matched.
+ * `top_k` is optional, if it is not 0 and `sort_results` is `True`, only the first `top_k` results
+ *      are sorted, the rest can be sorted later by rankResults().
+ *
+ * return a tuple, (a list of corresponding weight, a sorted list of items from `source` that match `pattern`).
  */
-static PyObject* fuzzyEngine_fuzzyMatchEx(PyObject* self, PyObject* args, PyObject* kwargs)
+static PyObject* fuzzyEngine_fuzzyMatch(PyObject* self, PyObject* args, PyObject* kwargs)
 {
     PyObject* py_engine = NULL;
     PyObject* py_source = NULL;
     PyObject* py_patternCtxt = NULL;
     uint8_t is_name_only = 0;
     uint8_t sort_results = 1;
-    uint8_t is_and_mode = 0;
-    static char* kwlist[] = {"engine", "source", "pattern", "is_name_only", "sort_results", "is_and_mode", NULL};
-
-    if ( !PyArg_ParseTupleAndKeywords(args, kwargs, "OOO|bbb:fuzzyMatch", kwlist, &py_engine,
-                                      &py_source, &py_patternCtxt, &is_name_only, &sort_results, &is_and_mode) )
+    uint32_t begin = 0;
+    uint32_t end = (uint32_t)-1;
+    uint32_t top_k = 0;
+    static char* kwlist[] = {"engine", "source", "pattern", "is_name_only", "sort_results", "begin", "end",
+                             "top_k", NULL};
+
+    if ( !PyArg_ParseTupleAndKeywords(args, kwargs, "OOO|bbIII:fuzzyMatch", kwlist, &py_engine, &py_source,
+                                      &py_patternCtxt, &is_name_only, &sort_results, &begin, &end, &top_k) )
         return NULL;
 
     FuzzyEngine* pEngine = (FuzzyEngine*)PyCapsule_GetPointer(py_engine, NULL);
     if ( !pEngine )
         return NULL;
 
-    if ( !PyList_Check(py_source) )
-    {
-        PyErr_SetString(PyExc_TypeError, "parameter `source` must be a list.");
+    CandidateStore* pStore = NULL;
+    if ( parseSource(py_source, &pStore, &py_source, &begin, &end) < 0 )
         return NULL;
-    }
 
-    uint32_t source_size = (uint32_t)PyList_Size(py_source);
+    uint32_t source_size = end - begin;
     if ( source_size == 0 )
     {
         return Py_BuildValue("([],[])");
@@ -1145,8 +1586,7 @@ static PyObject* fuzzyEngine_fuzzyMatchEx(PyObject* self, PyObject* args, PyObje
         for ( ; j < length; ++j )
         {
             FeString *s = pEngine->source + offset + j;
-            PyObject* item = PyList_GET_ITEM(py_source, offset + j);
-            if ( pyObject_ToStringAndSize(item, &s->str, &s->len) < 0 )
+            if ( getCandidate(pStore, py_source, begin + offset + j, s) < 0 )
             {
                 free(pEngine->source);
                 free(tasks);
@@ -1161,38 +1601,216 @@ static PyObject* fuzzyEngine_fuzzyMatchEx(PyObject* self, PyObject* args, PyObje
 
     QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
 
-    uint32_t results_count = 0;
-    for ( i = 0; i < source_size; ++i )
+    PyObject* py_result = createMatchResult(pEngine, tasks, task_count, py_source, begin, source_size,
+                                            sort_results, top_k);
+
+    free(pEngine->source);
+    free(tasks);
+    free(results);
+
+    return py_result;
+}
+
+/**
+ * fuzzyMatchEx(engine, source, pattern, is_name_only=False, sort_results=True, is_and_mode=False, begin=0, end=len(source), top_k=0)
+ *
+ * same as fuzzyMatch(), the only difference is the return value.
+ * the indices are relative to `begin`, `top_k` is ignored if `is_and_mode` is `True`.
+ * return a tuple, (a list of corresponding weight, a sorted list of index to items from `source` that match `pattern`).
+ */
+static PyObject* fuzzyEngine_fuzzyMatchEx(PyObject* self, PyObject* args, PyObject* kwargs)
+{
+    PyObject* py_engine = NULL;
+    PyObject* py_source = NULL;
+    PyObject* py_patternCtxt = NULL;
+    uint8_t is_name_only = 0;
+    uint8_t sort_results = 1;
+    uint32_t begin = 0;
+    uint32_t end = (uint32_t)-1;
+    uint32_t top_k = 0;
+    uint8_t is_and_mode = 0;
+    static char* kwlist[] = {"engine", "source", "pattern", "is_name_only", "sort_results", "is_and_mode",
+                             "begin", "end", "top_k", NULL};
+
+    if ( !PyArg_ParseTupleAndKeywords(args, kwargs, "OOO|bbbIII:fuzzyMatch", kwlist, &py_engine, &py_source,
+                                      &py_patternCtxt, &is_name_only, &sort_results, &is_and_mode, &begin, &end,
+                                      &top_k) )
+        return NULL;
+
+    if ( is_and_mode )
     {
-        if ( results[i].weight > MIN_WEIGHT )
-        {
-            if ( i > results_count )
-            {
-                results[results_count] = results[i];
-            }
-            ++results_count;
-        }
+        top_k = 0;
     }
 
-    if ( results_count == 0 )
+    FuzzyEngine* pEngine = (FuzzyEngine*)PyCapsule_GetPointer(py_engine, NULL);
+    if ( !pEngine )
+        return NULL;
+
+    CandidateStore* pStore = NULL;
+    if ( parseSource(py_source, &pStore, &py_source, &begin, &end) < 0 )
+        return NULL;
+
+    uint32_t source_size = end - begin;
+    if ( source_size == 0 )
+    {
+        return Py_BuildValue("([],[])");
+    }
+
+    pEngine->pPattern_ctxt = (PatternContext*)PyCapsule_GetPointer(py_patternCtxt, NULL);
+    if ( !pEngine->pPattern_ctxt )
+        return NULL;
+
+    pEngine->is_name_only = is_name_only;
+
+    uint32_t max_task_count  = MAX_TASK_COUNT(pEngine->cpu_count);
+    uint32_t chunk_size = (source_size + max_task_count - 1) / max_task_count;
+    uint32_t task_count = (source_size + chunk_size - 1) / chunk_size;
+    if ( chunk_size == 1 || pEngine->cpu_count == 1 )
+    {
+        chunk_size = source_size;
+        task_count = 1;
+    }
+
+    pEngine->source = (FeString*)malloc(source_size * sizeof(FeString));
+    if ( !pEngine->source )
+    {
+        fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+        return NULL;
+    }
+
+    TaskItem* tasks = (TaskItem*)malloc(task_count * sizeof(TaskItem));
+    if ( !tasks )
+    {
+        free(pEngine->source);
+        fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+        return NULL;
+    }
+
+    pEngine->results = (FeResult*)malloc(source_size * sizeof(FeResult));
+    if ( !pEngine->results )
     {
         free(pEngine->source);
         free(tasks);
-        free(results);
-        return Py_BuildValue("([],[])");
+        fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+        return NULL;
     }
 
-    if ( sort_results )
+    FeResult* results = pEngine->results;
+
+    if ( !pEngine->threads )
     {
-        if ( task_count == 1 || results_count < 60000 )
+#if defined(_MSC_VER)
+        pEngine->threads = (HANDLE*)malloc(pEngine->cpu_count * sizeof(HANDLE));
+#else
+        pEngine->threads = (pthread_t*)malloc(pEngine->cpu_count * sizeof(pthread_t));
+#endif
+        if ( !pEngine->threads )
         {
-            qsort(results, results_count, sizeof(FeResult), compare);
+            free(pEngine->source);
+            free(tasks);
+            free(results);
+            fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+            return NULL;
         }
-        else
+
+        uint32_t i = 0;
+        for ( ; i < pEngine->cpu_count; ++i)
         {
-            chunk_size = (results_count + task_count - 1) / task_count;
-            if ( chunk_size < 2000 )
-            {
+#if defined(_MSC_VER)
+            pEngine->threads[i] = CreateThread(NULL, 0, _worker, pEngine, 0, NULL);
+            if ( !pEngine->threads[i] )
+#else
+            int ret = pthread_create(&pEngine->threads[i], NULL, _worker, pEngine);
+            if ( ret != 0 )
+#endif
+            {
+                free(pEngine->source);
+                free(tasks);
+                free(results);
+                free(pEngine->threads);
+                fprintf(stderr, "pthread_create error!\n");
+                return NULL;
+            }
+        }
+    }
+
+#if defined(_MSC_VER)
+    QUEUE_SET_TASK_COUNT(pEngine->task_queue, task_count);
+#endif
+
+    uint32_t i = 0;
+    for ( ; i < task_count; ++i )
+    {
+        uint32_t offset = i * chunk_size;
+        uint32_t length = MIN(chunk_size, source_size - offset);
+
+        tasks[i].function = GET_WEIGHT;
+        tasks[i].offset = offset;
+        tasks[i].length = length;
+
+        uint32_t j = 0;
+        for ( ; j < length; ++j )
+        {
+            FeString *s = pEngine->source + offset + j;
+            if ( getCandidate(pStore, py_source, begin + offset + j, s) < 0 )
+            {
+                free(pEngine->source);
+                free(tasks);
+                free(results);
+                fprintf(stderr, "pyObject_ToStringAndSize error!\n");
+                return NULL;
+            }
+        }
+
+        QUEUE_PUT(pEngine->task_queue, tasks + i);
+    }
+
+    QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
+
+    uint32_t results_count = 0;
+    for ( i = 0; i < source_size; ++i )
+    {
+        if ( results[i].weight > MIN_WEIGHT )
+        {
+            if ( i > results_count )
+            {
+                results[results_count] = results[i];
+            }
+            ++results_count;
+        }
+    }
+
+    if ( results_count == 0 )
+    {
+        free(pEngine->source);
+        free(tasks);
+        free(results);
+        return Py_BuildValue("([],[])");
+    }
+
+    uint32_t sorted_count = 0;
+    if ( sort_results )
+    {
+        if ( top_k > 0 && top_k < results_count )
+        {
+            if ( selectTopK(pEngine, results_count, top_k, task_count) < 0 )
+            {
+                free(pEngine->source);
+                free(tasks);
+                free(results);
+                return NULL;
+            }
+            sorted_count = top_k;
+        }
+        else if ( task_count == 1 || results_count < 60000 )
+        {
+            qsort(results, results_count, sizeof(FeResult), compare);
+        }
+        else
+        {
+            chunk_size = (results_count + task_count - 1) / task_count;
+            if ( chunk_size < 2000 )
+            {
                 chunk_size = (results_count + (task_count >> 1) - 1) / (task_count >> 1);
             }
             task_count = (results_count + chunk_size - 1) / chunk_size;
@@ -1312,13 +1930,14 @@ static PyObject* fuzzyEngine_fuzzyMatchEx(PyObject* self, PyObject* args, PyObje
         free(tasks);
         free(results);
 
-        return Py_BuildValue("(NN)", createWeights(weights), index_list);
+        return Py_BuildValue("(NN)", createPartialWeights(weights, sorted_count), index_list);
     }
 }
 
 /**
  * merge(tuple_a, tuple_b)
  * tuple_a, tuple_b are the return value of fuzzyEngine_fuzzyMatch
+ * if only the leading results of tuple_a or tuple_b are sorted, so are the merged results.
  */
 static PyObject* fuzzyEngine_merge(PyObject* self, PyObject* args)
 {
@@ -1353,17 +1972,20 @@ static PyObject* fuzzyEngine_merge(PyObject* self, PyObject* args)
     uint32_t j = 0;
 
     weight_t* weights_a = (weight_t*)PyCapsule_GetPointer(weight_list_a, NULL);
-    weight_t w_a = weights_a[i];
     weight_t* weights_b = (weight_t*)PyCapsule_GetPointer(weight_list_b, NULL);
+    /* only the leading results are sorted if `top_k` is specified */
+    uint32_t sorted_a = getSortedCount(weight_list_a, size_a);
+    uint32_t sorted_b = getSortedCount(weight_list_b, size_b);
+    weight_t w_a = weights_a[i];
     weight_t w_b = weights_b[j];
-    while ( i < size_a && j < size_b )
+    while ( i < sorted_a && j < sorted_b )
     {
         if ( w_a > w_b )
         {
             weights[i + j] = weights_a[i];
             PyList_SET_ITEM(text_list, i + j, PySequence_ITEM(text_list_a, i));
             ++i;
-            if ( i < size_a )
+            if ( i < sorted_a )
             {
                 w_a = weights_a[i];
             }
@@ -1373,26 +1995,142 @@ static PyObject* fuzzyEngine_merge(PyObject* self, PyObject* args)
             weights[i + j] = weights_b[j];
             PyList_SET_ITEM(text_list, i + j, PySequence_ITEM(text_list_b, j));
             ++j;
-            if ( j < size_b )
+            if ( j < sorted_b )
             {
                 w_b = weights_b[j];
             }
         }
     }
-    while ( i < size_a )
+    while ( i < sorted_a )
     {
         weights[i + j] = weights_a[i];
         PyList_SET_ITEM(text_list, i + j, PySequence_ITEM(text_list_a, i));
         ++i;
     }
-    while ( j < size_b )
+    while ( j < sorted_b )
     {
         weights[i + j] = weights_b[j];
         PyList_SET_ITEM(text_list, i + j, PySequence_ITEM(text_list_b, j));
         ++j;
     }
-    return Py_BuildValue("(NN)", createWeights(weights), text_list);
+
+    uint32_t sorted_count = 0;
+    if ( sorted_a < size_a || sorted_b < size_b )
+    {
+        /**
+         * the unsorted results are not greater than the last sorted one of the same list,
+         * so the merged results are in order only down to the larger of the two.
+         */
+        weight_t threshold = sorted_a < size_a ? weights_a[sorted_a - 1] : weights_b[sorted_b - 1];
+        if ( sorted_b < size_b && weights_b[sorted_b - 1] > threshold )
+        {
+            threshold = weights_b[sorted_b - 1];
+        }
+
+        while ( sorted_count < i + j && weights[sorted_count] >= threshold )
+        {
+            ++sorted_count;
+        }
+
+        while ( i < size_a )
+        {
+            weights[i + j] = weights_a[i];
+            PyList_SET_ITEM(text_list, i + j, PySequence_ITEM(text_list_a, i));
+            ++i;
+        }
+        while ( j < size_b )
+        {
+            weights[i + j] = weights_b[j];
+            PyList_SET_ITEM(text_list, i + j, PySequence_ITEM(text_list_b, j));
+            ++j;
+        }
+    }
+
+    return Py_BuildValue("(NN)", createPartialWeights(weights, sorted_count), text_list);
 }
+/**
+ * rankResults(result, count)
+ *
+ * `result` is the return value of fuzzyMatch(), fuzzyMatchPart() or merge(), only the leading
+ * results of which may be sorted if `top_k` is specified.
+ * sort `result` in place, so that at least the first `count` results are sorted.
+ */
+static PyObject* fuzzyEngine_rankResults(PyObject* self, PyObject* args)
+{
+    PyObject* py_weights = NULL;
+    PyObject* text_list = NULL;
+    uint32_t count = 0;
+    if ( !PyArg_ParseTuple(args, "(OO)I:rankResults", &py_weights, &text_list, &count) )
+        return NULL;
+
+    uint32_t size = (uint32_t)PyList_Size(text_list);
+    uint32_t sorted_count = getSortedCount(py_weights, size);
+    if ( count > size )
+    {
+        count = size;
+    }
+
+    if ( count <= sorted_count )
+    {
+        Py_RETURN_NONE;
+    }
+
+    weight_t* weights = (weight_t*)PyCapsule_GetPointer(py_weights, NULL);
+    if ( !weights )
+        return NULL;
+
+    uint32_t rest_size = size - sorted_count;
+    FeResult* rest = (FeResult*)malloc(rest_size * sizeof(FeResult));
+    if ( !rest )
+    {
+        fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+        return NULL;
+    }
+
+    PyObject** items = (PyObject**)malloc(rest_size * sizeof(PyObject*));
+    if ( !items )
+    {
+        free(rest);
+        fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+        return NULL;
+    }
+
+    uint32_t i = 0;
+    for ( ; i < rest_size; ++i )
+    {
+        rest[i].weight = weights[sorted_count + i];
+        rest[i].index = i;
+        items[i] = PyList_GET_ITEM(text_list, sorted_count + i);
+    }
+
+    uint32_t k = count - sorted_count;
+    /* sort all of them if most of them are needed */
+    if ( k >= (rest_size >> 1) )
+    {
+        qsort(rest, rest_size, sizeof(FeResult), compare);
+        k = rest_size;
+    }
+    else
+    {
+        partialSort(rest, rest_size, k);
+    }
+
+    for ( i = 0; i < rest_size; ++i )
+    {
+        weights[sorted_count + i] = rest[i].weight;
+        /* it is a permutation, so the reference counts need not be changed */
+        PyList_SET_ITEM(text_list, sorted_count + i, items[rest[i].index]);
+    }
+
+    sorted_count += k;
+    PyCapsule_SetContext(py_weights, sorted_count < size ? (void*)(uintptr_t)sorted_count : NULL);
+
+    free(rest);
+    free(items);
+
+    Py_RETURN_NONE;
+}
+
 /**
  * getHighlights(engine, source, pattern, is_name_only=False)
  *
@@ -1531,12 +2269,13 @@ static PyObject* fuzzyEngine_getHighlights(PyObject* self, PyObject* args, PyObj
 }
 
 /**
- * guessMatch(engine, source, filename, suffix, dirname, icon, sort_results=True)
+ * guessMatch(engine, source, filename, suffix, dirname, icon, sort_results=True, begin=0, end=len(source))
  *
  * e.g., /usr/src/example.tar.gz
  * `filename` is "example.tar"
  * `suffix` is ".gz"
  * `dirname` is "/usr/src"
+ * `source`, `begin` and `end` are the same as those of fuzzyMatch().
  *
  * return a tuple, (a list of corresponding weight, a sorted list of items from `source` that match `pattern`).
  */
@@ -1549,23 +2288,24 @@ static PyObject* fuzzyEngine_guessMatch(PyObject* self, PyObject* args, PyObject
     const char* dirname = NULL;
     PyObject* py_icon = NULL;
     uint8_t sort_results = 1;
-    static char* kwlist[] = {"engine", "source", "filename", "suffix", "dirname", "icon", "sort_results", NULL};
+    uint32_t begin = 0;
+    uint32_t end = (uint32_t)-1;
+    static char* kwlist[] = {"engine", "source", "filename", "suffix", "dirname", "icon", "sort_results",
+                             "begin", "end", NULL};
 
-    if ( !PyArg_ParseTupleAndKeywords(args, kwargs, "OOsssO|b:guessMatch", kwlist, &py_engine,
-                                      &py_source, &filename, &suffix, &dirname, &py_icon, &sort_results) )
+    if ( !PyArg_ParseTupleAndKeywords(args, kwargs, "OOsssO|bII:guessMatch", kwlist, &py_engine, &py_source,
+                                      &filename, &suffix, &dirname, &py_icon, &sort_results, &begin, &end) )
         return NULL;
 
     FuzzyEngine* pEngine = (FuzzyEngine*)PyCapsule_GetPointer(py_engine, NULL);
     if ( !pEngine )
         return NULL;
 
-    if ( !PyList_Check(py_source) )
-    {
-        PyErr_SetString(PyExc_TypeError, "parameter `source` must be a list.");
+    CandidateStore* pStore = NULL;
+    if ( parseSource(py_source, &pStore, &py_source, &begin, &end) < 0 )
         return NULL;
-    }
 
-    uint32_t source_size = (uint32_t)PyList_Size(py_source);
+    uint32_t source_size = end - begin;
     if ( source_size == 0 )
     {
         return Py_BuildValue("([],[])");
@@ -1676,8 +2416,7 @@ static PyObject* fuzzyEngine_guessMatch(PyObject* self, PyObject* args, PyObject
         for ( ; j < length; ++j )
         {
             FeString *s = pEngine->source + offset + j;
-            PyObject* item = PyList_GET_ITEM(py_source, offset + j);
-            if ( pyObject_ToStringAndSize(item, &s->str, &s->len) < 0 )
+            if ( getCandidate(pStore, py_source, begin + offset + j, s) < 0 )
             {
                 free(pEngine->source);
                 free(tasks);
@@ -1698,6 +2437,15 @@ static PyObject* fuzzyEngine_guessMatch(PyObject* self, PyObject* args, PyObject
 
     QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
 
+    /* make the index point to the item of `source` */
+    if ( begin > 0 )
+    {
+        for ( i = 0; i < source_size; ++i )
+        {
+            results[i].index += begin;
+        }
+    }
+
     if ( sort_results )
     {
         if ( task_count == 1 || source_size < 60000 )
@@ -2144,10 +2892,53 @@ static void gitdiff_getDigest(char** str, uint32_t* length, Parameter* param)
 }
 
 /**
- * fuzzyMatchPart(engine, source, pattern, category, param, is_name_only=False, sort_results=True)
+ * make `s` point to the part of the candidate that is matched for `category`.
+ */
+static int32_t getDigest(FeString* s, uint32_t category, PyObject* py_param)
+{
+    switch ( category )
+    {
+    case Category_Rg:
+    {
+        RgParameter* param = (RgParameter*)PyCapsule_GetPointer(py_param, NULL);
+        if ( !param )
+            return -1;
+        rg_getDigest(&s->str, &s->len, param);
+        break;
+    }
+    case Category_Tag:
+        tag_getDigest(&s->str, &s->len, (Parameter*)PyCapsule_GetPointer(py_param, NULL));
+        break;
+    case Category_File:
+        file_getDigest(&s->str, &s->len, (Parameter*)PyCapsule_GetPointer(py_param, NULL));
+        break;
+    case Category_Gtags:
+    {
+        GtagsParameter* param = (GtagsParameter*)PyCapsule_GetPointer(py_param, NULL);
+        if ( !param )
+            return -1;
+        gtags_getDigest(&s->str, &s->len, param);
+        break;
+    }
+    case Category_Line:
+        line_getDigest(&s->str, &s->len, (Parameter*)PyCapsule_GetPointer(py_param, NULL));
+        break;
+    case Category_GitDiff:
+        gitdiff_getDigest(&s->str, &s->len, (Parameter*)PyCapsule_GetPointer(py_param, NULL));
+        break;
+    }
+
+    return 0;
+}
+
+/**
+ * fuzzyMatchPart(engine, source, pattern, category, param, is_name_only=False, sort_results=True, begin=0, end=len(source), top_k=0)
  *
+ * `source` is a list or a CandidateStore created by createCandidateStore().
  * `is_name_only` is optional, it defaults to `False`, which indicates using the full path matching algorithm.
  * `sort_results` is optional, it defaults to `True`, which indicates whether to sort the results.
+ * `begin` and `end` are optional, only the items in source[begin:end] are matched.
+ * `top_k` is the same as that of fuzzyMatch().
  *
  * return a tuple, (a list of corresponding weight, a sorted list of items from `source` that match `pattern`).
  */
@@ -2160,23 +2951,26 @@ static PyObject* fuzzyEngine_fuzzyMatchPart(PyObject* self, PyObject* args, PyOb
     uint32_t category;
     uint8_t is_name_only = 0;
     uint8_t sort_results = 1;
-    static char* kwlist[] = {"engine", "source", "pattern", "category", "param", "is_name_only", "sort_results", NULL};
-
-    if ( !PyArg_ParseTupleAndKeywords(args, kwargs, "OOOIO|bb:fuzzyMatch", kwlist, &py_engine, &py_source,
-                                      &py_patternCtxt, &category, &py_param, &is_name_only, &sort_results) )
+    uint32_t begin = 0;
+    uint32_t end = (uint32_t)-1;
+    uint32_t top_k = 0;
+    static char* kwlist[] = {"engine", "source", "pattern", "category", "param", "is_name_only", "sort_results",
+                             "begin", "end", "top_k", NULL};
+
+    if ( !PyArg_ParseTupleAndKeywords(args, kwargs, "OOOIO|bbIII:fuzzyMatch", kwlist, &py_engine, &py_source,
+                                      &py_patternCtxt, &category, &py_param, &is_name_only, &sort_results,
+                                      &begin, &end, &top_k) )
         return NULL;
 
     FuzzyEngine* pEngine = (FuzzyEngine*)PyCapsule_GetPointer(py_engine, NULL);
     if ( !pEngine )
         return NULL;
 
-    if ( !PyList_Check(py_source) )
-    {
-        PyErr_SetString(PyExc_TypeError, "parameter `source` must be a list.");
+    CandidateStore* pStore = NULL;
+    if ( parseSource(py_source, &pStore, &py_source, &begin, &end) < 0 )
         return NULL;
-    }
 
-    uint32_t source_size = (uint32_t)PyList_Size(py_source);
+    uint32_t source_size = end - begin;
     if ( source_size == 0 )
     {
         return Py_BuildValue("([],[])");
@@ -2278,8 +3072,7 @@ static PyObject* fuzzyEngine_fuzzyMatchPart(PyObject* self, PyObject* args, PyOb
         for ( ; j < length; ++j )
         {
             FeString *s = pEngine->source + offset + j;
-            PyObject* item = PyList_GET_ITEM(py_source, offset + j);
-            if ( pyObject_ToStringAndSize(item, &s->str, &s->len) < 0 )
+            if ( getCandidate(pStore, py_source, begin + offset + j, s) < 0 )
             {
                 free(pEngine->source);
                 free(tasks);
@@ -2288,48 +3081,13 @@ static PyObject* fuzzyEngine_fuzzyMatchPart(PyObject* self, PyObject* args, PyOb
                 return NULL;
             }
 
-            switch ( category )
+            if ( getDigest(s, category, py_param) < 0 )
             {
-            case Category_Rg:
-            {
-                RgParameter* param = (RgParameter*)PyCapsule_GetPointer(py_param, NULL);
-                if ( !param )
-                {
-                    free(pEngine->source);
-                    free(tasks);
-                    free(results);
-                    fprintf(stderr, "PyCapsule_GetPointer error!\n");
-                    return NULL;
-                }
-                rg_getDigest(&s->str, &s->len, param);
-                break;
-            }
-            case Category_Tag:
-                tag_getDigest(&s->str, &s->len, (Parameter*)PyCapsule_GetPointer(py_param, NULL));
-                break;
-            case Category_File:
-                file_getDigest(&s->str, &s->len, (Parameter*)PyCapsule_GetPointer(py_param, NULL));
-                break;
-            case Category_Gtags:
-            {
-                GtagsParameter* param = (GtagsParameter*)PyCapsule_GetPointer(py_param, NULL);
-                if ( !param )
-                {
-                    free(pEngine->source);
-                    free(tasks);
-                    free(results);
-                    fprintf(stderr, "PyCapsule_GetPointer error!\n");
-                    return NULL;
-                }
-                gtags_getDigest(&s->str, &s->len, param);
-                break;
-            }
-            case Category_Line:
-                line_getDigest(&s->str, &s->len, (Parameter*)PyCapsule_GetPointer(py_param, NULL));
-                break;
-            case Category_GitDiff:
-                gitdiff_getDigest(&s->str, &s->len, (Parameter*)PyCapsule_GetPointer(py_param, NULL));
-                break;
+                free(pEngine->source);
+                free(tasks);
+                free(results);
+                fprintf(stderr, "PyCapsule_GetPointer error!\n");
+                return NULL;
             }
         }
 
@@ -2338,183 +3096,375 @@ static PyObject* fuzzyEngine_fuzzyMatchPart(PyObject* self, PyObject* args, PyOb
 
     QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
 
-    uint32_t results_count = 0;
-    for ( i = 0; i < source_size; ++i )
+    PyObject* py_result = createMatchResult(pEngine, tasks, task_count, py_source, begin, source_size,
+                                            sort_results, top_k);
+
+    free(pEngine->source);
+    free(tasks);
+    free(results);
+
+    return py_result;
+}
+
+static void delMatchJob(PyObject* obj)
+{
+    MatchJob* pJob = (MatchJob*)PyCapsule_GetPointer(obj, "MatchJob");
+    if ( !pJob )
+        return;
+
+    /* the worker threads must not touch pJob any more */
+    pJob->cancelled = 1;
+    JOB_JOIN(*pJob);
+    if ( pJob->pEngine && pJob->pEngine->pJob == pJob )
     {
-        if ( results[i].weight > MIN_WEIGHT )
-        {
-            if ( i > results_count )
-            {
-                results[results_count] = results[i];
-            }
-            ++results_count;
-        }
+        pJob->pEngine->pJob = NULL;
     }
 
-    if ( results_count == 0 )
+    JOB_DESTROY(*pJob);
+    free(pJob->buffer);
+    free(pJob->source);
+    free(pJob->results);
+    free(pJob->tasks);
+    Py_XDECREF(pJob->py_pattern);
+    Py_XDECREF(pJob->py_items);
+    Py_XDECREF(pJob->py_result);
+    free(pJob);
+}
+
+static void cancelMatchJob(MatchJob* pJob)
+{
+    pJob->cancelled = 1;
+    /* a task stops as soon as it sees `cancelled`, so this does not take long */
+    Py_BEGIN_ALLOW_THREADS
+    JOB_JOIN(*pJob);
+    Py_END_ALLOW_THREADS
+}
+
+/**
+ * fuzzyMatchAsync(engine, source, pattern, is_name_only=False, sort_results=True, begin=0, end=len(source), top_k=0,
+ *                 category=None, param=None)
+ *
+ * same as fuzzyMatch(), or fuzzyMatchPart() if `category` and `param` are given,
+ * but return a MatchJob object immediately, the matching is done by the worker threads
+ * without holding the GIL.
+ * only one job of an engine runs at a time, the previous one is cancelled.
+ * use pollMatchJob(), cancelMatchJob() and getMatchJobResult() to handle the job.
+ */
+static PyObject* fuzzyEngine_fuzzyMatchAsync(PyObject* self, PyObject* args, PyObject* kwargs)
+{
+    PyObject* py_engine = NULL;
+    PyObject* py_source = NULL;
+    PyObject* py_patternCtxt = NULL;
+    uint8_t is_name_only = 0;
+    uint8_t sort_results = 1;
+    uint32_t begin = 0;
+    uint32_t end = (uint32_t)-1;
+    uint32_t top_k = 0;
+    PyObject* py_category = Py_None;
+    PyObject* py_param = NULL;
+    static char* kwlist[] = {"engine", "source", "pattern", "is_name_only", "sort_results", "begin", "end",
+                             "top_k", "category", "param", NULL};
+
+    if ( !PyArg_ParseTupleAndKeywords(args, kwargs, "OOO|bbIIIOO:fuzzyMatchAsync", kwlist, &py_engine, &py_source,
+                                      &py_patternCtxt, &is_name_only, &sort_results, &begin, &end, &top_k,
+                                      &py_category, &py_param) )
+        return NULL;
+
+    /* the candidates are matched as a whole if category is None */
+    uint32_t category = 0;
+    if ( py_category != Py_None )
     {
-        free(pEngine->source);
-        free(tasks);
-        free(results);
-        return Py_BuildValue("([],[])");
+        category = (uint32_t)PyLong_AsUnsignedLong(py_category);
+        if ( PyErr_Occurred() )
+            return NULL;
     }
 
-    if ( sort_results )
-    {
-        if ( task_count == 1 || results_count < 60000 )
-        {
-            qsort(results, results_count, sizeof(FeResult), compare);
-        }
-        else
-        {
-            chunk_size = (results_count + task_count - 1) / task_count;
-            if ( chunk_size < 2000 )
-            {
-                chunk_size = (results_count + (task_count >> 1) - 1) / (task_count >> 1);
-            }
-            task_count = (results_count + chunk_size - 1) / chunk_size;
-            FeResult* buffer = (FeResult*)malloc(chunk_size * (task_count >> 1) * sizeof(FeResult));
-            if ( !buffer )
-            {
-                free(pEngine->source);
-                free(tasks);
-                free(results);
-                fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
-                return NULL;
-            }
-#if defined(_MSC_VER)
-            QUEUE_SET_TASK_COUNT(pEngine->task_queue, task_count);
-#endif
-            for ( i = 0; i < task_count; ++i )
-            {
-                uint32_t offset = i * chunk_size;
-                uint32_t length = MIN(chunk_size, results_count - offset);
+    FuzzyEngine* pEngine = (FuzzyEngine*)PyCapsule_GetPointer(py_engine, NULL);
+    if ( !pEngine )
+        return NULL;
 
-                tasks[i].function = Q_SORT;
-                tasks[i].offset = offset;
-                tasks[i].length = length;
-                QUEUE_PUT(pEngine->task_queue, tasks + i);
-            }
+    CandidateStore* pStore = NULL;
+    PyObject* py_items = NULL;
+    if ( parseSource(py_source, &pStore, &py_items, &begin, &end) < 0 )
+        return NULL;
 
-            QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
+    PatternContext* pPattern_ctxt = (PatternContext*)PyCapsule_GetPointer(py_patternCtxt, NULL);
+    if ( !pPattern_ctxt )
+        return NULL;
 
-            MergeTaskItem* merge_tasks = NULL;
-            merge_tasks = (MergeTaskItem*)malloc(task_count * sizeof(MergeTaskItem));
-            if ( !merge_tasks )
-            {
-                free(pEngine->source);
-                free(tasks);
-                free(results);
-                free(buffer);
-                fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
-                return NULL;
-            }
+    if ( pEngine->pJob )
+    {
+        cancelMatchJob(pEngine->pJob);
+        pEngine->pJob->pEngine = NULL;
+        pEngine->pJob = NULL;
+    }
 
-            while ( chunk_size < results_count )
-            {
-                uint32_t q = results_count / (chunk_size << 1);
-                uint32_t r = results_count % (chunk_size << 1);
-#if defined(_MSC_VER)
-                QUEUE_SET_TASK_COUNT(pEngine->task_queue, q + r/chunk_size);
-#endif
-                for ( i = 0; i < q; ++i )
-                {
-                    merge_tasks[i].function = MERGE;
-                    merge_tasks[i].offset_1 = i * (chunk_size << 1);
-                    merge_tasks[i].length_1 = chunk_size;
-                    merge_tasks[i].length_2 = chunk_size;
-                    merge_tasks[i].buffer = buffer + (merge_tasks[i].offset_1 >> 1); /* buffer + i * chunk_size */
-                    QUEUE_PUT(pEngine->task_queue, merge_tasks + i);
-                }
+    MatchJob* pJob = (MatchJob*)calloc(1, sizeof(MatchJob));
+    if ( !pJob )
+    {
+        fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+        return NULL;
+    }
 
-                if ( r > chunk_size )
-                {
-                    merge_tasks[i].function = MERGE;
-                    merge_tasks[i].offset_1 = i * (chunk_size << 1);
-                    merge_tasks[i].length_1 = chunk_size;
-                    merge_tasks[i].length_2 = r - chunk_size;
-                    merge_tasks[i].buffer = buffer + (merge_tasks[i].offset_1 >> 1); /* buffer + i * chunk_size */
-                    QUEUE_PUT(pEngine->task_queue, merge_tasks + i);
-                }
+    uint32_t source_size = end - begin;
+    uint32_t task_count = 0;
+    uint32_t chunk_size = 0;
+    if ( source_size > 0 )
+    {
+        uint32_t max_task_count  = MAX_TASK_COUNT(pEngine->cpu_count);
+        chunk_size = (source_size + max_task_count - 1) / max_task_count;
+        task_count = (source_size + chunk_size - 1) / chunk_size;
+        if ( chunk_size == 1 || pEngine->cpu_count == 1 )
+        {
+            chunk_size = source_size;
+            task_count = 1;
+        }
+    }
 
-                QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
+    int32_t ret = 0;
+    JOB_INIT(*pJob, task_count, ret);
+    if ( ret != 0 )
+    {
+        free(pJob);
+        return NULL;
+    }
 
-                chunk_size <<= 1;
-            }
+    pJob->pEngine = pEngine;
+    pJob->pPattern_ctxt = pPattern_ctxt;
+    pJob->is_name_only = is_name_only;
+    pJob->sort_results = sort_results;
+    pJob->top_k = top_k;
+    pJob->source_size = source_size;
+    pJob->task_count = task_count;
+    Py_INCREF(py_patternCtxt);
+    pJob->py_pattern = py_patternCtxt;
 
-            free(buffer);
-            free(merge_tasks);
-        }
+    PyObject* py_job = PyCapsule_New(pJob, "MatchJob", delMatchJob);
+    if ( !py_job )
+    {
+        JOB_DESTROY(*pJob);
+        Py_DECREF(py_patternCtxt);
+        free(pJob);
+        return NULL;
     }
 
-    weight_t* weights = (weight_t*)malloc(results_count * sizeof(weight_t));
-    if ( !weights )
+    /* from now on, pJob is freed by delMatchJob() */
+    pJob->py_items = PyList_GetSlice(py_items, begin, end);
+    if ( !pJob->py_items )
     {
-        free(pEngine->source);
-        free(tasks);
-        free(results);
+        pJob->unfinished_tasks = 0;
+        Py_DECREF(py_job);
+        return NULL;
+    }
+
+    if ( source_size == 0 )
+    {
+        pEngine->pJob = pJob;
+        return py_job;
+    }
+
+    pJob->source = (FeString*)malloc(source_size * sizeof(FeString));
+    pJob->results = (FeResult*)malloc(source_size * sizeof(FeResult));
+    pJob->tasks = (MatchTaskItem*)malloc(task_count * sizeof(MatchTaskItem));
+    if ( pStore )
+    {
+        size_t size = pStore->offsets[end] - pStore->offsets[begin];
+        pJob->buffer = (char*)malloc(size > 0 ? size : 1);
+    }
+    if ( !pJob->source || !pJob->results || !pJob->tasks || (pStore && !pJob->buffer) )
+    {
+        pJob->unfinished_tasks = 0;
+        Py_DECREF(py_job);
         fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
         return NULL;
     }
 
-    PyObject* text_list = PyList_New(results_count);
-    if ( task_count == 1 || results_count < 40000 )
+    uint32_t i = 0;
+    if ( pStore )
     {
-        for ( i = 0; i < results_count; ++i )
+        size_t base = pStore->offsets[begin];
+        memcpy(pJob->buffer, pStore->buffer + base, pStore->offsets[end] - base);
+        for ( i = 0; i < source_size; ++i )
         {
-            weights[i] = results[i].weight;
-            /* PyList_SET_ITEM() steals a reference to item.     */
-            /* PySequence_ITEM() return value: New reference. */
-            PyList_SET_ITEM(text_list, i, PySequence_ITEM(py_source, results[i].index));
+            pJob->source[i].str = pJob->buffer + (pStore->offsets[begin + i] - base);
+            pJob->source[i].len = (uint32_t)(pStore->offsets[begin + i + 1] - pStore->offsets[begin + i]);
+            pJob->source[i].bitmap = pStore->bitmaps[begin + i];
         }
     }
     else
     {
-        chunk_size = (results_count + task_count - 1) / task_count;
-        if ( chunk_size < 8000 )
+        for ( i = 0; i < source_size; ++i )
         {
-            chunk_size = (results_count + (task_count >> 1) - 1) / (task_count >> 1);
+            if ( getCandidate(NULL, pJob->py_items, i, pJob->source + i) < 0 )
+            {
+                pJob->unfinished_tasks = 0;
+                Py_DECREF(py_job);
+                fprintf(stderr, "pyObject_ToStringAndSize error!\n");
+                return NULL;
+            }
         }
-        task_count = (results_count + chunk_size - 1) / chunk_size;
+    }
 
-        PySetTaskItem* py_set_tasks = NULL;
-        py_set_tasks = (PySetTaskItem*)malloc(task_count * sizeof(PySetTaskItem));
-        if ( !py_set_tasks )
+    if ( py_category != Py_None )
+    {
+        for ( i = 0; i < source_size; ++i )
         {
-            free(pEngine->source);
-            free(tasks);
-            free(results);
+            if ( getDigest(pJob->source + i, category, py_param) < 0 )
+            {
+                pJob->unfinished_tasks = 0;
+                Py_DECREF(py_job);
+                fprintf(stderr, "PyCapsule_GetPointer error!\n");
+                return NULL;
+            }
+        }
+    }
+
+    if ( !pEngine->threads )
+    {
+#if defined(_MSC_VER)
+        pEngine->threads = (HANDLE*)malloc(pEngine->cpu_count * sizeof(HANDLE));
+#else
+        pEngine->threads = (pthread_t*)malloc(pEngine->cpu_count * sizeof(pthread_t));
+#endif
+        if ( !pEngine->threads )
+        {
+            pJob->unfinished_tasks = 0;
+            Py_DECREF(py_job);
             fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
             return NULL;
         }
 
+        for ( i = 0; i < pEngine->cpu_count; ++i)
+        {
 #if defined(_MSC_VER)
-        QUEUE_SET_TASK_COUNT(pEngine->task_queue, task_count);
+            pEngine->threads[i] = CreateThread(NULL, 0, _worker, pEngine, 0, NULL);
+            if ( !pEngine->threads[i] )
+#else
+            int ret = pthread_create(&pEngine->threads[i], NULL, _worker, pEngine);
+            if ( ret != 0 )
 #endif
-        for ( i = 0; i < task_count; ++i )
+            {
+                pJob->unfinished_tasks = 0;
+                Py_DECREF(py_job);
+                free(pEngine->threads);
+                pEngine->threads = NULL;
+                fprintf(stderr, "pthread_create error!\n");
+                return NULL;
+            }
+        }
+    }
+
+    for ( i = 0; i < task_count; ++i )
+    {
+        uint32_t offset = i * chunk_size;
+        pJob->tasks[i].function = MATCH_JOB;
+        pJob->tasks[i].offset = offset;
+        pJob->tasks[i].length = MIN(chunk_size, source_size - offset);
+        pJob->tasks[i].job = pJob;
+        QUEUE_PUT_DETACHED(pEngine->task_queue, pJob->tasks + i);
+    }
+
+    pEngine->pJob = pJob;
+
+    return py_job;
+}
+
+/**
+ * pollMatchJob(job)
+ *
+ * return `True` if the worker threads have done with `job`, otherwise return `False`.
+ */
+static PyObject* fuzzyEngine_pollMatchJob(PyObject* self, PyObject* args)
+{
+    PyObject* py_job = NULL;
+    if ( !PyArg_ParseTuple(args, "O:pollMatchJob", &py_job) )
+        return NULL;
+
+    MatchJob* pJob = (MatchJob*)PyCapsule_GetPointer(py_job, "MatchJob");
+    if ( !pJob )
+        return NULL;
+
+    int done = 0;
+    JOB_IS_DONE(*pJob, done);
+
+    return PyBool_FromLong(done);
+}
+
+/**
+ * cancelMatchJob(job)
+ *
+ * stop `job` as soon as possible, it returns after the worker threads have left `job`.
+ */
+static PyObject* fuzzyEngine_cancelMatchJob(PyObject* self, PyObject* args)
+{
+    PyObject* py_job = NULL;
+    if ( !PyArg_ParseTuple(args, "O:cancelMatchJob", &py_job) )
+        return NULL;
+
+    MatchJob* pJob = (MatchJob*)PyCapsule_GetPointer(py_job, "MatchJob");
+    if ( !pJob )
+        return NULL;
+
+    cancelMatchJob(pJob);
+
+    Py_RETURN_NONE;
+}
+
+/**
+ * getMatchJobResult(job)
+ *
+ * wait until `job` is finished, the GIL is released while waiting.
+ * return the same value as fuzzyMatch(), the indices are relative to `begin`.
+ * return None if `job` is cancelled.
+ */
+static PyObject* fuzzyEngine_getMatchJobResult(PyObject* self, PyObject* args)
+{
+    PyObject* py_job = NULL;
+    if ( !PyArg_ParseTuple(args, "O:getMatchJobResult", &py_job) )
+        return NULL;
+
+    MatchJob* pJob = (MatchJob*)PyCapsule_GetPointer(py_job, "MatchJob");
+    if ( !pJob )
+        return NULL;
+
+    Py_BEGIN_ALLOW_THREADS
+    JOB_JOIN(*pJob);
+    Py_END_ALLOW_THREADS
+
+    if ( !pJob->py_result )
+    {
+        /* pEngine is NULL if the engine is closed */
+        if ( pJob->cancelled || !pJob->pEngine )
         {
-            uint32_t offset = i * chunk_size;
-            uint32_t length = MIN(chunk_size, results_count - offset);
+            Py_RETURN_NONE;
+        }
 
-            py_set_tasks[i].function = PY_SET_ITEM;
-            py_set_tasks[i].offset = offset;
-            py_set_tasks[i].length = length;
-            py_set_tasks[i].weights = weights;
-            py_set_tasks[i].text_list = text_list;
-            py_set_tasks[i].py_source = py_source;
-            QUEUE_PUT(pEngine->task_queue, py_set_tasks + i);
+        if ( pJob->source_size == 0 )
+        {
+            pJob->py_result = Py_BuildValue("([],[])");
         }
+        else
+        {
+            TaskItem* tasks = (TaskItem*)malloc(pJob->task_count * sizeof(TaskItem));
+            if ( !tasks )
+            {
+                fprintf(stderr, "Out of memory at %s:%d\n", __FILE__, __LINE__);
+                return NULL;
+            }
 
-        QUEUE_JOIN(pEngine->task_queue);    /* blocks until all tasks have finished */
+            FuzzyEngine* pEngine = pJob->pEngine;
+            pEngine->results = pJob->results;
+            pJob->py_result = createMatchResult(pEngine, tasks, pJob->task_count, pJob->py_items, 0,
+                                                pJob->source_size, pJob->sort_results, pJob->top_k);
+            free(tasks);
+        }
 
-        free(py_set_tasks);
+        if ( !pJob->py_result )
+            return NULL;
     }
 
-    free(pEngine->source);
-    free(tasks);
-    free(results);
-
-    return Py_BuildValue("(NN)", createWeights(weights), text_list);
+    Py_INCREF(pJob->py_result);
+    return pJob->py_result;
 }
 
 static PyMethodDef fuzzyEngine_Methods[] =
@@ -2522,12 +3472,19 @@ static PyMethodDef fuzzyEngine_Methods[] =
     { "createFuzzyEngine", (PyCFunction)fuzzyEngine_createFuzzyEngine, METH_VARARGS | METH_KEYWORDS, "" },
     { "closeFuzzyEngine", (PyCFunction)fuzzyEngine_closeFuzzyEngine, METH_VARARGS, "" },
     { "initPattern", (PyCFunction)fuzzyEngine_initPattern, METH_VARARGS, "initialize the pattern." },
+    { "createCandidateStore", (PyCFunction)fuzzyEngine_createCandidateStore, METH_NOARGS, "" },
+    { "appendCandidates", (PyCFunction)fuzzyEngine_appendCandidates, METH_VARARGS, "" },
     { "fuzzyMatch", (PyCFunction)fuzzyEngine_fuzzyMatch, METH_VARARGS | METH_KEYWORDS, "" },
+    { "fuzzyMatchAsync", (PyCFunction)fuzzyEngine_fuzzyMatchAsync, METH_VARARGS | METH_KEYWORDS, "" },
+    { "pollMatchJob", (PyCFunction)fuzzyEngine_pollMatchJob, METH_VARARGS, "" },
+    { "cancelMatchJob", (PyCFunction)fuzzyEngine_cancelMatchJob, METH_VARARGS, "" },
+    { "getMatchJobResult", (PyCFunction)fuzzyEngine_getMatchJobResult, METH_VARARGS, "" },
     { "fuzzyMatchEx", (PyCFunction)fuzzyEngine_fuzzyMatchEx, METH_VARARGS | METH_KEYWORDS, "" },
     { "fuzzyMatchPart", (PyCFunction)fuzzyEngine_fuzzyMatchPart, METH_VARARGS | METH_KEYWORDS, "" },
     { "getHighlights", (PyCFunction)fuzzyEngine_getHighlights, METH_VARARGS | METH_KEYWORDS, "" },
     { "guessMatch", (PyCFunction)fuzzyEngine_guessMatch, METH_VARARGS | METH_KEYWORDS, "" },
     { "merge", (PyCFunction)fuzzyEngine_merge, METH_VARARGS, "" },
+    { "rankResults", (PyCFunction)fuzzyEngine_rankResults, METH_VARARGS, "" },
     { "createRgParameter", (PyCFunction)fuzzyEngine_createRgParameter, METH_VARARGS, "" },
     { "createParameter", (PyCFunction)fuzzyEngine_createParameter, METH_VARARGS, "" },
     { "createGtagsParameter", (PyCFunction)fuzzyEngine_createGtagsParameter, METH_VARARGS, "" },
@@ -2589,6 +3546,12 @@ PyMODINIT_FUNC PyInit_fuzzyEngine(void)
         return NULL;
     }
 
+    if ( PyModule_AddObject(module, "UNICODE_PATTERN", Py_BuildValue("I", 1)) )
+    {
+        Py_DECREF(module);
+        return NULL;
+    }
+
     return module;
 }
 
@@ -2637,6 +3600,12 @@ PyMODINIT_FUNC initfuzzyEngine(void)
         Py_DECREF(module);
         return;
     }
+
+    if ( PyModule_AddObject(module, "UNICODE_PATTERN", Py_BuildValue("I", 1)) )
+    {
+        Py_DECREF(module);
+        return;
+    }
 }
 
 #endif
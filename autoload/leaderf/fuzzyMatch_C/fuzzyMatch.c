@@ -25,6 +25,10 @@
 #include <ctype.h>
 #include "fuzzyMatch.h"
 
+#if defined(__SSE2__) || defined(_M_X64) || defined(_M_AMD64)
+    #define FM_SSE2
+    #include <emmintrin.h>
+#endif
 
 #if defined(_MSC_VER) && \
     (defined(_M_IX86) || defined(_M_AMD64) || defined(_M_X64))
@@ -171,6 +175,81 @@ static uint16_t valTable[64] =
     325, 331, 337, 343, 349, 355, 361, 367
 };
 
+/**
+ * return the position of the first `c` in text[start:text_len], or text_len if not found.
+ * if `c` is a lowercase letter, its uppercase counterpart is also matched.
+ */
+static uint16_t findChar(const char* text, uint16_t start, uint16_t text_len, char c)
+{
+    /* 'A' | 0x20 == 'a' */
+    char fold = c >= 'a' && c <= 'z' ? 0x20 : 0;
+    uint16_t i = start;
+#if defined(FM_SSE2)
+    __m128i target = _mm_set1_epi8(c);
+    __m128i mask = _mm_set1_epi8(fold);
+    for ( ; i + 16 <= text_len; i += 16 )
+    {
+        __m128i chunk = _mm_or_si128(_mm_loadu_si128((const __m128i*)(text + i)), mask);
+        uint32_t bits = (uint32_t)_mm_movemask_epi8(_mm_cmpeq_epi8(chunk, target));
+        if ( bits != 0 )
+            return i + (uint16_t)FM_CTZ((uint64_t)bits);
+    }
+#endif
+    for ( ; i < text_len; ++i )
+    {
+        if ( (char)(text[i] | fold) == c )
+            return i;
+    }
+
+    return text_len;
+}
+
+/**
+ * return 1 if all the characters of pattern occur in text in order, otherwise 0.
+ * it is much cheaper than building the text mask, so most of the texts that
+ * do not match are rejected before that.
+ */
+static int isSubsequence(const char* text, uint16_t text_len, const char* pattern, uint16_t pattern_len)
+{
+    uint16_t i = 0;
+    uint16_t j = 0;
+    for ( ; j < pattern_len; ++j )
+    {
+        i = findChar(text, i, text_len, pattern[j]);
+        if ( i == text_len )
+            return 0;
+        ++i;
+    }
+
+    return 1;
+}
+
+static uint64_t getCharBit(uint8_t c)
+{
+    if ( c >= 'a' && c <= 'z' )
+        return 1ULL << (c - 'a');
+    else if ( c >= 'A' && c <= 'Z' )
+        return 1ULL << (c - 'A');
+    else if ( c >= '0' && c <= '9' )
+        return 1ULL << (c - '0' + 26);
+    else if ( c > ' ' && c < 0x7F )
+        return 1ULL << (c % 28 + 36);   /* punctuations share the remaining 28 bits */
+    else
+        return 0;
+}
+
+uint64_t getCharBitmap(const char* text, uint32_t text_len)
+{
+    uint64_t bitmap = 0;
+    uint32_t i = 0;
+    for ( ; i < text_len; ++i )
+    {
+        bitmap |= getCharBit((uint8_t)text[i]);
+    }
+
+    return bitmap;
+}
+
 typedef struct TextContext
 {
     const char* text;
@@ -187,13 +266,246 @@ typedef struct ValueElements
     uint16_t end;
 }ValueElements;
 
+/**
+ * decode the utf-8 character at the beginning of `str`, `*n` is set to its length.
+ * an invalid byte is decoded as U+FFFD.
+ */
+static uint32_t decodeUtf8(const char* str, uint16_t len, uint16_t* n)
+{
+    const uint8_t* s = (const uint8_t*)str;
+    uint32_t c = s[0];
+    uint16_t count = 0;
+    if ( c < 0x80 )
+    {
+        *n = 1;
+        return c;
+    }
+    else if ( c >= 0xC2 && c <= 0xDF )
+    {
+        count = 1;
+        c &= 0x1F;
+    }
+    else if ( c >= 0xE0 && c <= 0xEF )
+    {
+        count = 2;
+        c &= 0x0F;
+    }
+    else if ( c >= 0xF0 && c <= 0xF4 )
+    {
+        count = 3;
+        c &= 0x07;
+    }
+    else
+    {
+        *n = 1;
+        return 0xFFFD;
+    }
+
+    if ( count >= len )
+    {
+        *n = 1;
+        return 0xFFFD;
+    }
+
+    uint16_t i;
+    for ( i = 1; i <= count; ++i )
+    {
+        if ( (s[i] & 0xC0) != 0x80 )
+        {
+            *n = 1;
+            return 0xFFFD;
+        }
+        c = (c << 6) | (s[i] & 0x3F);
+    }
+    *n = count + 1;
+
+    return c;
+}
+
+/**
+ * return the lowercase of `c`, only the common scripts are taken into account:
+ * Latin-1 Supplement, Latin Extended-A, Greek, Cyrillic, Armenian and fullwidth Latin.
+ */
+static uint32_t foldCase(uint32_t c)
+{
+    if ( c < 0x80 )
+        return tolower(c);
+    else if ( c < 0xC0 )
+        return c;
+    else if ( c <= 0xDE )
+        return c == 0xD7 ? c : c + 0x20;
+    else if ( c < 0x100 )
+        return c;
+    else if ( c == 0x130 )
+        return 'i';
+    else if ( c < 0x138 || (c >= 0x14A && c < 0x178) )
+        return c | 1;
+    else if ( (c >= 0x139 && c < 0x149) || (c >= 0x179 && c < 0x17F) )
+        return (c & 1) ? c + 1 : c;
+    else if ( c == 0x178 )
+        return 0xFF;
+    else if ( c == 0x386 )
+        return 0x3AC;
+    else if ( c >= 0x388 && c <= 0x38A )
+        return c + 0x25;
+    else if ( c == 0x38C )
+        return 0x3CC;
+    else if ( c == 0x38E || c == 0x38F )
+        return c + 0x3F;
+    else if ( c >= 0x391 && c <= 0x3AB && c != 0x3A2 )
+        return c + 0x20;
+    else if ( c >= 0x400 && c <= 0x40F )
+        return c + 0x50;
+    else if ( c >= 0x410 && c <= 0x42F )
+        return c + 0x20;
+    else if ( (c >= 0x460 && c < 0x482) || (c >= 0x48A && c < 0x4C0) || (c >= 0x4D0 && c < 0x500) )
+        return c | 1;
+    else if ( c == 0x4C0 )
+        return 0x4CF;
+    else if ( c >= 0x4C1 && c < 0x4CF )
+        return (c & 1) ? c + 1 : c;
+    else if ( c >= 0x531 && c <= 0x556 )
+        return c + 0x30;
+    else if ( c >= 0xFF21 && c <= 0xFF3A )
+        return c + 0x20;
+    else
+        return c;
+}
+
+/**
+ * return the byte that represents the non-ascii character `c` in the translated text,
+ * see translateText().
+ */
+static char getWideCharByte(PatternContext* pPattern_ctxt, uint32_t c)
+{
+    uint32_t lower = foldCase(c);
+    uint8_t i;
+    if ( pPattern_ctxt->is_lower )
+    {
+        c = lower;
+    }
+    for ( i = 0; i < pPattern_ctxt->wide_count; ++i )
+    {
+        if ( pPattern_ctxt->wide_chars[i] == c )
+            return (char)(WIDE_CHAR_BASE + i);
+    }
+    /* a lowercase character of the pattern also matches its uppercase */
+    if ( lower != c )
+    {
+        for ( i = 0; i < pPattern_ctxt->wide_count; ++i )
+        {
+            if ( pPattern_ctxt->wide_chars[i] == lower )
+                return (char)(WIDE_CHAR_BASE + i);
+        }
+    }
+
+    return (char)WIDE_CHAR_NONE;
+}
+
+/**
+ * translate the utf-8 `text` to the alphabet of the pattern, one byte per character:
+ * an ascii character is kept as it is, a non-ascii character of the pattern is
+ * WIDE_CHAR_BASE + its index in pPattern_ctxt->wide_chars, the others are WIDE_CHAR_NONE.
+ * if `offsets` is not NULL, offsets[i] is set to the byte offset of the i-th character.
+ * return the number of characters.
+ */
+static uint16_t translateText(const char* text, uint16_t text_len, PatternContext* pPattern_ctxt,
+                              char* buffer, uint16_t* offsets)
+{
+    uint16_t i = 0;
+    uint16_t count = 0;
+    while ( i < text_len )
+    {
+        if ( offsets )
+            offsets[count] = i;
+
+        if ( (uint8_t)text[i] < 0x80 )
+        {
+            buffer[count++] = text[i++];
+        }
+        else
+        {
+            uint16_t n = 1;
+            uint32_t c = decodeUtf8(text + i, text_len - i, &n);
+            buffer[count++] = getWideCharByte(pPattern_ctxt, c);
+            i += n;
+        }
+    }
+    if ( offsets )
+        offsets[count] = i;
+
+    return count;
+}
+
+static int isAsciiText(const char* text, uint16_t text_len)
+{
+    uint16_t i;
+    for ( i = 0; i < text_len; ++i )
+    {
+        if ( (uint8_t)text[i] >= 0x80 )
+            return 0;
+    }
+    return 1;
+}
+
 PatternContext* initPattern(const char* pattern, uint16_t pattern_len)
 {
-    PatternContext* pPattern_ctxt = (PatternContext*)malloc(sizeof(PatternContext));
-    if ( !pPattern_ctxt )
+    PatternContext* pPattern_ctxt = NULL;
+    uint8_t has_wide_upper = 0;
+    if ( isAsciiText(pattern, pattern_len) )
     {
-        fprintf(stderr, "Out of memory in initPattern()!\n");
-        return NULL;
+        pPattern_ctxt = (PatternContext*)malloc(sizeof(PatternContext));
+        if ( !pPattern_ctxt )
+        {
+            fprintf(stderr, "Out of memory in initPattern()!\n");
+            return NULL;
+        }
+        pPattern_ctxt->wide_count = 0;
+    }
+    else
+    {
+        /* the translated pattern is stored right after the PatternContext */
+        pPattern_ctxt = (PatternContext*)malloc(sizeof(PatternContext) + pattern_len);
+        if ( !pPattern_ctxt )
+        {
+            fprintf(stderr, "Out of memory in initPattern()!\n");
+            return NULL;
+        }
+        pPattern_ctxt->wide_count = 0;
+
+        char* translated = (char*)(pPattern_ctxt + 1);
+        uint16_t i = 0;
+        uint16_t count = 0;
+        while ( i < pattern_len )
+        {
+            uint16_t n = 1;
+            uint32_t c = decodeUtf8(pattern + i, pattern_len - i, &n);
+            i += n;
+            if ( c < 0x80 )
+            {
+                translated[count++] = (char)c;
+                continue;
+            }
+
+            if ( foldCase(c) != c )
+                has_wide_upper = 1;
+
+            uint8_t j;
+            for ( j = 0; j < pPattern_ctxt->wide_count; ++j )
+            {
+                if ( pPattern_ctxt->wide_chars[j] == c )
+                    break;
+            }
+            if ( j == pPattern_ctxt->wide_count && j < MAX_WIDE_CHARS )
+            {
+                pPattern_ctxt->wide_chars[j] = c;
+                ++pPattern_ctxt->wide_count;
+            }
+            translated[count++] = (char)(j < MAX_WIDE_CHARS ? WIDE_CHAR_BASE + j : WIDE_CHAR_NONE);
+        }
+
+        pattern = translated;
+        pattern_len = count;
     }
     pPattern_ctxt->actual_pattern_len = pattern_len;
     if ( pattern_len >= 64 )
@@ -213,7 +525,8 @@ PatternContext* initPattern(const char* pattern, uint16_t pattern_len)
             pPattern_ctxt->pattern_mask[(uint8_t)toupper(pattern[i])] ^= (1LL << i);
         }
     }
-    pPattern_ctxt->is_lower = 1;
+    pPattern_ctxt->is_lower = !has_wide_upper;
+    pPattern_ctxt->char_bitmap = getCharBitmap(pattern, pattern_len);
 
     for ( i = 0; i < pattern_len; ++i )
     {
@@ -237,7 +550,7 @@ ValueElements* evaluate_nameOnly(TextContext* pText_ctxt,
     uint16_t j = pText_ctxt->offset;
 
     const char* pattern = pPattern_ctxt->pattern;
-    uint16_t base_offset = pattern[k] * col_num;
+    uint16_t base_offset = (uint8_t)pattern[k] * col_num;
     uint64_t x = text_mask[base_offset + (j >> 6)] >> (j & 63);
     uint16_t i = 0;
 
@@ -443,7 +756,7 @@ ValueElements* evaluate(TextContext* pText_ctxt,
     uint16_t j = pText_ctxt->offset;
 
     const char* pattern = pPattern_ctxt->pattern;
-    uint16_t base_offset = pattern[k] * col_num;
+    uint16_t base_offset = (uint8_t)pattern[k] * col_num;
     uint64_t x = text_mask[base_offset + (j >> 6)] >> (j & 63);
     uint16_t i = 0;
 
@@ -660,9 +973,9 @@ ValueElements* evaluate(TextContext* pText_ctxt,
     return val + k;
 }
 
-float getWeight(const char* text, uint16_t text_len,
-                PatternContext* pPattern_ctxt,
-                uint8_t is_name_only)
+static float getByteWeight(const char* text, uint16_t text_len,
+                           PatternContext* pPattern_ctxt,
+                           uint8_t is_name_only)
 {
     if ( !text || !pPattern_ctxt )
         return MIN_WEIGHT;
@@ -707,7 +1020,7 @@ float getWeight(const char* text, uint16_t text_len,
             int16_t i;
             for ( i = 0; i < text_len; ++i )
             {
-                if ( tolower(text[i]) == first_char )
+                if ( (char)tolower(text[i]) == first_char )
                 {
                     if ( first_char_pos == -1 )
                         first_char_pos = i;
@@ -723,6 +1036,9 @@ float getWeight(const char* text, uint16_t text_len,
         }
     }
 
+    if ( !isSubsequence(text, text_len, pattern, pattern_len) )
+        return MIN_WEIGHT;
+
     int16_t first_char_pos = -1;
     uint16_t short_text_len = text_len;
     if ( pPattern_ctxt->is_lower )
@@ -730,7 +1046,7 @@ float getWeight(const char* text, uint16_t text_len,
         int16_t i;
         for ( i = 0; i < text_len; ++i )
         {
-            if ( tolower(text[i]) == first_char )
+            if ( (char)tolower(text[i]) == first_char )
             {
                 first_char_pos = i;
                 break;
@@ -742,7 +1058,7 @@ float getWeight(const char* text, uint16_t text_len,
         int16_t last_char_pos = -1;
         for ( i = text_len - 1; i >= first_char_pos; --i )
         {
-            if ( tolower(text[i]) == last_char )
+            if ( (char)tolower(text[i]) == last_char )
             {
                 last_char_pos = i;
                 break;
@@ -800,7 +1116,7 @@ float getWeight(const char* text, uint16_t text_len,
             int16_t i;
             for ( i = 0; i < text_len; ++i )
             {
-                if ( tolower(text[i]) == first_char )
+                if ( (char)tolower(text[i]) == first_char )
                 {
                     first_char_pos = i;
                     break;
@@ -828,7 +1144,7 @@ float getWeight(const char* text, uint16_t text_len,
             int16_t i;
             for ( i = text_len - 1; i >= first_char_pos; --i )
             {
-                if ( tolower(text[i]) == last_char )
+                if ( (char)tolower(text[i]) == last_char )
                 {
                     last_char_pos = i;
                     break;
@@ -900,7 +1216,7 @@ float getWeight(const char* text, uint16_t text_len,
         {
             if ( j < pPattern_ctxt->actual_pattern_len )
             {
-                if ( (pPattern_ctxt->is_lower && tolower(text[i]) == pattern[j])
+                if ( (pPattern_ctxt->is_lower && (char)tolower(text[i]) == pattern[j])
                      || text[i] == pattern[j] )
                 {
                     ++j;
@@ -973,7 +1289,7 @@ HighlightGroup* evaluateHighlights_nameOnly(TextContext* pText_ctxt,
     uint16_t col_num = pText_ctxt->col_num;
 
     const char* pattern = pPattern_ctxt->pattern;
-    uint16_t base_offset = pattern[k] * col_num;
+    uint16_t base_offset = (uint8_t)pattern[k] * col_num;
     uint64_t x = text_mask[base_offset + (j >> 6)] >> (j & 63);
     uint16_t i = 0;
 
@@ -1195,7 +1511,7 @@ HighlightGroup* evaluateHighlights(TextContext* pText_ctxt,
     uint16_t col_num = pText_ctxt->col_num;
 
     const char* pattern = pPattern_ctxt->pattern;
-    uint16_t base_offset = pattern[k] * col_num;
+    uint16_t base_offset = (uint8_t)pattern[k] * col_num;
     uint64_t x = text_mask[base_offset + (j >> 6)] >> (j & 63);
     uint16_t i = 0;
 
@@ -1427,10 +1743,10 @@ HighlightGroup* evaluateHighlights(TextContext* pText_ctxt,
  * is the length of the highlight in bytes.
  * e.g., [ [2,3], [6,2], [10,4], ... ]
  */
-HighlightGroup* getHighlights(const char* text,
-                              uint16_t text_len,
-                              PatternContext* pPattern_ctxt,
-                              uint8_t is_name_only)
+static HighlightGroup* getByteHighlights(const char* text,
+                                         uint16_t text_len,
+                                         PatternContext* pPattern_ctxt,
+                                         uint8_t is_name_only)
 {
     if ( !text || !pPattern_ctxt )
         return NULL;
@@ -1486,7 +1802,7 @@ HighlightGroup* getHighlights(const char* text,
             int16_t i;
             for ( i = 0; i < text_len; ++i )
             {
-                if ( tolower(text[i]) == first_char )
+                if ( (char)tolower(text[i]) == first_char )
                 {
                     if ( first_char_pos == -1 )
                         first_char_pos = i;
@@ -1524,7 +1840,7 @@ HighlightGroup* getHighlights(const char* text,
         int16_t i;
         for ( i = 0; i < text_len; ++i )
         {
-            if ( tolower(text[i]) == first_char )
+            if ( (char)tolower(text[i]) == first_char )
             {
                 first_char_pos = i;
                 break;
@@ -1534,7 +1850,7 @@ HighlightGroup* getHighlights(const char* text,
         int16_t last_char_pos = -1;
         for ( i = text_len - 1; i >= first_char_pos; --i )
         {
-            if ( tolower(text[i]) == last_char )
+            if ( (char)tolower(text[i]) == last_char )
             {
                 last_char_pos = i;
                 break;
@@ -1586,7 +1902,7 @@ HighlightGroup* getHighlights(const char* text,
             int16_t i;
             for ( i = 0; i < text_len; ++i )
             {
-                if ( tolower(text[i]) == first_char )
+                if ( (char)tolower(text[i]) == first_char )
                 {
                     first_char_pos = i;
                     break;
@@ -1612,7 +1928,7 @@ HighlightGroup* getHighlights(const char* text,
             int16_t i;
             for ( i = text_len - 1; i >= first_char_pos; --i )
             {
-                if ( tolower(text[i]) == last_char )
+                if ( (char)tolower(text[i]) == last_char )
                 {
                     last_char_pos = i;
                     break;
@@ -1700,6 +2016,97 @@ HighlightGroup* getHighlights(const char* text,
     return pGroup;
 }
 
+/**
+ * the translated text is kept on the stack if it is not longer than this
+ */
+#define SHORT_TEXT_LEN 256
+
+float getWeight(const char* text, uint16_t text_len,
+                PatternContext* pPattern_ctxt,
+                uint8_t is_name_only)
+{
+    if ( !text || !pPattern_ctxt || pPattern_ctxt->wide_count == 0 )
+        return getByteWeight(text, text_len, pPattern_ctxt, is_name_only);
+
+    /* `text` can not contain the non-ascii characters of the pattern */
+    if ( isAsciiText(text, text_len) )
+        return MIN_WEIGHT;
+
+    char short_buffer[SHORT_TEXT_LEN];
+    char* buffer = short_buffer;
+    if ( text_len > SHORT_TEXT_LEN )
+    {
+        buffer = (char*)malloc(text_len);
+        if ( !buffer )
+        {
+            fprintf(stderr, "Out of memory in getWeight()!\n");
+            return MIN_WEIGHT;
+        }
+    }
+
+    uint16_t len = translateText(text, text_len, pPattern_ctxt, buffer, NULL);
+    float weight = getByteWeight(buffer, len, pPattern_ctxt, is_name_only);
+
+    if ( buffer != short_buffer )
+    {
+        free(buffer);
+    }
+
+    return weight;
+}
+
+HighlightGroup* getHighlights(const char* text,
+                              uint16_t text_len,
+                              PatternContext* pPattern_ctxt,
+                              uint8_t is_name_only)
+{
+    if ( !text || !pPattern_ctxt || pPattern_ctxt->wide_count == 0 )
+        return getByteHighlights(text, text_len, pPattern_ctxt, is_name_only);
+
+    if ( isAsciiText(text, text_len) )
+        return NULL;
+
+    char short_buffer[SHORT_TEXT_LEN];
+    uint16_t short_offsets[SHORT_TEXT_LEN + 1];
+    char* buffer = short_buffer;
+    uint16_t* offsets = short_offsets;
+    if ( text_len > SHORT_TEXT_LEN )
+    {
+        buffer = (char*)malloc(text_len);
+        offsets = (uint16_t*)malloc((text_len + 1) * sizeof(uint16_t));
+        if ( !buffer || !offsets )
+        {
+            free(buffer);
+            free(offsets);
+            fprintf(stderr, "Out of memory in getHighlights()!\n");
+            return NULL;
+        }
+    }
+
+    uint16_t len = translateText(text, text_len, pPattern_ctxt, buffer, offsets);
+    HighlightGroup* pGroup = getByteHighlights(buffer, len, pPattern_ctxt, is_name_only);
+    if ( pGroup )
+    {
+        /* the columns are counted in characters, convert them to bytes */
+        uint16_t i;
+        for ( i = 0; i < pGroup->end_index; ++i )
+        {
+            uint16_t col = pGroup->positions[i].col - 1;
+            uint16_t end = col + pGroup->positions[i].len;
+            pGroup->positions[i].col = offsets[col] + 1;
+            pGroup->positions[i].len = offsets[end] - offsets[col];
+        }
+    }
+
+    if ( buffer != short_buffer )
+    {
+        free(buffer);
+        free(offsets);
+    }
+
+    return pGroup;
+}
+
 /**
  * e.g., /usr/src/example.tar.gz
  * `dirname` is "/usr/src"
@@ -1977,6 +2384,12 @@ PyMODINIT_FUNC PyInit_fuzzyMatchC(void)
         return NULL;
     }
 
+    if ( PyModule_AddObject(module, "UNICODE_PATTERN", Py_BuildValue("I", 1)) )
+    {
+        Py_DECREF(module);
+        return NULL;
+    }
+
     return module;
 }
 
@@ -1994,6 +2407,12 @@ PyMODINIT_FUNC initfuzzyMatchC(void)
         Py_DECREF(module);
         return;
     }
+
+    if ( PyModule_AddObject(module, "UNICODE_PATTERN", Py_BuildValue("I", 1)) )
+    {
+        Py_DECREF(module);
+        return;
+    }
 }
 
 #endif
@@ -21,6 +21,15 @@
 
 #define MIN_WEIGHT (-1000000.0f)
 
+/**
+ * a non-ascii pattern is matched one character per byte, the i-th distinct
+ * non-ascii character of the pattern is represented by WIDE_CHAR_BASE + i,
+ * and any other non-ascii character by WIDE_CHAR_NONE.
+ */
+#define WIDE_CHAR_BASE 0x80
+#define WIDE_CHAR_NONE 0xFF
+#define MAX_WIDE_CHARS (WIDE_CHAR_NONE - WIDE_CHAR_BASE)
+
 typedef struct PatternContext
 {
     const char* pattern;
@@ -28,6 +37,10 @@ typedef struct PatternContext
     uint16_t pattern_len;
     uint16_t actual_pattern_len;
     uint8_t is_lower;
+    uint8_t wide_count;
+    /* getCharBitmap() of the pattern */
+    uint64_t char_bitmap;
+    uint32_t wide_chars[MAX_WIDE_CHARS];
 }PatternContext;
 
 typedef struct HighlightPos
@@ -51,6 +64,12 @@ extern "C" {
 
 PatternContext* initPattern(const char* pattern, uint16_t pattern_len);
 
+/**
+ * return a bitmap of the ascii characters in text, letters are case insensitive.
+ * a text can not match a pattern if `pattern_bitmap & ~text_bitmap` is not 0.
+ */
+uint64_t getCharBitmap(const char* text, uint32_t text_len);
+
 float getWeight(const char* text, uint16_t text_len, PatternContext* pPattern_ctxt, uint8_t is_name_only);
 
 HighlightGroup* getHighlights(const char* text, uint16_t text_len, PatternContext* pPattern_ctxt, uint8_t is_name_only);
@@ -1,6 +1,7 @@
 import os
 import sys
 import shlex
+import locale
 import signal
 import threading
 import itertools
@@ -35,8 +36,17 @@ class AsyncExecutor(object):
         finally:
             queue.put(None)
 
+    # the size of a block read from stdout in the chunked mode
+    CHUNK_SIZE = 262144
+
     def execute(self, cmd, encoding=None, cleanup=None, env=None,
-                raise_except=True, format_line=None, cwd=None):
+                raise_except=True, format_line=None, cwd=None, chunked=False, separator=b"\n"):
+        """
+        if `chunked` is True, stdout is read in large blocks and the result yields
+        the lines of a block in a list at a time when iterated by chunks().
+        `separator` is the byte that ends a line, e.g., b"\\0" for the output of
+        `git ls-files -z`, stdout is always read in large blocks if it is not b"\\n".
+        """
         if os.name == 'nt':
             self._process = subprocess.Popen(cmd, bufsize=-1,
                                              stdin=lfDEVNULL,
@@ -174,7 +184,103 @@ class AsyncExecutor(object):
                     if cleanup:
                         cleanup()
 
-        result = AsyncExecutor.Result(read(iter(self._process.stdout.readline, b"")))
+        if sys.version_info >= (3, 0):
+            block_encoding = encoding or locale.getdefaultlocale()[1] or "utf-8"
+
+            text_separator = separator.decode("ascii")
+
+            def decode(block):
+                # decode a whole block at once, most of the output is ascii
+                try:
+                    lines = block.decode("ascii").split(text_separator)
+                except UnicodeDecodeError:
+                    try:
+                        lines = block.decode(block_encoding).split(text_separator)
+                    except (UnicodeDecodeError, LookupError):
+                        lines = [lfBytes2Str(line, encoding) for line in block.split(separator)]
+
+                if separator == b"\n":
+                    if b"\r" in block:
+                        lines = [line.rstrip("\r") for line in lines]
+                elif b"\n" in block:
+                    # a line of the buffer can not contain a newline
+                    lines = [line for line in lines if "\n" not in line]
+                return lines
+        else:
+            def decode(block):
+                lines = block.split(separator)
+                if not encoding:
+                    try:
+                        block.decode("ascii")
+                    except UnicodeDecodeError:
+                        lines = [lfEncode(line) for line in lines]
+
+                if separator == b"\n":
+                    if b"\r" in block:
+                        lines = [line.rstrip(b"\r") for line in lines]
+                elif b"\n" in block:
+                    # a line of the buffer can not contain a newline
+                    lines = [line for line in lines if b"\n" not in line]
+                return lines
+
+        def read_chunks(fd):
+            try:
+                count = 0
+                rest = b""
+                while True:
+                    block = os.read(fd, self.CHUNK_SIZE)
+                    if not block:
+                        if not rest:
+                            break
+                        block, rest = rest, b""
+                    else:
+                        block = rest + block
+                        end = block.rfind(separator)
+                        if end == -1:
+                            rest = block
+                            continue
+                        block, rest = block[:end], block[end+1:]
+
+                    lines = decode(block)
+                    if format_line:
+                        lines = [format_line(line) for line in lines]
+
+                    if self._max_count > 0:
+                        count += len(lines)
+                        if count >= self._max_count:
+                            del lines[len(lines) - (count - self._max_count):]
+                            yield lines
+                            self.killProcess()
+                            break
+                    yield lines
+
+                err = b"".join(iter(self._errQueue.get, None))
+                if err and raise_except:
+                    if sys.version_info >= (3, 0):
+                        raise Exception(cmd + "\n" + lfBytes2Str(err) + lfBytes2Str(err, encoding))
+                    else:
+                        raise Exception(lfEncode(err) + err)
+            except (ValueError, OSError):
+                pass
+            finally:
+                self._finished = True
+                try:
+                    if self._process:
+                        self._process.stdout.close()
+                        self._process.stderr.close()
+                        self._process.poll()
+                except IOError:
+                    pass
+                except AttributeError:
+                    pass
+
+                if cleanup:
+                    cleanup()
+
+        if chunked or separator != b"\n":
+            result = AsyncExecutor.Result(read_chunks(self._process.stdout.fileno()), chunked=True)
+        else:
+            result = AsyncExecutor.Result(read(iter(self._process.stdout.readline, b"")))
 
         return result
 
@@ -194,21 +300,44 @@ class AsyncExecutor(object):
             self._process = None
 
     class Result(object):
-        def __init__(self, iterable):
-            self._g = iterable
+        """
+        the lines of the output, if `chunked` is True, `iterable` yields lists of lines.
+        the lines can be iterated one by one, or in lists by chunks(), but not both.
+        """
+        def __init__(self, iterable, chunked=False):
+            if chunked:
+                self._chunks = iterable
+                self._g = itertools.chain.from_iterable(iterable)
+            else:
+                self._chunks = None
+                self._g = iterable
 
         def __add__(self, iterable):
+            self._chunks = None
             self._g = itertools.chain(self._g, iterable)
             return self
 
         def __iadd__(self, iterable):
+            self._chunks = None
             self._g = itertools.chain(self._g, iterable)
             return self
 
         def join_left(self, iterable):
+            self._chunks = None
             self._g = itertools.chain(iterable, self._g)
             return self
 
+        def isChunked(self):
+            return self._chunks is not None
+
+        def chunks(self):
+            """
+            return an iterator of lists of lines.
+            """
+            if self._chunks is not None:
+                return self._chunks
+            return ([line] for line in self._g)
+
         def __iter__(self):
             return self
 
@@ -402,13 +402,24 @@ class BufTagExplManager(Manager):
                 if ('-2' == lfEval("g:LfNoErrMsgMatch('', '%s')" % escQuote(self._cli.pattern))):
                     return iter([])
                 else:
+                    regex = self._getRegex(self._cli.pattern)
+                    lines = iterable[::2]
+                    if regex is not None:
+                        indices = [i for i, line in enumerate(lines)
+                                   if regex.search(self._getDigest(line, 1).strip()) is not None]
+                    else:
+                        # filter the whole chunk by one call of vim's filter()
+                        vim.vars['Lf_RegexFilterList'] = [self._getDigest(line, 1).strip().replace('\x00', '\x01')
+                                                          for line in lines]
+                        indices = lfEval("g:LfNoErrMsgFilter(g:Lf_RegexFilterList, '%s')"
+                                         % escQuote(self._cli.pattern))
+                        lfCmd("unlet g:Lf_RegexFilterList")
+
                     result = []
-                    for i, line in enumerate(iterable[::2]):
-                        if ('-1' != lfEval("g:LfNoErrMsgMatch('%s', '%s')" %
-                            (escQuote(self._getDigest(line, 1).strip()),
-                                escQuote(self._cli.pattern)))):
-                            result.append(line)
-                            result.append(iterable[2*i+1])
+                    for i in indices:
+                        i = int(i)
+                        result.append(lines[i])
+                        result.append(iterable[2*i+1])
                     return result
             except vim.error:
                 return iter([])
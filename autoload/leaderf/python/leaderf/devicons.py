@@ -431,22 +431,43 @@ def setAmbiwidth(val):
     if _spaces == "":
         _spaces = ' '
 
+    _ext_icons.clear()
+
+# extension -> (the icon followed by the spaces, whether a file of the extension may
+# have an icon of its own name), so that most files are resolved by one lookup and
+# the same icon string is shared by the lines
+_ext_icons = {}
+
+# the extensions of the names in fileNodesExactSymbols
+_exact_exts = set(_getExt(name.lower()) for name in fileNodesExactSymbols)
+
+if os.name == 'nt':
+    def _sepPos(path):
+        return max(path.rfind('/'), path.rfind('\\'))
+else:
+    def _sepPos(path):
+        return path.rfind(os.sep)
+
 # To use asynchronously
 def webDevIconsGetFileTypeSymbol(file, isdir=False):
     if isdir:
-        symbol = folderNodesDefaultSymbol
-    else:
+        return folderNodesDefaultSymbol + _spaces
+
+    dot_pos = file.rfind('.')
+    ext = file[dot_pos+1:] if dot_pos > _sepPos(file) else ''
+    try:
+        icon, check_name = _ext_icons[ext]
+    except KeyError:
+        lower_ext = ext.lower()
+        icon = fileNodesExtensionSymbols.get(lower_ext, fileNodesDefaultSymbol) + _spaces
+        check_name = lower_ext in _exact_exts
+        _ext_icons[ext] = (icon, check_name)
+
+    if check_name:
         fileNode = getBasename(file).lower()
-        fileNodeExt = _getExt(fileNode)
-
-        symbol = fileNodesDefaultSymbol
-
         if fileNode in fileNodesExactSymbols:
-            symbol = fileNodesExactSymbols[fileNode]
-        elif fileNodeExt in fileNodesExtensionSymbols:
-            symbol = fileNodesExtensionSymbols[fileNodeExt]
-
-    return symbol + _spaces
+            return fileNodesExactSymbols[fileNode] + _spaces
+    return icon
 
 def _normalize_name(val):
     # Replace unavailable characters for highlights with __
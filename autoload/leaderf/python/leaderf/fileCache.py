@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import os.path
+import time
+import struct
+from collections import OrderedDict
+from contextlib import contextmanager
+from .utils import *
+
+if os.name == 'nt':
+    import msvcrt
+
+    def _lockFile(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+    def _unlockFile(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lockFile(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _unlockFile(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def replaceFile(src, dst):
+    """
+    rename `src` to `dst` atomically, `dst` is overwritten if it exists.
+    """
+    if sys.version_info >= (3, 3):
+        os.replace(src, dst)
+    else:
+        if os.name == 'nt' and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
+# the header of a file list cache: magic, version, flags, the number of paths,
+# the length of the directory, followed by the directory and the paths joined by '\n'
+FILE_LIST_MAGIC = b'LFFL'
+FILE_LIST_VERSION = 1
+FILE_LIST_HEADER = struct.Struct('<4sHHII')
+# the paths are relative to the directory
+FILE_LIST_RELATIVE = 0x1
+
+def writeFileList(path, dir, lines):
+    """
+    write the file list `lines` of `dir` to the cache file `path`.
+    if the paths are under `dir`, `dir` is stored only once in the header,
+    so that the relative paths are loaded without slicing each of them.
+    """
+    flags = 0
+    if lines and os.path.isabs(lines[0]):
+        dir_len = len(dir)
+        if all(line.startswith(dir) for line in lines):
+            flags = FILE_LIST_RELATIVE
+            lines = [line[dir_len:] for line in lines]
+    elif lines:
+        flags = FILE_LIST_RELATIVE
+
+    if sys.version_info >= (3, 0):
+        blob = '\n'.join(lines).encode('utf-8', errors='ignore')
+        dir_bytes = dir.encode('utf-8', errors='ignore')
+    else:
+        blob = '\n'.join(lines)
+        dir_bytes = dir
+
+    tmp_file = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_file, 'wb') as f:
+        f.write(FILE_LIST_HEADER.pack(FILE_LIST_MAGIC, FILE_LIST_VERSION, flags,
+                                      len(lines), len(dir_bytes)))
+        f.write(dir_bytes)
+        f.write(blob)
+    replaceFile(tmp_file, path)
+
+def readFileList(path):
+    """
+    return a tuple (is_relative, paths), `is_relative` tells whether the paths are
+    relative to the directory of the cache.
+    the whole file is decoded and split at once instead of line by line.
+    raise IOError if the cache file does not exist or is written in another format.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    header_size = FILE_LIST_HEADER.size
+    if len(data) < header_size or data[:4] != FILE_LIST_MAGIC:
+        # a cache written by the older versions, one path per line
+        if sys.version_info >= (3, 0):
+            data = data.decode('utf-8', errors='ignore')
+        paths = [line.rstrip('\r') for line in data.split('\n')]
+        if paths and paths[-1] == '':
+            paths.pop()
+        return (bool(paths) and not os.path.isabs(paths[0]), paths)
+
+    _, version, flags, count, dir_len = FILE_LIST_HEADER.unpack(data[:header_size])
+    if version != FILE_LIST_VERSION:
+        raise IOError("unknown file list version %d: %s" % (version, path))
+    if count == 0:
+        return (flags & FILE_LIST_RELATIVE != 0, [])
+
+    blob = data[header_size + dir_len:]
+    if sys.version_info >= (3, 0):
+        blob = blob.decode('utf-8', errors='ignore')
+    return (flags & FILE_LIST_RELATIVE != 0, blob.split('\n'))
+
+
+# the mtimes of the directories of a file list cache are stored in a file named
+# after the cache file, each line is like "1496669495.3291132 /foo/bar"
+DIR_MTIMES_SUFFIX = '.dirs'
+
+def writeDirMtimes(path, dir_mtimes):
+    """
+    write the mtimes of the directories of the cache file `path`,
+    the file is removed if `dir_mtimes` is empty.
+    """
+    mtimes_file = path + DIR_MTIMES_SUFFIX
+    if not dir_mtimes:
+        try:
+            os.remove(mtimes_file)
+        except OSError:
+            pass
+        return
+
+    tmp_file = "%s.%d.tmp" % (mtimes_file, os.getpid())
+    with lfOpen(tmp_file, 'w', errors='ignore') as f:
+        for dir, mtime in dir_mtimes.items():
+            f.write('%r %s\n' % (mtime, dir))
+    replaceFile(tmp_file, mtimes_file)
+
+def readDirMtimes(path):
+    """
+    return a dict mapping the directories of the cache file `path` to their mtimes,
+    an empty dict if they are not recorded.
+    """
+    dir_mtimes = {}
+    try:
+        with lfOpen(path + DIR_MTIMES_SUFFIX, 'r', errors='ignore') as f:
+            for line in f:
+                fields = line.rstrip('\r\n').split(' ', 1)
+                if len(fields) == 2:
+                    try:
+                        dir_mtimes[fields[1]] = float(fields[0])
+                    except ValueError:
+                        pass
+    except IOError:
+        pass
+    return dir_mtimes
+
+
+# the header of a snapshot: magic, version, the number of lines, the length of the
+# token, followed by the token and the lines joined by '\n'
+SNAPSHOT_MAGIC = b'LFSS'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct('<4sHII')
+
+def writeSnapshot(path, token, lines):
+    """
+    save `lines` to `path`, `token` tells whether the snapshot is still valid when it is loaded.
+    """
+    if sys.version_info >= (3, 0):
+        blob = '\n'.join(lines).encode('utf-8', errors='ignore')
+        token_bytes = token.encode('utf-8', errors='ignore')
+    else:
+        blob = '\n'.join(lines)
+        token_bytes = token
+
+    dir = os.path.dirname(path)
+    if not os.path.exists(dir):
+        os.makedirs(dir)
+
+    tmp_file = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_file, 'wb') as f:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(lines), len(token_bytes)))
+        f.write(token_bytes)
+        f.write(blob)
+    replaceFile(tmp_file, path)
+
+def readSnapshot(path, token):
+    """
+    return the lines saved in `path`, None if there is no snapshot or its token is not `token`.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except IOError:
+        return None
+
+    header_size = SNAPSHOT_HEADER.size
+    if len(data) < header_size:
+        return None
+
+    magic, version, count, token_len = SNAPSHOT_HEADER.unpack(data[:header_size])
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        return None
+
+    token_bytes = data[header_size:header_size + token_len]
+    blob = data[header_size + token_len:]
+    if sys.version_info >= (3, 0):
+        token_bytes = token_bytes.decode('utf-8', errors='ignore')
+        blob = blob.decode('utf-8', errors='ignore')
+
+    if token_bytes != token:
+        return None
+
+    return blob.split('\n') if count > 0 else []
+
+
+#*****************************************************
+# CacheIndex
+#*****************************************************
+class CacheIndex(object):
+    """
+    the index of the file list caches.
+    each line of the index file is like "1496669495.329 cache_1496669495.329 /foo/bar/",
+    i.e., the time when the cache was used last, the name of the cache file and the directory.
+    the lines are loaded into an OrderedDict keyed by the directory, the least recently used
+    one comes first.
+    the index is locked while it is read and updated, so that several vim instances can
+    share the cache directory.
+    """
+    def __init__(self, cache_dir):
+        self._cache_dir = cache_dir
+        self._index_file = os.path.join(cache_dir, 'cacheIndex')
+        self._lock_file = os.path.join(cache_dir, 'cacheIndex.lock')
+
+    def _load(self):
+        entries = []
+        with lfOpen(self._index_file, 'r', errors='ignore') as f:
+            for line in f:
+                fields = line.rstrip('\r\n').split(None, 2)
+                if len(fields) == 3:
+                    try:
+                        entries.append((float(fields[0]), fields[1], fields[2]))
+                    except ValueError:
+                        pass
+
+        entries.sort(key=lambda e: e[0])
+        return OrderedDict((dir, (timestamp, name)) for timestamp, name, dir in entries)
+
+    def _save(self, index):
+        tmp_file = "%s.%d.tmp" % (self._index_file, os.getpid())
+        with lfOpen(tmp_file, 'w', errors='ignore') as f:
+            for dir, (timestamp, name) in index.items():
+                f.write('%.3f %s %s\n' % (timestamp, name, dir))
+        replaceFile(tmp_file, self._index_file)
+
+    @contextmanager
+    def _transaction(self):
+        """
+        yield the index, which is saved if it is modified.
+        """
+        with lfOpen(self._lock_file, 'a') as lock:
+            _lockFile(lock)
+            try:
+                if os.path.exists(self._index_file):
+                    index = self._load()
+                else:
+                    index = OrderedDict()
+                snapshot = list(index.items())
+                yield index
+                if list(index.items()) != snapshot:
+                    self._save(index)
+            finally:
+                _unlockFile(lock)
+
+    def _touch(self, index, dir):
+        _, name = index.pop(dir)
+        index[dir] = (time.time(), name)
+        return name
+
+    def find(self, dir):
+        """
+        return the path of the cache file of `dir`, or None if `dir` is not cached.
+        """
+        with self._transaction() as index:
+            if dir in index:
+                return os.path.join(self._cache_dir, self._touch(index, dir))
+            return None
+
+    def findAncestor(self, dir):
+        """
+        return a tuple (path, cache_file), `path` is `dir` or its nearest ancestor
+        that is cached, None if there is no such directory.
+        """
+        with self._transaction() as index:
+            path = dir
+            while True:
+                if path in index:
+                    return (path, os.path.join(self._cache_dir, self._touch(index, path)))
+
+                parent = os.path.dirname(path.rstrip(os.sep))
+                parent = parent if parent.endswith(os.sep) else parent + os.sep
+                if parent == path:
+                    return None
+                path = parent
+
+    def add(self, dir, capacity):
+        """
+        return the path of the cache file of `dir`, a new one is created if `dir` is not
+        cached, and the least recently used caches are removed if there are more than
+        `capacity` caches.
+        """
+        with self._transaction() as index:
+            if dir in index:
+                return os.path.join(self._cache_dir, self._touch(index, dir))
+
+            timestamp = time.time()
+            names = set(name for _, name in index.values())
+            name = 'cache_%.3f' % timestamp
+            i = 0
+            while name in names:
+                i += 1
+                name = 'cache_%.3f_%d' % (timestamp, i)
+            index[dir] = (timestamp, name)
+            while len(index) > max(capacity, 1):
+                _, (_, old_name) = index.popitem(last=False)
+                self._removeCacheFile(old_name)
+
+            return os.path.join(self._cache_dir, name)
+
+    def remove(self, dir):
+        with self._transaction() as index:
+            if dir in index:
+                _, name = index.pop(dir)
+                self._removeCacheFile(name)
+
+    def _removeCacheFile(self, name):
+        for file in (name, name + DIR_MTIMES_SUFFIX):
+            try:
+                os.remove(os.path.join(self._cache_dir, file))
+            except OSError:
+                pass
@@ -5,14 +5,25 @@ import vim
 import re
 import os
 import os.path
-import fnmatch
+import sys
 import time
 import locale
+import itertools
+import threading
 from functools import wraps
 from .utils import *
 from .explorer import *
 from .manager import *
 from .asyncExecutor import AsyncExecutor
+from .fileCache import (
+    CacheIndex,
+    readFileList,
+    writeFileList,
+    readDirMtimes,
+    writeDirMtimes,
+)
+from .fileWatcher import FileWatcher
+from .fileWalker import FileWalker
 from .devicons import (
     webDevIconsGetFileTypeSymbol,
     removeDevIcons,
@@ -49,6 +60,11 @@ def showDevIcons(func):
 def format_line(line):
     return webDevIconsGetFileTypeSymbol(line) + line
 
+if sys.version_info >= (3, 0):
+    import queue as Queue
+else:
+    import Queue
+
 
 #*****************************************************
 # FileExplorer
@@ -61,107 +77,158 @@ class FileExplorer(Explorer):
                                        'LeaderF',
                                        'python' + lfEval("g:Lf_PythonVersion"),
                                        'file')
-        self._cache_index = os.path.join(self._cache_dir, 'cacheIndex')
-        self._external_cmd = None
         self._initCache()
+        self._cache_index = CacheIndex(self._cache_dir)
+        self._external_cmd = None
+        # the byte that ends a file name in the output of the command
+        self._cmd_separator = b"\n"
         self._executor = []
         self._no_ignore = None
         self._cmd_work_dir = ""
+        self._watcher = None
+        self._walker = None
+        self._walk_mtimes = None
+        self._walk_files = None
+        self._dir_files = {}
+        self._dir_elapsed = {}
+        self._dir_prefixes = {}
 
     def _initCache(self):
         if not os.path.exists(self._cache_dir):
             os.makedirs(self._cache_dir)
-        if not os.path.exists(self._cache_index):
-            with lfOpen(self._cache_index, 'w', errors='ignore'):
-                pass
 
-    def _getFiles(self, dir):
-        start_time = time.time()
+    def _createWalker(self):
         wildignore = lfEval("g:Lf_WildIgnore")
-        file_list = []
-        for dir_path, dirs, files in os.walk(dir, followlinks = False
-                if lfEval("g:Lf_FollowLinks") == '0' else True):
-            dirs[:] = [i for i in dirs if True not in (fnmatch.fnmatch(i,j)
-                       for j in wildignore.get('dir', []))]
-            for name in files:
-                if True not in (fnmatch.fnmatch(name, j)
-                                for j in wildignore.get('file', [])):
-                    file_list.append(lfEncode(os.path.join(dir_path,name)))
-                if time.time() - start_time > float(
-                        lfEval("g:Lf_IndexTimeLimit")):
-                    return file_list
+        return FileWalker(wildignore.get('dir', []),
+                          wildignore.get('file', []),
+                          lfEval("g:Lf_FollowLinks") == '1',
+                          float(lfEval("g:Lf_IndexTimeLimit")))
+
+    def _getFiles(self, dir, dir_mtimes=None):
+        """
+        if `dir_mtimes` is not None, the mtimes of the directories walked are recorded in it.
+        """
+        return list(self._createWalker().walk(dir, dir_mtimes))
+
+    def _walkFiles(self, dir):
+        """
+        return the files under `dir` as they are found, so that they are read
+        by the reader thread of the manager while `dir` is being walked.
+        """
+        show_relative_path = lfEval("g:Lf_ShowRelativePath") == '1'
+        show_devicons = lfEval("get(g:, 'Lf_ShowDevIcons', 1)") == "1"
+
+        def collect(files, walk_files):
+            for line in files:
+                walk_files.append(line)
+                yield line
+
+        self._walker = self._createWalker()
+        self._walk_mtimes = {}
+        # the files walked are kept to be patched if the watcher reports changes
+        self._walk_files = []
+        files = collect(self._walker.walk(dir, self._walk_mtimes), self._walk_files)
+        if show_relative_path:
+            # os.path.relpath() is too slow!
+            cwd_length = len(lfEncode(dir))
+            if not dir.endswith(os.sep):
+                cwd_length += 1
+            files = (line[cwd_length:] for line in files)
+        if show_devicons:
+            files = (format_line(line) for line in files)
+
+        self._cmd_start_time = time.time()
+        return AsyncExecutor.Result(files)
+
+    def _updateFiles(self, file_list, dir_mtimes, dirs=None):
+        """
+        rescan only the directories whose mtime changed and patch `file_list`,
+        `dir_mtimes` is updated in place.
+        if `dirs` is not None, they are the directories known to be changed.
+        """
+        if dirs is None:
+            changed = []
+            for dir, mtime in dir_mtimes.items():
+                try:
+                    if os.stat(lfDecode(dir)).st_mtime != mtime:
+                        changed.append(dir)
+                except OSError: # removed
+                    changed.append(dir)
+        else:
+            changed = [dir for dir in dirs if dir in dir_mtimes]
+
+        if not changed:
+            return file_list
+
+        stale = set(changed)
+        removed = set(dir for dir in changed if not os.path.isdir(lfDecode(dir)))
+        if removed:
+            # the directories under a removed or renamed directory are gone as well
+            for dir in dir_mtimes:
+                path, parent = dir, os.path.dirname(dir)
+                while parent != path:
+                    if parent in removed:
+                        stale.add(dir)
+                        break
+                    path, parent = parent, os.path.dirname(parent)
+
+        file_list = [line for line in file_list if os.path.dirname(line) not in stale]
+
+        walker = self._createWalker()
+        for dir in stale:
+            dir_path = lfDecode(dir)
+            try:
+                dirs, files = walker.listDir(dir_path)
+                dir_mtimes[dir] = os.stat(dir_path).st_mtime
+            except OSError:
+                del dir_mtimes[dir]
+                continue
+
+            file_list += [lfEncode(path) for path in files]
+            for path in dirs:
+                if lfEncode(os.path.normpath(path)) not in dir_mtimes:
+                    # a new directory
+                    file_list += walker.walk(path, dir_mtimes)
+
         return file_list
 
     @showDevIcons
     @showRelativePath
     def _getFileList(self, dir):
         dir = dir if dir.endswith(os.sep) else dir + os.sep
-        with lfOpen(self._cache_index, 'r+', errors='ignore') as f:
-            lines = f.readlines()
-            path_length = 0
-            target = -1
-            for i, line in enumerate(lines):
-                path = line.split(None, 2)[2].strip()
-                if dir.startswith(path) and len(path) > path_length:
-                    path_length = len(path)
-                    target = i
-
-            if target != -1:
-                lines[target] = re.sub(r'^\S*',
-                                       '%.3f' % time.time(),
-                                       lines[target])
-                f.seek(0)
-                f.truncate(0)
-                f.writelines(lines)
-                with lfOpen(os.path.join(self._cache_dir,
-                                         lines[target].split(None, 2)[1]),
-                            'r', errors='ignore') as cache_file:
-                    if lines[target].split(None, 2)[2].strip() == dir:
-                        return cache_file.readlines()
-                    else:
-                        file_list = [line for line in cache_file.readlines()
-                                     if line.startswith(dir)]
-                        if file_list == []:
-                            file_list = self._getFiles(dir)
-                        return file_list
-            else:
-                start_time = time.time()
-                file_list = self._getFiles(dir)
-                delta_seconds = time.time() - start_time
-                if delta_seconds > float(lfEval("g:Lf_NeedCacheTime")):
-                    cache_file_name = ''
-                    if len(lines) < int(lfEval("g:Lf_NumberOfCache")):
-                        f.seek(0, 2)
-                        ts = time.time()
-                        line = '%.3f cache_%.3f %s\n' % (ts, ts, dir)
-                        f.write(line)
-                        cache_file_name = 'cache_%.3f' % ts
-                    else:
-                        for i, line in enumerate(lines):
-                            path = line.split(None, 2)[2].strip()
-                            if path.startswith(dir):
-                                cache_file_name = line.split(None, 2)[1].strip()
-                                line = '%.3f %s %s\n' % (time.time(),
-                                        cache_file_name, dir)
-                                break
-                        if cache_file_name == '':
-                            timestamp = lines[0].split(None, 2)[0]
-                            oldest = 0
-                            for i, line in enumerate(lines):
-                                if line.split(None, 2)[0] < timestamp:
-                                    timestamp = line.split(None, 2)[0]
-                                    oldest = i
-                            cache_file_name = lines[oldest].split(None, 2)[1].strip()
-                            lines[oldest] = '%.3f %s %s\n' % (time.time(),
-                                            cache_file_name, dir)
-                        f.seek(0)
-                        f.truncate(0)
-                        f.writelines(lines)
-                    with lfOpen(os.path.join(self._cache_dir, cache_file_name),
-                                'w', errors='ignore') as cache_file:
-                        for line in file_list:
-                            cache_file.write(line + '\n')
-                return file_list
+        cached = self._cache_index.findAncestor(dir)
+        if cached is not None:
+            path, cache_file_name = cached
+            try:
+                is_relative, file_list = readFileList(cache_file_name)
+                if is_relative:
+                    file_list = [path + line for line in file_list]
+            except IOError: # removed by another vim instance
+                file_list = None
+
+            if file_list is not None:
+                if path == dir:
+                    return file_list
+                else:
+                    file_list = [line for line in file_list if line.startswith(dir)]
+                    if file_list == []:
+                        file_list = self._getFiles(dir)
+                    return file_list
+
+        start_time = time.time()
+        dir_mtimes = {}
+        file_list = self._getFiles(dir, dir_mtimes)
+        delta_seconds = time.time() - start_time
+        if delta_seconds > float(lfEval("g:Lf_NeedCacheTime")):
+            cache_file_name = self._cache_index.add(dir, int(lfEval("g:Lf_NumberOfCache")))
+            writeFileList(cache_file_name, dir, file_list)
+            writeDirMtimes(cache_file_name, dir_mtimes)
+        return file_list
+
+    @showDevIcons
+    @showRelativePath
+    def _getWalkedFiles(self, dir):
+        return list(self._walk_files)
 
     @showDevIcons
     def _readFromFileList(self, files):
@@ -171,30 +238,66 @@ class FileExplorer(Explorer):
                 result += f.readlines()
         return result
 
-    def _refresh(self):
+    def _refresh(self, dirs=None):
+        """
+        if `dirs` is not None, only the directories in `dirs` are rescanned.
+        """
         dir = os.path.abspath(self._cur_dir)
         dir = dir if dir.endswith(os.sep) else dir + os.sep
-        with lfOpen(self._cache_index, 'r+', errors='ignore') as f:
-            lines = f.readlines()
-            path_length = 0
-            target = -1
-            for i, line in enumerate(lines):
-                path = line.split(None, 2)[2].strip()
-                if dir.startswith(path) and len(path) > path_length:
-                    path_length = len(path)
-                    target = i
-
-            if target != -1:
-                lines[target] = re.sub(r'^\S*', '%.3f' % time.time(), lines[target])
-                f.seek(0)
-                f.truncate(0)
-                f.writelines(lines)
-                cache_file_name = lines[target].split(None, 2)[1]
-                file_list = self._getFiles(dir)
-                with lfOpen(os.path.join(self._cache_dir, cache_file_name),
-                            'w', errors='ignore') as cache_file:
-                    for line in file_list:
-                        cache_file.write(line + '\n')
+        cached = self._cache_index.findAncestor(dir)
+        if cached is not None:
+            path, cache_file_name = cached
+            dir_mtimes = readDirMtimes(cache_file_name)
+            file_list = None
+            if dir_mtimes:
+                try:
+                    is_relative, file_list = readFileList(cache_file_name)
+                    if is_relative:
+                        file_list = [path + line for line in file_list]
+                except IOError:
+                    file_list = None
+
+            if file_list is None:
+                dir_mtimes = {}
+                file_list = self._getFiles(path, dir_mtimes)
+            else:
+                file_list = self._updateFiles(file_list, dir_mtimes, dirs)
+            writeFileList(cache_file_name, path, file_list)
+            writeDirMtimes(cache_file_name, dir_mtimes)
+
+    def _startWatcher(self, dir):
+        if (lfEval("get(g:, 'Lf_FileWatcher', 0)") == '0'
+                or lfEval("g:Lf_UseMemoryCache") == '0'):
+            return
+
+        if self._watcher is not None:
+            if self._watcher.isWatching(dir):
+                return
+            self._watcher.stop()
+
+        self._watcher = FileWatcher(dir,
+                                    lfEval("g:Lf_WildIgnore").get('dir', []),
+                                    lfEval("g:Lf_FollowLinks") == '1',
+                                    int(lfEval("get(g:, 'Lf_FileWatcherMaxDirs', 10000)")),
+                                    float(lfEval("get(g:, 'Lf_FileWatcherLatency', 200)")) / 1000)
+
+    def _takeWatchedChanges(self, dir):
+        """
+        return a tuple (changed, dirs), `dirs` is the set of the directories changed,
+        None if all the directories should be checked.
+        """
+        watcher = self._watcher
+        if watcher is None or not watcher.isWatching(dir):
+            return (False, None)
+
+        changed = watcher.hasChanges()
+        dirs = watcher.takeChanges() if changed else None
+        # the backend is None while the watcher is starting
+        vim.vars['Lf_FileWatcherStats'] = dict((k, '' if v is None else v)
+                                               for k, v in watcher.getStats().items())
+        if dirs is not None:
+            dirs = set(lfEncode(d) for d in dirs)
+        return (changed, dirs)
 
     def _exists(self, path, dir):
         """
@@ -237,6 +340,7 @@ class FileExplorer(Explorer):
                 return glob
 
     def _buildCmd(self, dir, **kwargs):
+        self._cmd_separator = b"\n"
         if self._cmd_work_dir:
             if os.name == 'nt':
                 cd_cmd = 'cd /d "{}" && '.format(dir)
@@ -279,11 +383,13 @@ class FileExplorer(Explorer):
                 else:
                     recurse_submodules = ""
 
+                # the file names are not quoted with -z
                 if cd_cmd:
-                    cmd = cd_cmd + 'git ls-files %s && git ls-files --others %s %s' % (recurse_submodules, no_ignore, ignore)
+                    cmd = cd_cmd + 'git ls-files -z %s && git ls-files -z --others %s %s' % (recurse_submodules, no_ignore, ignore)
                 else:
-                    cmd = 'git ls-files %s "%s" && git ls-files --others %s %s "%s"' % (recurse_submodules, dir, no_ignore, ignore, dir)
+                    cmd = 'git ls-files -z %s "%s" && git ls-files -z --others %s %s "%s"' % (recurse_submodules, dir, no_ignore, ignore, dir)
                 self._external_cmd = cmd
+                self._cmd_separator = b"\0"
                 return cmd
             elif self._exists(dir, ".hg") and lfEval("executable('hg')") == '1':
                 wildignore = lfEval("g:Lf_WildIgnore")
@@ -298,10 +404,11 @@ class FileExplorer(Explorer):
                     ignore += ' -X "%s"' % self._expandGlob("file", i)
 
                 if cd_cmd:
-                    cmd = cd_cmd + 'hg files %s' % ignore
+                    cmd = cd_cmd + 'hg files -0 %s' % ignore
                 else:
-                    cmd = 'hg files %s "%s"' % (ignore, dir)
+                    cmd = 'hg files -0 %s "%s"' % (ignore, dir)
                 self._external_cmd = cmd
+                self._cmd_separator = b"\0"
                 return cmd
 
         if lfEval("exists('g:Lf_DefaultExternalTool')") == '1':
@@ -355,9 +462,10 @@ class FileExplorer(Explorer):
                 cur_dir = '"%s"' % dir
 
             if cd_cmd:
-                cmd = cd_cmd + 'rg --no-messages --files %s %s %s %s %s' % (color, ignore, followlinks, show_hidden, no_ignore)
+                cmd = cd_cmd + 'rg --no-messages --files --null %s %s %s %s %s' % (color, ignore, followlinks, show_hidden, no_ignore)
             else:
-                cmd = 'rg --no-messages --files %s %s %s %s %s %s' % (color, ignore, followlinks, show_hidden, no_ignore, cur_dir)
+                cmd = 'rg --no-messages --files --null %s %s %s %s %s %s' % (color, ignore, followlinks, show_hidden, no_ignore, cur_dir)
+            self._cmd_separator = b"\0"
         elif default_tool["pt"] and lfEval("executable('pt')") == '1':
             wildignore = lfEval("g:Lf_WildIgnore")
             ignore = ""
@@ -413,9 +521,10 @@ class FileExplorer(Explorer):
                 no_ignore = ""
 
             if cd_cmd:
-                cmd = cd_cmd + 'ag --nocolor --silent %s %s %s %s -g ""' % (ignore, followlinks, show_hidden, no_ignore)
+                cmd = cd_cmd + 'ag --nocolor --silent --null %s %s %s %s -g ""' % (ignore, followlinks, show_hidden, no_ignore)
             else:
-                cmd = 'ag --nocolor --silent %s %s %s %s -g "" "%s"' % (ignore, followlinks, show_hidden, no_ignore, dir)
+                cmd = 'ag --nocolor --silent --null %s %s %s %s -g "" "%s"' % (ignore, followlinks, show_hidden, no_ignore, dir)
+            self._cmd_separator = b"\0"
         elif default_tool["find"] and lfEval("executable('find')") == '1' \
                 and lfEval("executable('sed')") == '1' and os.name != 'nt':
             wildignore = lfEval("g:Lf_WildIgnore")
@@ -472,112 +581,154 @@ class FileExplorer(Explorer):
     @removeDevIcons
     def _writeCache(self, content):
         dir = self._cur_dir if self._cur_dir.endswith(os.sep) else self._cur_dir + os.sep
-        with lfOpen(self._cache_index, 'r+', errors='ignore') as f:
-            lines = f.readlines()
-            target = -1
-            for i, line in enumerate(lines):
-                if dir == line.split(None, 2)[2].strip():
-                    target = i
-                    break
-
-            if target != -1:    # already cached
-                if time.time() - self._cmd_start_time <= float(lfEval("g:Lf_NeedCacheTime")):
-                    os.remove(os.path.join(self._cache_dir, lines[target].split(None, 2)[1]))
-                    del lines[target]
-                    f.seek(0)
-                    f.truncate(0)
-                    f.writelines(lines)
-                    return
-
-                # update the time
-                lines[target] = re.sub(r'^\S*',
-                                       '%.3f' % time.time(),
-                                       lines[target])
-                f.seek(0)
-                f.truncate(0)
-                f.writelines(lines)
-                with lfOpen(os.path.join(self._cache_dir,
-                                         lines[target].split(None, 2)[1]),
-                            'w', errors='ignore') as cache_file:
-                    for line in content:
-                        cache_file.write(line + '\n')
-            else:
-                if time.time() - self._cmd_start_time <= float(lfEval("g:Lf_NeedCacheTime")):
-                    return
-
-                cache_file_name = ''
-                if len(lines) < int(lfEval("g:Lf_NumberOfCache")):
-                    f.seek(0, 2)
-                    ts = time.time()
-                    # e.g., line = "1496669495.329 cache_1496669495.329 /foo/bar"
-                    line = '%.3f cache_%.3f %s\n' % (ts, ts, dir)
-                    f.write(line)
-                    cache_file_name = 'cache_%.3f' % ts
-                else:
-                    timestamp = lines[0].split(None, 2)[0]
-                    oldest = 0
-                    for i, line in enumerate(lines):
-                        if line.split(None, 2)[0] < timestamp:
-                            timestamp = line.split(None, 2)[0]
-                            oldest = i
-                    cache_file_name = lines[oldest].split(None, 2)[1].strip()
-                    lines[oldest] = '%.3f %s %s\n' % (time.time(), cache_file_name, dir)
-
-                    f.seek(0)
-                    f.truncate(0)
-                    f.writelines(lines)
-
-                with lfOpen(os.path.join(self._cache_dir, cache_file_name),
-                            'w', errors='ignore') as cache_file:
-                    for line in content:
-                        cache_file.write(line + '\n')
+        if time.time() - self._cmd_start_time <= float(lfEval("g:Lf_NeedCacheTime")):
+            # it is fast enough without the cache
+            self._cache_index.remove(dir)
+            return
+
+        cache_file_name = self._cache_index.add(dir, int(lfEval("g:Lf_NumberOfCache")))
+        writeFileList(cache_file_name, dir, content)
+        if self._external_cmd is None:
+            writeDirMtimes(cache_file_name, self._walk_mtimes)
+        else:
+            # the external command may ignore files by its own rules, it is always rerun
+            writeDirMtimes(cache_file_name, None)
 
     @showDevIcons
     def _getFilesFromCache(self):
         dir = self._cur_dir if self._cur_dir.endswith(os.sep) else self._cur_dir + os.sep
-        with lfOpen(self._cache_index, 'r+', errors='ignore') as f:
-            lines = f.readlines()
-            target = -1
-            for i, line in enumerate(lines):
-                if dir == line.split(None, 2)[2].strip():
-                    target = i
-                    break
-
-            if target != -1:    # already cached
-                # update the time
-                lines[target] = re.sub(r'^\S*',
-                                       '%.3f' % time.time(),
-                                       lines[target])
-                f.seek(0)
-                f.truncate(0)
-                f.writelines(lines)
-                with lfOpen(os.path.join(self._cache_dir,
-                                         lines[target].split(None, 2)[1]),
-                            'r', errors='ignore') as cache_file:
-                    file_list = cache_file.readlines()
-                    if not file_list: # empty
-                        return None
-
-                    if lfEval("g:Lf_ShowRelativePath") == '1':
-                        if os.path.isabs(file_list[0]):
-                            # os.path.relpath() is too slow!
-                            cwd_length = len(lfEncode(dir))
-                            if not dir.endswith(os.sep):
-                                cwd_length += 1
-                            return [line[cwd_length:] for line in file_list]
-                        else:
-                            return file_list
-                    else:
-                        if os.path.isabs(file_list[0]):
-                            return file_list
-                        else:
-                            return [os.path.join(lfEncode(dir), file) for file in file_list]
+        cache_file_name = self._cache_index.find(dir)
+        if cache_file_name is None:
+            return None
+
+        try:
+            is_relative, file_list = readFileList(cache_file_name)
+        except IOError:
+            return None
+
+        if not file_list: # empty
+            return None
+
+        if lfEval("g:Lf_ShowRelativePath") == '1':
+            if is_relative:
+                return file_list
             else:
-                return None
+                # os.path.relpath() is too slow!
+                cwd_length = len(lfEncode(dir))
+                if not dir.endswith(os.sep):
+                    cwd_length += 1
+                return [line[cwd_length:] for line in file_list]
+        else:
+            if is_relative:
+                return [os.path.join(lfEncode(dir), file) for file in file_list]
+            else:
+                return file_list
+
+    def _getDirPrefix(self, dir):
+        """
+        return the prefix of the paths under `dir` when several directories are searched.
+        """
+        if lfEval("g:Lf_ShowRelativePath") == '1':
+            dir = os.path.relpath(dir)
+            if dir == '.':
+                return ''
+        return lfEncode(dir) + os.sep
+
+    def _readDirCache(self, dir):
+        """
+        return the files of `dir` relative to it, None if `dir` is not cached.
+        """
+        cache_file_name = self._cache_index.find(dir + os.sep)
+        if cache_file_name is None:
+            return None
+
+        try:
+            is_relative, file_list = readFileList(cache_file_name)
+        except IOError:
+            return None
+
+        if not file_list or not is_relative:
+            return None
+        return file_list
+
+    def _writeDirCaches(self):
+        """
+        cache the files of each directory searched as if it were searched alone.
+        """
+        need_cache_time = float(lfEval("g:Lf_NeedCacheTime"))
+        number_of_cache = int(lfEval("g:Lf_NumberOfCache"))
+        for dir, lines in self._dir_files.items():
+            elapsed = self._dir_elapsed.get(dir)
+            if elapsed is None: # interrupted
+                continue
+
+            if elapsed <= need_cache_time:
+                # it is fast enough without the cache
+                self._cache_index.remove(dir + os.sep)
+                continue
+
+            prefix = self._dir_prefixes[dir]
+            prefix_len = len(prefix)
+            cache_file_name = self._cache_index.add(dir + os.sep, number_of_cache)
+            writeFileList(cache_file_name, dir + os.sep,
+                          [line[prefix_len:] if line.startswith(prefix) else line for line in lines])
+            writeDirMtimes(cache_file_name, None)
+
+        self._dir_files = {}
+        self._dir_elapsed = {}
+
+    def _mergeDirOutputs(self, outputs, formatter, cached):
+        """
+        read the outputs of the commands of several directories concurrently, and return
+        a generator of the lists of lines in the order they arrive, so that it takes as
+        long as the slowest one. `cached` is the list of the lines yielded first.
+        the lines of each directory are also kept in self._dir_files to be cached.
+        """
+        queue = Queue.Queue()
+
+        def read(dir, output):
+            lines = self._dir_files[dir]
+            start_time = time.time()
+            try:
+                for chunk in output.chunks():
+                    lines.extend(chunk)
+                    queue.put((0, chunk))
+                self._dir_elapsed[dir] = time.time() - start_time
+                queue.put((1, None))
+            except Exception:
+                queue.put((2, sys.exc_info()))
+
+        def merge():
+            if cached:
+                yield [formatter(line) for line in cached] if formatter else cached
+
+            running = len(outputs)
+            while running > 0:
+                kind, value = queue.get()
+                if kind == 0:
+                    yield [formatter(line) for line in value] if formatter else value
+                elif kind == 1:
+                    running -= 1
+                else:
+                    raise value[1]
+
+        for dir, output in outputs:
+            self._dir_files[dir] = []
+            t = threading.Thread(target=read, args=(dir, output))
+            t.daemon = True
+            t.start()
+
+        return merge()
 
     def setContent(self, content):
         self._content = content
-        if lfEval("g:Lf_UseCache") == '1':
+        if isinstance(self._cur_dir, set):
+            if lfEval("g:Lf_UseCache") == '1':
+                self._writeDirCaches()
+            return
+
+        # the files walked are always cached if it takes long, as _getFileList() does
+        if lfEval("g:Lf_UseCache") == '1' or self._external_cmd is None:
             self._writeCache(content)
 
     def getContentFromMultiDirs(self, dirs, **kwargs):
@@ -592,32 +743,53 @@ class FileExplorer(Explorer):
         if arg_changes or lfEval("g:Lf_UseMemoryCache") == '0' or dirs != self._cur_dir or \
                 not self._content:
             self._cur_dir = dirs
+            self._dir_files = {}
+            self._dir_elapsed = {}
+            self._dir_prefixes = {}
 
-            cmd = ''
+            use_cache = lfEval("g:Lf_UseCache") == '1' and kwargs.get("refresh", False) == False
+            cached = []
+            outputs = []
             for dir in dirs:
                 if not os.path.exists(dir):
                     lfCmd("echoe ' Unknown directory `%s`'" % dir)
                     return None
 
+                prefix = self._getDirPrefix(dir)
+                self._dir_prefixes[dir] = prefix
+                if use_cache:
+                    file_list = self._readDirCache(dir)
+                    if file_list is not None:
+                        cached.append([prefix + line for line in file_list])
+                        continue
+
+                # each directory is indexed by its own process
                 command = self._buildCmd(dir, **kwargs)
                 if command:
-                    if cmd == '':
-                        cmd = command
+                    executor = AsyncExecutor()
+                    self._executor.append(executor)
+                    if command.split(None, 1)[0] == "dir":
+                        outputs.append((dir, executor.execute(command, chunked=True)))
                     else:
-                        cmd += ' && ' + command
+                        outputs.append((dir, executor.execute(command, encoding=lfEval("&encoding"),
+                                                              chunked=True,
+                                                              separator=self._cmd_separator)))
 
-            if cmd:
-                executor = AsyncExecutor()
-                self._executor.append(executor)
-                if cmd.split(None, 1)[0] == "dir":
-                    content = executor.execute(cmd, format_line)
-                else:
-                    if lfEval("get(g:, 'Lf_ShowDevIcons', 1)") == "1":
-                        content = executor.execute(cmd, encoding=lfEval("&encoding"), format_line=format_line)
-                    else:
-                        content = executor.execute(cmd, encoding=lfEval("&encoding"))
+            if lfEval("get(g:, 'Lf_ShowDevIcons', 1)") == "1":
+                formatter = format_line
+            else:
+                formatter = None
+
+            if outputs:
+                content = AsyncExecutor.Result(self._mergeDirOutputs(outputs, formatter,
+                                                                     list(itertools.chain.from_iterable(cached))),
+                                               chunked=True)
                 self._cmd_start_time = time.time()
                 return content
+            elif cached:
+                self._content = list(itertools.chain.from_iterable(cached))
+                if formatter:
+                    self._content = [formatter(line) for line in self._content]
 
         return self._content
 
@@ -657,6 +829,9 @@ class FileExplorer(Explorer):
         if arg_changes or lfEval("g:Lf_UseMemoryCache") == '0' or dir != self._cur_dir or \
                 not self._content:
             self._cur_dir = dir
+            self._walk_mtimes = None
+            self._walk_files = None
+            self._startWatcher(dir)
 
             cmd = self._buildCmd(dir, **kwargs)
             lfCmd("let g:Lf_Debug_Cmd = '%s'" % escQuote(cmd))
@@ -675,17 +850,44 @@ class FileExplorer(Explorer):
                     content = executor.execute(cmd, format_line)
                 else:
                     if lfEval("get(g:, 'Lf_ShowDevIcons', 1)") == "1":
-                        content = executor.execute(cmd, encoding=lfEval("&encoding"), format_line=format_line)
+                        content = executor.execute(cmd, encoding=lfEval("&encoding"),
+                                                   format_line=format_line, chunked=True,
+                                                   separator=self._cmd_separator)
                     else:
-                        content = executor.execute(cmd, encoding=lfEval("&encoding"))
+                        content = executor.execute(cmd, encoding=lfEval("&encoding"), chunked=True,
+                                                   separator=self._cmd_separator)
                 self._cmd_start_time = time.time()
                 return content
             else:
+                cache_dir = dir if dir.endswith(os.sep) else dir + os.sep
+                if self._cache_index.findAncestor(cache_dir) is None:
+                    return self._walkFiles(dir)
                 self._content = self._getFileList(dir)
+        else:
+            changed, changed_dirs = self._takeWatchedChanges(dir)
+            if changed:
+                if self._external_cmd:
+                    # the ignore rules of the external command are unknown, rerun it
+                    self._content = []
+                    kwargs["refresh"] = True
+                    return self.getContent(*args, **kwargs)
+
+                cache_dir = dir if dir.endswith(os.sep) else dir + os.sep
+                if self._walk_mtimes and self._cache_index.findAncestor(cache_dir) is None:
+                    # the walk was too fast to be cached on disk, patch the files walked
+                    self._walk_files = self._updateFiles(self._walk_files, self._walk_mtimes,
+                                                         changed_dirs)
+                    self._content = self._getWalkedFiles(dir)
+                else:
+                    self._refresh(changed_dirs)
+                    self._content = self._getFileList(dir)
 
         return self._content
 
     def getFreshContent(self, *args, **kwargs):
+        if not isinstance(self._cur_dir, set):
+            # the changes are all picked up by the refresh
+            self._takeWatchedChanges(self._cur_dir)
         if self._external_cmd:
             self._content = []
             kwargs["refresh"] = True
@@ -714,6 +916,9 @@ class FileExplorer(Explorer):
         for exe in self._executor:
             exe.killProcess()
         self._executor = []
+        if self._walker is not None:
+            self._walker.cancel()
+            self._walker = None
 
 
 #*****************************************************
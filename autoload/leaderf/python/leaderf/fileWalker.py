@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import os.path
+import re
+import sys
+import time
+import fnmatch
+import threading
+from .utils import *
+
+if sys.version_info >= (3, 0):
+    import queue as Queue
+else:
+    import Queue
+
+
+def compilePatterns(patterns):
+    """
+    compile the glob patterns into one regex, return None if `patterns` is empty.
+    the regex matches a name as fnmatch.fnmatch() does.
+    """
+    if not patterns:
+        return None
+    # fnmatch.fnmatch() is case-insensitive on Windows
+    flags = re.IGNORECASE if os.name == 'nt' else 0
+    return re.compile('|'.join('(?:%s)' % fnmatch.translate(p) for p in patterns), flags)
+
+
+#*****************************************************
+# FileWalker
+#*****************************************************
+class FileWalker(object):
+    """
+    walk the directory tree with os.scandir() in several threads, the files of a
+    directory are yielded as soon as it is listed.
+    no vim function is called while walking, so walk() can be consumed in a
+    background thread.
+    """
+    THREAD_COUNT = 4
+
+    def __init__(self, ignore_dirs, ignore_files, follow_links, time_limit):
+        self._ignore_dir = compilePatterns(ignore_dirs)
+        self._ignore_file = compilePatterns(ignore_files)
+        self._follow_links = follow_links
+        self._time_limit = time_limit
+        self._cancelled = False
+
+    def isIgnoredDir(self, name):
+        return self._ignore_dir is not None and self._ignore_dir.match(name) is not None
+
+    def isIgnoredFile(self, name):
+        return self._ignore_file is not None and self._ignore_file.match(name) is not None
+
+    if hasattr(os, 'scandir'):
+        def listDir(self, dir):
+            """
+            return a tuple (dirs, files) of the paths in `dir` that are not ignored,
+            symbolic links to directories are in `dirs` only if they are followed.
+            """
+            dirs = []
+            files = []
+            for entry in os.scandir(dir):
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+
+                if is_dir:
+                    if (not self.isIgnoredDir(entry.name)
+                            and (self._follow_links or not entry.is_symlink())):
+                        dirs.append(entry.path)
+                elif not self.isIgnoredFile(entry.name):
+                    files.append(entry.path)
+            return (dirs, files)
+    else:
+        def listDir(self, dir):
+            """
+            return a tuple (dirs, files) of the paths in `dir` that are not ignored,
+            symbolic links to directories are in `dirs` only if they are followed.
+            """
+            dirs = []
+            files = []
+            for name in os.listdir(dir):
+                path = os.path.join(dir, name)
+                if os.path.isdir(path):
+                    if (not self.isIgnoredDir(name)
+                            and (self._follow_links or not os.path.islink(path))):
+                        dirs.append(path)
+                elif not self.isIgnoredFile(name):
+                    files.append(path)
+            return (dirs, files)
+
+    def walk(self, root, dir_mtimes=None):
+        """
+        yield the paths of the files under `root`.
+        if `dir_mtimes` is not None, the mtimes of the directories walked are recorded in it,
+        it is cleared if the walk is stopped by the time limit or cancelled.
+        """
+        start_time = time.time()
+        dir_queue = Queue.Queue()
+        result_queue = Queue.Queue()
+        stopped = threading.Event()
+        lock = threading.Lock()
+        pending = [1]
+
+        def worker():
+            while True:
+                dir = dir_queue.get()
+                if dir is None:
+                    return
+
+                try:
+                    dirs, files, mtime = [], [], None
+                    if not stopped.is_set():
+                        try:
+                            dirs, files = self.listDir(dir)
+                            if dir_mtimes is not None:
+                                mtime = os.stat(dir).st_mtime
+                        except OSError:
+                            pass
+
+                    with lock:
+                        pending[0] += len(dirs)
+                    for d in dirs:
+                        dir_queue.put(d)
+                    result_queue.put((dir, mtime, files))
+                finally:
+                    with lock:
+                        pending[0] -= 1
+                        done = pending[0] == 0
+                    if done:
+                        result_queue.put(None)
+
+        threads = []
+        for _ in range(self.THREAD_COUNT):
+            t = threading.Thread(target=worker)
+            t.daemon = True
+            t.start()
+            threads.append(t)
+
+        dir_queue.put(root)
+        try:
+            while True:
+                item = result_queue.get()
+                if item is None:
+                    return
+
+                if self._cancelled:
+                    if dir_mtimes is not None:
+                        # the walk is incomplete
+                        dir_mtimes.clear()
+                    return
+
+                dir, mtime, files = item
+                if mtime is not None:
+                    # the key is the same as os.path.dirname() of the files in it
+                    dir_mtimes[lfEncode(os.path.normpath(dir))] = mtime
+                for file in files:
+                    yield lfEncode(file)
+
+                if time.time() - start_time > self._time_limit:
+                    if dir_mtimes is not None:
+                        # the walk is incomplete, it can not be refreshed incrementally
+                        dir_mtimes.clear()
+                    return
+        finally:
+            stopped.set()
+            for _ in threads:
+                dir_queue.put(None)
+
+    def cancel(self):
+        self._cancelled = True
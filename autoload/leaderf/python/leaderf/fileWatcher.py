@@ -0,0 +1,356 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import os.path
+import sys
+import time
+import errno
+import fnmatch
+import select
+import struct
+import threading
+
+try:
+    import ctypes
+    import ctypes.util
+except ImportError:
+    ctypes = None
+
+
+def _encodePath(path):
+    if sys.version_info >= (3, 0):
+        return path.encode(sys.getfilesystemencoding(), 'surrogateescape')
+    return path
+
+def _decodePath(path):
+    if sys.version_info >= (3, 0):
+        return path.decode(sys.getfilesystemencoding(), 'surrogateescape')
+    return path
+
+
+class _LimitExceeded(Exception):
+    pass
+
+
+#*****************************************************
+# Inotify
+#*****************************************************
+class Inotify(object):
+    """
+    a minimal wrapper of the inotify API of Linux.
+    """
+    IN_MOVED_FROM   = 0x00000040
+    IN_MOVED_TO     = 0x00000080
+    IN_CREATE       = 0x00000100
+    IN_DELETE       = 0x00000200
+    IN_DELETE_SELF  = 0x00000400
+    IN_MOVE_SELF    = 0x00000800
+    IN_Q_OVERFLOW   = 0x00004000
+    IN_IGNORED      = 0x00008000
+    IN_ONLYDIR      = 0x01000000
+    IN_DONT_FOLLOW  = 0x02000000
+    IN_EXCL_UNLINK  = 0x04000000
+    IN_ISDIR        = 0x40000000
+
+    IN_NONBLOCK     = 0o4000
+    IN_CLOEXEC      = 0o2000000
+
+    _EVENT = struct.Struct('iIII')
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self._fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            self._raise()
+
+    def _raise(self):
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+
+    def addWatch(self, path, mask):
+        wd = self._add_watch(self._fd, _encodePath(path), mask)
+        if wd < 0:
+            self._raise()
+        return wd
+
+    def removeWatch(self, wd):
+        self._rm_watch(self._fd, wd)
+
+    def readEvents(self, timeout):
+        """
+        return a list of (wd, mask, name) of the events that arrive in `timeout` seconds.
+        """
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return []
+
+        try:
+            data = os.read(self._fd, 65536)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return []
+            raise
+
+        events = []
+        i = 0
+        size = self._EVENT.size
+        while i + size <= len(data):
+            wd, mask, _, length = self._EVENT.unpack_from(data, i)
+            i += size
+            name = data[i:i+length].rstrip(b'\0')
+            i += length
+            events.append((wd, mask, _decodePath(name)))
+        return events
+
+    def close(self):
+        os.close(self._fd)
+
+
+#*****************************************************
+# FileWatcher
+#*****************************************************
+class FileWatcher(threading.Thread):
+    """
+    watch the directories under `root` in a background thread, the directories in which
+    files are created, removed or renamed are collected and taken by the main thread
+    with takeChanges().
+    inotify is used on Linux, otherwise the mtimes of the directories are polled.
+    no more than `max_dirs` directories are watched, the watcher stops if there are more.
+    no vim function is called in the thread.
+    """
+    # if more directories are changed before they are taken, all of them are checked
+    MAX_PENDING = 4096
+
+    INOTIFY_MASK = (Inotify.IN_CREATE | Inotify.IN_DELETE | Inotify.IN_MOVED_FROM
+                    | Inotify.IN_MOVED_TO | Inotify.IN_DELETE_SELF | Inotify.IN_MOVE_SELF
+                    | Inotify.IN_ONLYDIR | Inotify.IN_EXCL_UNLINK)
+
+    def __init__(self, root, ignore_dirs, follow_links, max_dirs, latency):
+        super(FileWatcher, self).__init__()
+        self.daemon = True
+        self._root = os.path.normpath(root)
+        self._ignore_dirs = ignore_dirs
+        self._follow_links = follow_links
+        self._max_dirs = max_dirs
+        self._latency = latency
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._overflowed = False
+        self._pending_time = None
+        self._backend = None
+        self._state = "starting"
+        self._dir_count = 0
+        self._event_count = 0
+        self._overflow_count = 0
+        self._last_age = 0.0
+        self.start()
+
+    def run(self):
+        try:
+            if ctypes is not None and sys.platform.startswith('linux'):
+                try:
+                    inotify = Inotify()
+                except (OSError, AttributeError):
+                    inotify = None
+
+                if inotify is not None:
+                    try:
+                        self._runInotify(inotify)
+                    finally:
+                        inotify.close()
+                    return
+
+            self._runPolling()
+        except _LimitExceeded:
+            self._state = "too many directories"
+        except Exception:
+            self._state = "failed"
+
+    def _isIgnored(self, name):
+        return True in (fnmatch.fnmatch(name, j) for j in self._ignore_dirs)
+
+    def _walk(self, dir):
+        """
+        yield `dir` and the directories under it that are not ignored.
+        """
+        for dir_path, dirs, _ in os.walk(dir, followlinks=self._follow_links):
+            if self._stopping.is_set():
+                return
+            dirs[:] = [i for i in dirs if not self._isIgnored(i)]
+            yield os.path.normpath(dir_path)
+
+    def _runInotify(self, inotify):
+        self._backend = "inotify"
+        mask = self.INOTIFY_MASK
+        if not self._follow_links:
+            mask |= Inotify.IN_DONT_FOLLOW
+        watches = {}
+
+        def watchTree(dir):
+            for path in self._walk(dir):
+                if len(watches) >= self._max_dirs:
+                    raise _LimitExceeded()
+                try:
+                    watches[inotify.addWatch(path, mask)] = path
+                except OSError as e:
+                    if e.errno == errno.ENOSPC: # fs.inotify.max_user_watches
+                        raise _LimitExceeded()
+                    # removed or not accessible
+                self._dir_count = len(watches)
+
+        watchTree(self._root)
+        self._setRunning()
+        while not self._stopping.is_set():
+            changed = set()
+            overflowed = False
+            for wd, event_mask, name in inotify.readEvents(self._latency):
+                self._event_count += 1
+                if event_mask & Inotify.IN_Q_OVERFLOW:
+                    overflowed = True
+                    continue
+
+                if event_mask & Inotify.IN_IGNORED:
+                    watches.pop(wd, None)
+                    self._dir_count = len(watches)
+                    continue
+
+                dir = watches.get(wd)
+                if dir is None:
+                    continue
+
+                changed.add(dir)
+                # IN_MOVE_SELF is not handled, the watch must not be removed: if the directory
+                # is renamed in the tree, IN_MOVED_TO of the parent arrives first and watchTree()
+                # gets the same wd and updates its path, a watch really gone gets IN_IGNORED.
+                if event_mask & Inotify.IN_ISDIR:
+                    path = os.path.join(dir, name)
+                    if event_mask & (Inotify.IN_CREATE | Inotify.IN_MOVED_TO):
+                        if not self._isIgnored(name):
+                            watchTree(path)
+                    elif event_mask & (Inotify.IN_DELETE | Inotify.IN_MOVED_FROM):
+                        changed.add(path)
+
+            self._addChanges(changed, overflowed)
+
+    def _runPolling(self):
+        self._backend = "polling"
+        mtimes = {}
+
+        def pollTree(dir):
+            for path in self._walk(dir):
+                if len(mtimes) >= self._max_dirs:
+                    raise _LimitExceeded()
+                try:
+                    mtimes[path] = os.stat(path).st_mtime
+                except OSError:
+                    pass
+                self._dir_count = len(mtimes)
+
+        pollTree(self._root)
+        self._setRunning()
+        # stat() all the directories is much more expensive than waiting for inotify
+        while not self._stopping.wait(self._latency * 10):
+            changed = set()
+            for dir, mtime in list(mtimes.items()):
+                if self._stopping.is_set():
+                    return
+                try:
+                    cur_mtime = os.stat(dir).st_mtime
+                except OSError: # removed
+                    del mtimes[dir]
+                    changed.add(dir)
+                    continue
+
+                if cur_mtime == mtime:
+                    continue
+
+                mtimes[dir] = cur_mtime
+                changed.add(dir)
+                try:
+                    names = os.listdir(dir)
+                except OSError:
+                    continue
+                for name in names:
+                    path = os.path.join(dir, name)
+                    if (path not in mtimes and os.path.isdir(path) and not self._isIgnored(name)
+                            and (self._follow_links or not os.path.islink(path))):
+                        pollTree(path)
+
+            self._dir_count = len(mtimes)
+            self._addChanges(changed)
+
+    def _setRunning(self):
+        """
+        the files created in a directory before it is watched are missed, e.g., while the
+        directories are walked by the explorer at the same time, so the first
+        takeChanges() returns None to have all the directories checked.
+        """
+        with self._lock:
+            if self._pending_time is None:
+                self._pending_time = time.time()
+            self._overflowed = True
+            self._pending.clear()
+        self._state = "running"
+
+    def _addChanges(self, dirs, overflowed=False):
+        if not dirs and not overflowed:
+            return
+
+        with self._lock:
+            if self._pending_time is None:
+                self._pending_time = time.time()
+            self._pending.update(dirs)
+            if overflowed or len(self._pending) > self.MAX_PENDING:
+                if not self._overflowed:
+                    self._overflow_count += 1
+                self._overflowed = True
+                self._pending.clear()
+
+    def getRoot(self):
+        return self._root
+
+    def isWatching(self, dir):
+        """
+        return True if the changes under `dir` are being watched.
+        """
+        return (self._state in ("starting", "running") and self.is_alive()
+                and os.path.normpath(dir) == self._root)
+
+    def hasChanges(self):
+        with self._lock:
+            return self._overflowed or len(self._pending) > 0
+
+    def takeChanges(self):
+        """
+        return the set of the directories changed since the last call, None if the changes
+        are too many to be tracked, i.e., all the directories should be checked.
+        """
+        with self._lock:
+            dirs = None if self._overflowed else self._pending
+            self._pending = set()
+            self._overflowed = False
+            if self._pending_time is not None:
+                self._last_age = time.time() - self._pending_time
+                self._pending_time = None
+            return dirs
+
+    def getStats(self):
+        with self._lock:
+            return {
+                    "root": self._root,
+                    "backend": self._backend,
+                    "state": self._state,
+                    "dirs": self._dir_count,
+                    "events": self._event_count,
+                    "pending": len(self._pending),
+                    "overflows": self._overflow_count,
+                    "age_ms": int(self._last_age * 1000),
+                    }
+
+    def stop(self):
+        self._stopping.set()
@@ -4,10 +4,13 @@
 import vim
 import os
 import re
+import sys
 import os.path
+import hashlib
 from leaderf.utils import *
 from leaderf.explorer import *
 from leaderf.manager import *
+from leaderf.fileCache import readSnapshot, writeSnapshot
 
 
 #*****************************************************
@@ -17,18 +20,56 @@ class HelpExplorer(Explorer):
     def __init__(self):
         self._content = []
         self._file_ids = {}
+        self._snapshot = os.path.join(lfEval("g:Lf_CacheDirectory"),
+                                      'LeaderF',
+                                      'python' + lfEval("g:Lf_PythonVersion"),
+                                      'help',
+                                      'snapshot')
+
+    def _getToken(self, dirs):
+        """
+        return a token that changes if &rtp or any file in the doc directories changes,
+        so that `helptags ALL` and reading the tags files can be skipped in a new vim.
+        """
+        stats = []
+        for dir in dirs:
+            doc_dir = os.path.join(dir, "doc")
+            stats.append(doc_dir)
+            try:
+                for name in sorted(os.listdir(doc_dir)):
+                    stats.append("%s %r" % (name, os.path.getmtime(os.path.join(doc_dir, name))))
+            except OSError:
+                pass
+
+        stats = '\n'.join(stats)
+        if sys.version_info >= (3, 0):
+            stats = stats.encode('utf-8', errors='surrogateescape')
+        return hashlib.md5(stats).hexdigest()
+
+    def _setFileIds(self, dirs):
+        self._file_ids = {}
+        for file_id, dir in enumerate(dirs):
+            self._file_ids[file_id] = os.path.join(dir, "doc")
 
     def getContent(self, *args, **kwargs):
         if self._content:
             return self._content
-        else:
-            return self.getFreshContent()
+
+        if lfEval("g:Lf_UseCache") == '1':
+            dirs = lfEval("&rtp").split(',')
+            content = readSnapshot(self._snapshot, self._getToken(dirs))
+            if content:
+                self._content = content
+                self._setFileIds(dirs)
+                return self._content
+
+        return self.getFreshContent()
 
     def getFreshContent(self, *args, **kwargs):
         self._content = []
         lfCmd("silent! helptags ALL")
-        file_id = 0
-        for dir in lfEval("&rtp").split(','):
+        dirs = lfEval("&rtp").split(',')
+        for file_id, dir in enumerate(dirs):
             tags_file = os.path.join(dir, "doc", "tags")
             try:
                 with lfOpen(tags_file, 'r', errors='ignore') as f:
@@ -39,8 +80,12 @@ class HelpExplorer(Explorer):
             except IOError:
                 pass
 
-            self._file_ids[file_id] = os.path.dirname(tags_file)
-            file_id += 1
+        self._setFileIds(dirs)
+        if lfEval("g:Lf_UseCache") == '1':
+            try:
+                writeSnapshot(self._snapshot, self._getToken(dirs), self._content)
+            except (IOError, OSError):
+                pass
 
         return self._content
 
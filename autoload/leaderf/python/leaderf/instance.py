@@ -7,6 +7,8 @@ import os
 import os.path
 import time
 import itertools
+from collections import OrderedDict
+from contextlib import contextmanager
 from .utils import *
 from .devicons import (
     webDevIconsGetFileTypeSymbol,
@@ -279,6 +281,10 @@ class LfInstance(object):
         self._auto_adjust_height = lfEval("get(g:, 'Lf_PopupAutoAdjustHeight', 1)") == '1'
         self._preview_position = None
         self._initial_maxwidth = 0
+        self._has_nvim = lfEval("has('nvim')") == '1'
+        self._stl_updates = None
+        self._stl_redraw = False
+        self._stl_build_prompt = False
 
     def _initStlVar(self):
         if int(lfEval("!exists('g:Lf_{}_StlCategory')".format(self._category))):
@@ -1135,34 +1141,81 @@ class LfInstance(object):
     def setStlCwd(self, cwd):
         lfCmd("let g:Lf_{}_StlCwd = '{}'".format(self._category, cwd))
 
+    def _setStlVar(self, name, value):
+        """
+        `value` is a vim expression.
+        """
+        cmd = "let g:Lf_{}_{} = {}".format(self._category, name, value)
+        if self._stl_updates is None:
+            lfCmd(cmd)
+        else:
+            self._stl_updates[name] = cmd
+
+    @contextmanager
+    def batchStlUpdates(self):
+        """
+        defer the updates of the statusline in the block until the block ends, then
+        apply them in one vim command, each variable is set and the statusline is
+        redrawn at most once no matter how many times they are updated in the block.
+        """
+        if self._stl_updates is not None:
+            yield
+            return
+
+        self._stl_updates = OrderedDict()
+        self._stl_redraw = False
+        self._stl_build_prompt = False
+        try:
+            yield
+        finally:
+            cmds = list(self._stl_updates.values())
+            if self._stl_redraw:
+                cmds.append("redrawstatus")
+            build_prompt = self._stl_build_prompt
+            self._stl_updates = None
+
+            if cmds:
+                lfCmd(" | ".join(cmds))
+            if build_prompt:
+                self._cli.buildPopupPrompt()
+
+    def redrawStatusline(self):
+        if self._stl_updates is None:
+            lfCmd("redrawstatus")
+        else:
+            self._stl_redraw = True
+
     def setStlTotal(self, total):
-        lfCmd("let g:Lf_{}_StlTotal = '{}'".format(self._category, total))
+        self._setStlVar("StlTotal", "'{}'".format(total))
 
     def setStlResultsCount(self, count, check_ignored=False):
         if check_ignored and self._cur_buffer_name_ignored:
             count -= 1
-        lfCmd("let g:Lf_{}_StlResultsCount = '{}'".format(self._category, count))
-        if lfEval("has('nvim')") == '1' and self._win_pos != 'floatwin':
-            lfCmd("redrawstatus")
+        self._setStlVar("StlResultsCount", "'{}'".format(count))
+        if self._has_nvim and self._win_pos != 'floatwin':
+            self.redrawStatusline()
 
         if self._win_pos in ('popup', 'floatwin'):
-            self._cli.buildPopupPrompt()
+            if self._stl_updates is None:
+                self._cli.buildPopupPrompt()
+            else:
+                self._stl_build_prompt = True
 
     def setStlRunning(self, running):
         if self._win_pos in ('popup', 'floatwin'):
             if running:
-                lfCmd("let g:Lf_{}_IsRunning = 1".format(self._category))
+                self._setStlVar("IsRunning", "1")
             else:
-                lfCmd("let g:Lf_{}_IsRunning = 0".format(self._category))
+                self._setStlVar("IsRunning", "0")
             return
 
         if running:
             spin = "{} ".format(self._cli._spin_symbols[self._running_status])
             self._running_status = (self._running_status + 1) % len(self._cli._spin_symbols)
-            lfCmd("let g:Lf_{}_StlRunning = '{}'".format(self._category, spin))
+            self._setStlVar("StlRunning", "'{}'".format(spin))
         else:
             self._running_status = 0
-            lfCmd("let g:Lf_{}_StlRunning = ''".format(self._category))
+            self._setStlVar("StlRunning", "''")
 
     def clearBufferObject(self):
         """
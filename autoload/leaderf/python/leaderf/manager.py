@@ -10,6 +10,7 @@ import operator
 import itertools
 import threading
 import multiprocessing
+from collections import OrderedDict
 from functools import partial
 from functools import wraps
 from .instance import LfInstance
@@ -55,6 +56,135 @@ else:
             return False
 
 
+def isNativePattern(module, pattern, encoding):
+    """
+    return True if the C extension `module` can match `pattern`,
+    a non-ascii pattern is matched as utf-8.
+    """
+    return isAscii(pattern) or (encoding == "utf-8" and getattr(module, "UNICODE_PATTERN", 0) == 1)
+
+
+class ChunkScheduler(object):
+    """
+    decide how many lines are filtered in one chunk, so that filtering a chunk
+    takes about g:Lf_FilterFrameBudget milliseconds.
+    the throughput is measured separately for each key, e.g., (category, backend).
+    """
+    def __init__(self):
+        self._budget = float(lfEval("get(g:, 'Lf_FilterFrameBudget', 16)")) / 1000
+        self._show_stats = lfEval("get(g:, 'Lf_ShowFilterStats', 0)") == '1'
+        self._rates = {}
+        self._stats = {}
+
+    def getStep(self, key, default):
+        """
+        return the number of lines of the next chunk, `default` is returned
+        if the throughput of `key` has not been measured yet.
+        """
+        rate = self._rates.get(key)
+        if rate is None:
+            return default
+        return int(min(max(rate * self._budget, 1000), default * 4))
+
+    def update(self, key, count, elapsed):
+        """
+        `count` lines have been filtered in `elapsed` seconds.
+        """
+        if count < 100 or elapsed <= 0:
+            return
+
+        rate = count / elapsed
+        if key in self._rates:
+            # exponential moving average, a single slow chunk does not matter much
+            rate = self._rates[key] * 0.7 + rate * 0.3
+        self._rates[key] = rate
+
+        if self._show_stats:
+            self._stats["/".join(str(i) for i in key)] = {
+                    "rate": int(rate),
+                    "count": count,
+                    "ms": int(elapsed * 1000),
+                    "budget": int(self._budget * 1000),
+                    }
+            lfCmd("let g:Lf_FilterStats = %s" % json.dumps(self._stats))
+
+
+class FilterJob(threading.Thread):
+    """
+    run filter_method(content) in a background thread, the result is collected
+    into a list of its own and is taken by the main thread when the job is done,
+    so that the input is not blocked while the lines are being filtered.
+    filter_method must not call any vim function.
+    """
+    def __init__(self, filter_method, content):
+        super(FilterJob, self).__init__()
+        self.daemon = True
+        self._filter_method = filter_method
+        self._content = content
+        self._cancelled = False
+        self._result = None
+        self._exception = None
+        self.start()
+
+    def run(self):
+        try:
+            result = []
+            for item in self._filter_method(self._content):
+                if self._cancelled:
+                    return
+                result.append(item)
+            self._result = result
+        except Exception:
+            self._exception = sys.exc_info()
+
+    def poll(self):
+        """
+        return True if the job is done.
+        """
+        return not self.is_alive()
+
+    def cancel(self):
+        self._cancelled = True
+
+    def getResult(self):
+        """
+        wait until the job is done and return the result.
+        """
+        self.join()
+        if self._exception is not None:
+            raise self._exception[1]
+        return self._result
+
+
+class ContentView(object):
+    """
+    a read-only view of content[:length], so that the content which is still
+    growing in the reader thread is not copied on each call of _search(),
+    only the lines sliced from the view are copied.
+    """
+    __slots__ = ("_content", "_length")
+
+    def __init__(self, content, length):
+        self._content = content
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return itertools.islice(self._content, self._length)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self._content[slice(*key.indices(self._length))]
+
+        if key < 0:
+            key += self._length
+        if key < 0 or key >= self._length:
+            raise IndexError("ContentView index out of range")
+        return self._content[key]
+
+
 def modifiableController(func):
     @wraps(func)
     def deco(self, *args, **kwargs):
@@ -102,6 +232,9 @@ def windo(func):
 # Manager
 #*****************************************************
 class Manager(object):
+    # the number of the lines whose highlight positions are cached
+    HIGHLIGHT_CACHE_SIZE = 10000
+
     def __init__(self):
         self._autochdir = 0
         self._cli = LfCli()
@@ -116,12 +249,26 @@ class Manager(object):
         self._highlight_pos_list = []
         self._highlight_refine_pos = []
         self._highlight_ids = []
+        self._highlight_cache = OrderedDict()
         self._orig_line = None
         self._fuzzy_engine = None
+        self._candidate_store = None
+        self._candidate_store_content = None
+        self._candidate_store_count = 0
+        self._use_top_k = False
+        self._match_job = None
+        self._chunk_scheduler = ChunkScheduler()
+        self._chunk_size = 0
         self._result_content = []
+        self._cb_content = []
+        self._cb_index = 0
+        self._result_key = None
+        self._result_stack = []
+        self._result_stack_content = None
         self._reader_thread = None
         self._timer_id = None
         self._highlight_method = lambda : None
+        self._regex_cache = (None, None)
         self._orig_cwd = None
         self._cursorline_dict = {}
         self._empty_query = lfEval("get(g:, 'Lf_EmptyQuery', 1)") == '1'
@@ -345,9 +492,15 @@ class Manager(object):
         self._getInstance().helpLength = self._help_length
         self.clearSelections()
         self._getExplorer().cleanup()
+        self._cancelMatchJob()
         if self._fuzzy_engine:
             fuzzyEngine.closeFuzzyEngine(self._fuzzy_engine)
             self._fuzzy_engine = None
+        self._candidate_store = None
+        self._candidate_store_content = None
+        self._result_stack = []
+        self._result_stack_content = None
+        self._highlight_cache.clear()
 
         if self._reader_thread and self._reader_thread.is_alive():
             self._stop_reader_thread = True
@@ -381,6 +534,7 @@ class Manager(object):
         if self._cli.pattern and self._index == 0:
             self._search(self._content)
             if len(self._getInstance().buffer) < len(self._result_content):
+                self._rankResults()
                 self._getInstance().appendBuffer(self._result_content[self._initial_count:])
 
     def _bangReadFinished(self):
@@ -1474,7 +1628,7 @@ class Manager(object):
         adjust = False
         if self._getInstance().isReverseOrder() and self._getInstance().getCurrentPos()[0] == 1:
             adjust = True
-            self._setResultContent()
+            self._growResultContent()
             if self._cli.pattern and self._cli.isFuzzy \
                     and len(self._highlight_pos) < (len(self._getInstance().buffer) - self._help_length) // self._getUnit() \
                     and len(self._highlight_pos) < int(lfEval("g:Lf_NumberOfHighlight")):
@@ -1502,8 +1656,8 @@ class Manager(object):
             return
 
         if not self._getInstance().isReverseOrder() \
-                and self._getInstance().getCurrentPos()[0] == self._initial_count:
-            self._setResultContent()
+                and self._getInstance().getCurrentPos()[0] >= len(self._getInstance().buffer):
+            self._growResultContent()
 
         if self._getInstance().window.cursor[0] == len(self._getInstance().buffer) and self._circular_scroll:
             lfCmd("noautocmd norm! gg")
@@ -1519,8 +1673,9 @@ class Manager(object):
             self._getInstance().refreshPopupStatusline()
             return
 
-        if self._getInstance().isReverseOrder():
-            self._setResultContent()
+        if self._getInstance().isReverseOrder() \
+                and self._getInstance().getCurrentPos()[0] <= self._getInstance().window.height:
+            self._growResultContent()
             if self._cli.pattern and self._cli.isFuzzy \
                     and len(self._highlight_pos) < (len(self._getInstance().buffer) - self._help_length) // self._getUnit() \
                     and len(self._highlight_pos) < int(lfEval("g:Lf_NumberOfHighlight")):
@@ -1536,8 +1691,10 @@ class Manager(object):
             self._getInstance().refreshPopupStatusline()
             return
 
-        if not self._getInstance().isReverseOrder():
-            self._setResultContent()
+        if not self._getInstance().isReverseOrder() \
+                and (self._getInstance().getCurrentPos()[0] + self._getInstance().window.height
+                     >= len(self._getInstance().buffer)):
+            self._growResultContent()
 
         lfCmd(r'noautocmd exec "norm! \<PageDown>"')
 
@@ -1608,11 +1765,15 @@ class Manager(object):
                 return False
 
     def _search(self, content, is_continue=False, step=0):
+        self._use_top_k = False
         if not is_continue:
+            self._cancelMatchJob()
             self.clearSelections()
             self._clearHighlights()
             self._clearHighlightsPos()
             self._cli.highlightMatches()
+            # the search goes on from where it stopped if the pattern was searched before
+            is_continue = self._switchResults(content)
 
         if not self._cli.pattern:   # e.g., when <BS> or <Del> is typed
             if self._empty_query and self._getExplorer().getStlCategory() in ["File"]:
@@ -1624,13 +1785,52 @@ class Manager(object):
             self._previewResult(False)
             return
 
+        start_time = time.time()
+        self._chunk_size = 0
         if self._cli.isFuzzy:
             self._fuzzySearch(content, is_continue, step)
         else:
             self._regexSearch(content, is_continue, step)
+        self._chunk_scheduler.update(self._getChunkKey(), self._chunk_size, time.time() - start_time)
 
         self._previewResult(False)
 
+    def _getChunkKey(self):
+        if self._fuzzy_engine:
+            backend = "fuzzyEngine"
+        elif is_fuzzyMatch_C:
+            backend = "fuzzyMatchC"
+        else:
+            backend = "python"
+
+        if not self._cli.isFuzzy:
+            mode = "regex"
+        elif self._cli.isAndMode:
+            mode = "and"
+        elif self._cli.isRefinement:
+            mode = "refine"
+        elif self._cli.isFullPath:
+            mode = "fullpath"
+        else:
+            mode = "name"
+
+        return (self._getExplorer().getStlCategory(), backend, mode)
+
+    def _getChunkStep(self, default):
+        """
+        return the number of lines to filter at a time, see ChunkScheduler.
+        """
+        return self._chunk_scheduler.getStep(self._getChunkKey(), default)
+
+    def _getIdleStep(self):
+        if self._fuzzy_engine:
+            step = 60000 * cpu_count
+        elif is_fuzzyMatch_C:
+            step = 10000
+        else:
+            step = 2000
+        return self._getChunkStep(step)
+
     def _filter(self, step, filter_method, content, is_continue,
                 use_fuzzy_engine=False, return_index=False):
         """ Construct a list from result of filter_method(content).
@@ -1644,30 +1844,51 @@ class Manager(object):
         unit = self._getUnit()
         step = step // unit * unit
         length = len(content)
+        match_result = None
+        if self._match_job is not None:
+            # the job has finished, see _workInIdle()
+            job = self._match_job[0]
+            self._match_job = None
+            if isinstance(job, FilterJob):
+                match_result = job.getResult()
+            else:
+                match_result = fuzzyEngine.getMatchJobResult(job)
+        # cur_content is content[begin:end] if source_range is not None
+        source_range = None
         if self._index == 0:
             self._cb_content = []
+            self._cb_index = 0
             self._result_content = []
             self._index = min(step, length)
             cur_content = content[:self._index]
+            source_range = (0, self._index)
         else:
+            # self._cb_content[self._cb_index:] are the lines left to be filtered again,
+            # do not modify the lists in place, they may be kept in self._result_stack
             if not is_continue and self._result_content:
                 if self._cb_content:
-                    self._cb_content += self._result_content
+                    self._cb_content = self._cb_content[self._cb_index:] + self._result_content
                 else:
                     self._cb_content = self._result_content
+                self._cb_index = 0
 
-            if len(self._cb_content) >= step:
-                cur_content = self._cb_content[:step]
-                self._cb_content = self._cb_content[step:]
+            cb_len = len(self._cb_content) - self._cb_index
+            if cb_len > step:
+                cur_content = self._cb_content[self._cb_index:self._cb_index + step]
+                self._cb_index += step
             else:
-                cur_content = self._cb_content
-                left = step - len(self._cb_content)
+                cur_content = self._cb_content[self._cb_index:]
+                left = step - cb_len
                 self._cb_content = []
+                self._cb_index = 0
                 if self._index < length:
                     end = min(self._index + left, length)
+                    if not cur_content:
+                        source_range = (self._index, end)
                     cur_content += content[self._index:end]
                     self._index = end
 
+        self._chunk_size = len(cur_content)
         if self._cli.isAndMode:
             result, highlight_methods = filter_method(cur_content)
             if is_continue:
@@ -1683,15 +1904,43 @@ class Manager(object):
                 tmp_content = [self._getDigest(line, mode) for line in cur_content]
                 result = filter_method(source=tmp_content)
                 result = (result[0], [cur_content[i] for i in result[1]])
+            elif source_range is not None and self._syncCandidateStore(source_range[1]):
+                if is_continue and self._supportsMatchJob(filter_method):
+                    # filter the lines in the worker threads, so that the input is not blocked,
+                    # the result is merged in the next call when the job has finished
+                    job = fuzzyEngine.fuzzyMatchAsync(source=self._candidate_store,
+                                                      begin=source_range[0], end=source_range[1],
+                                                      **filter_method.keywords)
+                    self._match_job = (job, source_range[0], source_range[1])
+                    result = None
+                    # the lines are not filtered in this call
+                    self._chunk_size = 0
+                else:
+                    result = filter_method(source=self._candidate_store,
+                                           begin=source_range[0], end=source_range[1])
             else:
                 result = filter_method(source=cur_content)
 
-            if is_continue:
+            if match_result is not None:
+                self._previous_result = fuzzyEngine.merge(self._previous_result, match_result)
+
+            if result is None:
+                result = self._previous_result
+            elif is_continue:
                 result = fuzzyEngine.merge(self._previous_result, result)
 
             self._previous_result = result
         else:
-            result = list(filter_method(cur_content))
+            if match_result is not None:
+                self._previous_result += match_result
+
+            if source_range is not None and is_continue and self._supportsFilterJob(filter_method):
+                # the same as the match job of the fuzzy engine
+                self._match_job = (FilterJob(filter_method, cur_content), source_range[0], source_range[1])
+                self._chunk_size = 0
+                result = []
+            else:
+                result = list(filter_method(cur_content))
             if is_continue:
                 self._previous_result += result
                 result = self._previous_result
@@ -1700,6 +1949,110 @@ class Manager(object):
 
         return result
 
+    def _getResultKey(self):
+        pattern = self._cli.pattern
+        if isinstance(pattern, list):
+            pattern = tuple(pattern)
+        return (pattern, self._cli.isFuzzy, self._cli.isFullPath,
+                self._cli.isAndMode, self._cli.isRefinement)
+
+    def _switchResults(self, content):
+        """
+        push the results of the previous pattern onto self._result_stack and
+        restore the results of the current pattern if it was searched before,
+        e.g., when <BS> is typed.
+        return True if the results are restored.
+        """
+        if self._result_stack_content is not self._content:
+            self._result_stack = []
+            self._result_stack_content = self._content
+            self._result_key = None
+
+        key = self._getResultKey()
+        # self._index is 0 if the previous search is to be discarded
+        if self._result_key is not None and self._result_key != key and self._index > 0:
+            self._result_stack.append((self._result_key, self._index, self._cb_content, self._cb_index,
+                                       self._result_content, self._previous_result))
+            if len(self._result_stack) > 32:
+                del self._result_stack[0]
+
+        self._result_key = key if self._cli.pattern else None
+        for i in range(len(self._result_stack) - 1, -1, -1):
+            if self._result_stack[i][0] == key:
+                _, index, cb_content, cb_index, result_content, previous_result = self._result_stack.pop(i)
+                # some lines are removed
+                if index > len(content):
+                    self._result_stack = []
+                    return False
+
+                self._index = index
+                self._cb_content = cb_content
+                self._cb_index = cb_index
+                self._result_content = result_content
+                self._previous_result = previous_result
+                return True
+
+        return False
+
+    def _supportsMatchJob(self, filter_method):
+        return (hasattr(fuzzyEngine, "fuzzyMatchAsync") and isinstance(filter_method, partial)
+                and filter_method.func in (fuzzyEngine.fuzzyMatch, fuzzyEngine.fuzzyMatchPart))
+
+    def _supportsFilterJob(self, filter_method):
+        """
+        the lines are filtered by a FilterJob if _getDigest() of the category
+        does not call any vim function.
+        """
+        return (isinstance(filter_method, partial) and filter_method.func == self._fuzzyFilter
+                and self._getExplorer().getStlCategory() in ["File", "Rg", "Tag", "Gtags", "Line", "Mru"])
+
+    def _isMatchJobRunning(self):
+        if self._match_job is None:
+            return False
+
+        job = self._match_job[0]
+        if isinstance(job, FilterJob):
+            return not job.poll()
+        else:
+            return not fuzzyEngine.pollMatchJob(job)
+
+    def _cancelMatchJob(self):
+        """
+        cancel the match job started by _filter(), the lines it was filtering
+        are filtered again by the next search.
+        """
+        if self._match_job is not None:
+            job, begin, end = self._match_job
+            self._match_job = None
+            if isinstance(job, FilterJob):
+                job.cancel()
+            else:
+                fuzzyEngine.cancelMatchJob(job)
+            if self._index == end:
+                self._index = begin
+
+    def _syncCandidateStore(self, end):
+        """
+        make self._candidate_store hold self._content[:end], so that the lines
+        are converted only once for the fuzzy engine.
+        return False if the candidate store can not be used.
+        """
+        if not hasattr(fuzzyEngine, "createCandidateStore") or not isinstance(self._content, list):
+            return False
+
+        # the content is replaced or some lines are removed
+        if (self._candidate_store is None or self._candidate_store_content is not self._content
+                or len(self._content) < self._candidate_store_count):
+            self._candidate_store = fuzzyEngine.createCandidateStore()
+            self._candidate_store_content = self._content
+            self._candidate_store_count = 0
+
+        if self._candidate_store_count < end:
+            self._candidate_store_count = fuzzyEngine.appendCandidates(self._candidate_store,
+                                              self._content[self._candidate_store_count:end])
+
+        return True
+
     def _fuzzyFilter(self, is_full_path, get_weight, iterable):
         """
         return a list, each item is a pair (weight, line)
@@ -1740,7 +2093,7 @@ class Manager(object):
         highlight_methods = []
         for p in self._cli.pattern:
             use_fuzzy_engine = False
-            if self._fuzzy_engine and isAscii(p) and self._getUnit() == 1: # currently, only BufTag's _getUnit() is 2
+            if self._fuzzy_engine and isNativePattern(fuzzyEngine, p, encoding) and self._getUnit() == 1: # currently, only BufTag's _getUnit() is 2
                 use_fuzzy_engine = True
                 pattern = fuzzyEngine.initPattern(p)
                 if self._getExplorer().getStlCategory() == "File" and self._cli.isFullPath:
@@ -1758,7 +2111,7 @@ class Manager(object):
                 getHighlights = partial(fuzzyEngine.getHighlights, engine=self._fuzzy_engine,
                                         pattern=pattern, is_name_only=not self._cli.isFullPath)
                 highlight_method = partial(self._highlight, self._cli.isFullPath, getHighlights, True, clear=False)
-            elif is_fuzzyMatch_C and isAscii(p):
+            elif is_fuzzyMatch_C and isNativePattern(fuzzyMatchC, p, encoding):
                 pattern = fuzzyMatchC.initPattern(p)
                 if self._getExplorer().getStlCategory() == "File" and self._cli.isFullPath:
                     getWeight = partial(fuzzyMatchC.getWeight, pattern=pattern, is_name_only=False)
@@ -1821,11 +2174,16 @@ class Manager(object):
         use_fuzzy_engine = False
         use_fuzzy_match_c = False
         do_sort = "--no-sort" not in self._arguments
+        if do_sort and hasattr(fuzzyEngine, "rankResults"):
+            # only the first screen of the results is sorted here, see _rankResults()
+            sort_args = {"sort_results": True, "top_k": self._initial_count}
+        else:
+            sort_args = {"sort_results": do_sort}
         if self._cli.isAndMode:
             filter_method = self._andModeFilter
         elif self._cli.isRefinement:
             if self._cli.pattern[1] == '':      # e.g. abc;
-                if self._fuzzy_engine and isAscii(self._cli.pattern[0]):
+                if self._fuzzy_engine and isNativePattern(fuzzyEngine, self._cli.pattern[0], encoding):
                     use_fuzzy_engine = True
                     return_index = True
                     pattern = fuzzyEngine.initPattern(self._cli.pattern[0])
@@ -1834,7 +2192,7 @@ class Manager(object):
                     getHighlights = partial(fuzzyEngine.getHighlights, engine=self._fuzzy_engine,
                                             pattern=pattern, is_name_only=True)
                     highlight_method = partial(self._highlight, False, getHighlights, True)
-                elif is_fuzzyMatch_C and isAscii(self._cli.pattern[0]):
+                elif is_fuzzyMatch_C and isNativePattern(fuzzyMatchC, self._cli.pattern[0], encoding):
                     use_fuzzy_match_c = True
                     pattern = fuzzyMatchC.initPattern(self._cli.pattern[0])
                     getWeight = partial(fuzzyMatchC.getWeight, pattern=pattern, is_name_only=True)
@@ -1851,7 +2209,7 @@ class Manager(object):
                     filter_method = partial(self._fuzzyFilter, False, getWeight)
                     highlight_method = partial(self._highlight, False, getHighlights)
             elif self._cli.pattern[0] == '':    # e.g. ;abc
-                if self._fuzzy_engine and isAscii(self._cli.pattern[1]):
+                if self._fuzzy_engine and isNativePattern(fuzzyEngine, self._cli.pattern[1], encoding):
                     use_fuzzy_engine = True
                     return_index = True
                     pattern = fuzzyEngine.initPattern(self._cli.pattern[1])
@@ -1860,7 +2218,7 @@ class Manager(object):
                     getHighlights = partial(fuzzyEngine.getHighlights, engine=self._fuzzy_engine,
                                             pattern=pattern, is_name_only=False)
                     highlight_method = partial(self._highlight, True, getHighlights, True)
-                elif is_fuzzyMatch_C and isAscii(self._cli.pattern[1]):
+                elif is_fuzzyMatch_C and isNativePattern(fuzzyMatchC, self._cli.pattern[1], encoding):
                     use_fuzzy_match_c = True
                     pattern = fuzzyMatchC.initPattern(self._cli.pattern[1])
                     getWeight = partial(fuzzyMatchC.getWeight, pattern=pattern, is_name_only=False)
@@ -1877,7 +2235,7 @@ class Manager(object):
                     filter_method = partial(self._fuzzyFilter, True, getWeight)
                     highlight_method = partial(self._highlight, True, getHighlights)
             else:   # e.g. abc;def
-                if is_fuzzyMatch_C and isAscii(self._cli.pattern[0]):
+                if is_fuzzyMatch_C and isNativePattern(fuzzyMatchC, self._cli.pattern[0], encoding):
                     is_ascii_0 = True
                     pattern_0 = fuzzyMatchC.initPattern(self._cli.pattern[0])
                     getWeight_0 = partial(fuzzyMatchC.getWeight, pattern=pattern_0, is_name_only=True)
@@ -1891,7 +2249,7 @@ class Manager(object):
                         getWeight_0 = fuzzy_match_0.getWeight
                     getHighlights_0 = fuzzy_match_0.getHighlights
 
-                if is_fuzzyMatch_C and isAscii(self._cli.pattern[1]):
+                if is_fuzzyMatch_C and isNativePattern(fuzzyMatchC, self._cli.pattern[1], encoding):
                     is_ascii_1 = True
                     pattern_1 = fuzzyMatchC.initPattern(self._cli.pattern[1])
                     getWeight_1 = partial(fuzzyMatchC.getWeight, pattern=pattern_1, is_name_only=False)
@@ -1910,36 +2268,37 @@ class Manager(object):
                 filter_method = partial(self._refineFilter, getWeight_0, getWeight_1)
                 highlight_method = partial(self._highlightRefine, getHighlights_0, getHighlights_1)
         else:
-            if self._fuzzy_engine and isAscii(self._cli.pattern) and self._getUnit() == 1: # currently, only BufTag's _getUnit() is 2
+            if self._fuzzy_engine and isNativePattern(fuzzyEngine, self._cli.pattern, encoding) and self._getUnit() == 1: # currently, only BufTag's _getUnit() is 2
                 use_fuzzy_engine = True
+                self._use_top_k = "top_k" in sort_args
                 pattern = fuzzyEngine.initPattern(self._cli.pattern)
                 if self._getExplorer().getStlCategory() == "File":
                     return_index = False
                     if self._cli.isFullPath:
                         filter_method = partial(fuzzyEngine.fuzzyMatch, engine=self._fuzzy_engine, pattern=pattern,
-                                                is_name_only=False, sort_results=do_sort)
+                                                is_name_only=False, **sort_args)
                     else:
                         filter_method = partial(fuzzyEngine.fuzzyMatchPart, engine=self._fuzzy_engine,
                                                 pattern=pattern, category=fuzzyEngine.Category_File,
                                                 param=fuzzyEngine.createParameter(1),
-                                                is_name_only=True, sort_results=do_sort)
+                                                is_name_only=True, **sort_args)
                 elif self._getExplorer().getStlCategory() == "Rg":
                     return_index = False
                     if self._cli.isFullPath or "--match-path" in self._arguments:
                         filter_method = partial(fuzzyEngine.fuzzyMatch, engine=self._fuzzy_engine, pattern=pattern,
-                                                is_name_only=True, sort_results=do_sort)
+                                                is_name_only=True, **sort_args)
                     else:
                         filter_method = partial(fuzzyEngine.fuzzyMatchPart, engine=self._fuzzy_engine,
                                                 pattern=pattern, category=fuzzyEngine.Category_Rg,
                                                 param=fuzzyEngine.createRgParameter(self._getExplorer().displayMulti(),
                                                     self._getExplorer().getContextSeparator(), self._has_column),
-                                                is_name_only=True, sort_results=do_sort)
+                                                is_name_only=True, **sort_args)
                 elif self._getExplorer().getStlCategory() == "Tag":
                     return_index = False
                     mode = 0 if self._cli.isFullPath else 1
                     filter_method = partial(fuzzyEngine.fuzzyMatchPart, engine=self._fuzzy_engine,
                                             pattern=pattern, category=fuzzyEngine.Category_Tag,
-                                            param=fuzzyEngine.createParameter(mode), is_name_only=True, sort_results=do_sort)
+                                            param=fuzzyEngine.createParameter(mode), is_name_only=True, **sort_args)
                 elif self._getExplorer().getStlCategory() == "Gtags":
                     return_index = False
                     result_format = 1
@@ -1950,33 +2309,33 @@ class Manager(object):
                     filter_method = partial(fuzzyEngine.fuzzyMatchPart, engine=self._fuzzy_engine,
                                             pattern=pattern, category=fuzzyEngine.Category_Gtags,
                                             param=fuzzyEngine.createGtagsParameter(0, result_format, self._match_path),
-                                            is_name_only=True, sort_results=do_sort)
+                                            is_name_only=True, **sort_args)
                 elif self._getExplorer().getStlCategory() == "Line":
                     return_index = False
                     filter_method = partial(fuzzyEngine.fuzzyMatchPart, engine=self._fuzzy_engine,
                                             pattern=pattern, category=fuzzyEngine.Category_Line,
-                                            param=fuzzyEngine.createParameter(1), is_name_only=True, sort_results=do_sort)
+                                            param=fuzzyEngine.createParameter(1), is_name_only=True, **sort_args)
                 elif self._getExplorer().getStlCategory() == "Git_diff":
                     return_index = False
                     mode = 0 if self._cli.isFullPath else 1
                     filter_method = partial(fuzzyEngine.fuzzyMatchPart, engine=self._fuzzy_engine,
                                             pattern=pattern, category=fuzzyEngine.Category_GitDiff,
-                                            param=fuzzyEngine.createParameter(mode), is_name_only=False, sort_results=do_sort)
+                                            param=fuzzyEngine.createParameter(mode), is_name_only=False, **sort_args)
                 elif self._getExplorer().getStlCategory() in ["Self", "Buffer", "Mru", "BufTag",
                         "Function", "History", "Cmd_History", "Search_History", "Filetype",
                         "Command", "Window", "QuickFix", "LocList"]:
                     return_index = True
                     filter_method = partial(fuzzyEngine.fuzzyMatchEx, engine=self._fuzzy_engine, pattern=pattern,
-                                            is_name_only=True, sort_results=do_sort)
+                                            is_name_only=True, **sort_args)
                 else:
                     return_index = True
                     filter_method = partial(fuzzyEngine.fuzzyMatchEx, engine=self._fuzzy_engine, pattern=pattern,
-                                            is_name_only=not self._cli.isFullPath, sort_results=do_sort)
+                                            is_name_only=not self._cli.isFullPath, **sort_args)
 
                 getHighlights = partial(fuzzyEngine.getHighlights, engine=self._fuzzy_engine,
                                         pattern=pattern, is_name_only=not self._cli.isFullPath)
                 highlight_method = partial(self._highlight, self._cli.isFullPath, getHighlights, True)
-            elif is_fuzzyMatch_C and isAscii(self._cli.pattern):
+            elif is_fuzzyMatch_C and isNativePattern(fuzzyMatchC, self._cli.pattern, encoding):
                 use_fuzzy_match_c = True
                 pattern = fuzzyMatchC.initPattern(self._cli.pattern)
                 if self._getExplorer().getStlCategory() == "File" and self._cli.isFullPath:
@@ -2014,10 +2373,10 @@ class Manager(object):
                                            fuzzy_match.getHighlights)
 
         if self._cli.isAndMode:
-            if self._fuzzy_engine and isAscii(''.join(self._cli.pattern)):
-                step = 20000 * cpu_count
+            if self._fuzzy_engine and isNativePattern(fuzzyEngine, ''.join(self._cli.pattern), encoding):
+                step = self._getChunkStep(20000 * cpu_count)
             else:
-                step = 10000
+                step = self._getChunkStep(10000)
             pair, highlight_methods = self._filter(step, filter_method, content, is_continue)
 
             if do_sort:
@@ -2028,35 +2387,50 @@ class Manager(object):
         elif use_fuzzy_engine:
             if step == 0:
                 if return_index == True:
-                    step = 30000 * cpu_count
+                    step = self._getChunkStep(30000 * cpu_count)
                 else:
-                    step = 50000 * cpu_count
+                    step = self._getChunkStep(50000 * cpu_count)
 
             _, self._result_content = self._filter(step, filter_method, content, is_continue, True, return_index)
         else:
             if step == 0:
                 if use_fuzzy_match_c:
-                    step = 60000
+                    step = self._getChunkStep(60000)
                 elif self._getExplorer().supportsNameOnly() and self._cli.isFullPath:
-                    step = 6000
+                    step = self._getChunkStep(6000)
                 else:
-                    step = 12000
+                    step = self._getChunkStep(12000)
 
             pairs = self._filter(step, filter_method, content, is_continue)
             if "--no-sort" not in self._arguments:
                 pairs.sort(key=operator.itemgetter(0), reverse=True)
             self._result_content = self._getList(pairs)
 
+        self._rankResults(self._initial_count)
         self._getInstance().setBuffer(self._result_content[:self._initial_count])
         self._getInstance().setStlResultsCount(len(self._result_content), True)
 
         if self._cli.isAndMode:
             self._highlight_method = partial(self._highlight_and_mode, highlight_methods)
-            self._highlight_method()
         else:
             self._highlight_method = highlight_method
+
+        # if a match job has just been started by _filter(), the results are not changed,
+        # neither are the highlights. besides, the tasks of fuzzyEngine.getHighlights()
+        # would be queued behind the tasks of the job and wait until it finishes.
+        if self._match_job is None:
             self._highlight_method()
 
+    def _rankResults(self, count=None):
+        """
+        the fuzzy engine only sorts the first `top_k` results, make sure that
+        the first `count` results are sorted, all of them if `count` is None.
+        """
+        if self._use_top_k and self._result_content:
+            if count is None:
+                count = len(self._result_content)
+            fuzzyEngine.rankResults(self._previous_result, count)
+
     def _guessFilter(self, filename, suffix, dirname, icon, iterable):
         """
         return a list, each item is a pair (weight, line)
@@ -2106,15 +2480,66 @@ class Manager(object):
         for i, highlight_method in enumerate(highlight_methods):
             highlight_method(hl_group='Lf_hl_match' + str(i % 5))
 
-    def _clearHighlights(self):
+    def _getHighlightWinId(self):
+        """
+        return the id of the window the highlights are added to, 0 means the current window.
+        """
         if self._getInstance().getWinPos() == 'popup':
-            for i in self._highlight_ids:
-                lfCmd("silent! call matchdelete(%d, %d)" % (i, self._getInstance().getPopupWinId()))
+            return self._getInstance().getPopupWinId()
         else:
-            for i in self._highlight_ids:
-                lfCmd("silent! call matchdelete(%d)" % i)
+            return 0
+
+    def _addHighlights(self, hl_group, pos_list):
+        """
+        add the highlights of all the lines in one call,
+        e.g., pos_list = [ [ [1,2,3], [1,6,2] ], [ [2,1,4], [2,7,6], ... ], ... ]
+        where [1,2,3] indicates the highlight is in the 1st line, starts at the
+        2nd column with the length of 3 in bytes
+        """
+        positions = [p for pos in pos_list for p in pos]
+        if not positions:
+            return
+
+        ids = lfEval("leaderf#matchaddposList(%d, '%s', %s)"
+                     % (self._getHighlightWinId(), hl_group, str(positions)))
+        self._highlight_ids.extend(int(i) for i in ids)
+
+    def _clearHighlights(self):
+        if self._highlight_ids:
+            lfCmd("call leaderf#matchdeleteList(%d, %s)"
+                  % (self._getHighlightWinId(), str(self._highlight_ids)))
         self._highlight_ids = []
 
+    def _getHighlights(self, get_highlights, digests, use_fuzzy_engine=False):
+        """
+        return the highlight positions of each digest in `digests`.
+        the positions are cached by (get_highlights, digest) in a LRU cache, `get_highlights`
+        is created for each pattern, so highlighting the same lines again, e.g., after
+        scrolling, does not match them again.
+        """
+        cache = self._highlight_cache
+        missing = [d for d in OrderedDict.fromkeys(digests) if (get_highlights, d) not in cache]
+        if missing:
+            if use_fuzzy_engine:
+                positions = get_highlights(source=missing)
+            else:
+                positions = [get_highlights(d) for d in missing]
+            for d, pos in zip(missing, positions):
+                cache[(get_highlights, d)] = pos
+
+        result = []
+        for d in digests:
+            # move to the end, OrderedDict.move_to_end() is not available in python2
+            pos = cache.pop((get_highlights, d))
+            cache[(get_highlights, d)] = pos
+            # the positions are modified by the caller
+            result.append([list(p) for p in pos])
+
+        while len(cache) > self.HIGHLIGHT_CACHE_SIZE:
+            cache.popitem(last=False)
+
+        return result
+
     def _clearHighlightsPos(self):
         self._highlight_pos = []
         self._highlight_pos_list = []
@@ -2131,44 +2556,38 @@ class Manager(object):
         else:
             highlight_pos_list = [self._highlight_pos]
 
-        for n, highlight_pos in enumerate(highlight_pos_list):
-            hl_group = 'Lf_hl_match' + str(n % 5)
-            for i, pos in enumerate(highlight_pos):
-                if self._getInstance().isReverseOrder():
-                    pos = [[bottom - unit*i] + p for p in pos]
-                else:
-                    pos = [[unit*i + 1 + self._help_length] + p for p in pos]
-                # The maximum number of positions is 8 in matchaddpos().
-                for j in range(0, len(pos), 8):
-                    if self._getInstance().getWinPos() == 'popup':
-                        lfCmd("""call win_execute(%d, "let matchid = matchaddpos('%s', %s)")"""
-                                % (self._getInstance().getPopupWinId(), hl_group, str(pos[j:j+8])))
-                        id = int(lfEval("matchid"))
-                    else:
-                        id = int(lfEval("matchaddpos('%s', %s)" % (hl_group, str(pos[j:j+8]))))
-                    self._highlight_ids.append(id)
-
-        for i, pos in enumerate(self._highlight_refine_pos):
+        def getLinePos(i, pos):
             if self._getInstance().isReverseOrder():
-                pos = [[bottom - unit*i] + p for p in pos]
+                return [[bottom - unit*i] + p for p in pos]
             else:
-                pos = [[unit*i + 1 + self._help_length] + p for p in pos]
-            # The maximum number of positions is 8 in matchaddpos().
-            for j in range(0, len(pos), 8):
-                if self._getInstance().getWinPos() == 'popup':
-                    lfCmd("""call win_execute(%d, "let matchid = matchaddpos('Lf_hl_matchRefine', %s)")"""
-                            % (self._getInstance().getPopupWinId(), str(pos[j:j+8])))
-                    id = int(lfEval("matchid"))
-                else:
-                    id = int(lfEval("matchaddpos('Lf_hl_matchRefine', %s)" % str(pos[j:j+8])))
-                self._highlight_ids.append(id)
+                return [[unit*i + 1 + self._help_length] + p for p in pos]
+
+        for n, highlight_pos in enumerate(highlight_pos_list):
+            self._addHighlights('Lf_hl_match' + str(n % 5),
+                                [getLinePos(i, pos) for i, pos in enumerate(highlight_pos)])
+
+        self._addHighlights('Lf_hl_matchRefine',
+                            [getLinePos(i, pos) for i, pos in enumerate(self._highlight_refine_pos)])
+
+    def _getHighlightedLines(self, highlight_number):
+        """
+        return a tuple (lines, bottom), `lines` are the first `highlight_number` results
+        in the buffer, in the order of the results, and `bottom` is the line number of
+        the first result if the order is reversed.
+        only these lines are read from the buffer, not the whole buffer.
+        """
+        cb = self._getInstance().buffer
+        if self._getInstance().isReverseOrder():
+            bottom = len(cb) - self._help_length
+            return (cb[max(bottom - highlight_number, 0):bottom][::-1], bottom)
+        else:
+            return (cb[self._help_length:self._help_length + highlight_number], 0)
 
     def _highlight(self, is_full_path, get_highlights, use_fuzzy_engine=False, clear=True, hl_group='Lf_hl_match'):
         # matchaddpos() is introduced by Patch 7.4.330
         if (lfEval("exists('*matchaddpos')") == '0' or
                 lfEval("g:Lf_HighlightIndividual") == '0'):
             return
-        cb = self._getInstance().buffer
         if self._getInstance().empty(): # buffer is empty.
             return
 
@@ -2179,52 +2598,35 @@ class Manager(object):
         getDigest = partial(self._getDigest, mode=0 if is_full_path else 1)
         unit = self._getUnit()
 
-        if self._getInstance().isReverseOrder():
-            if self._help_length > 0:
-                content = cb[:-self._help_length][::-1]
-            else:
-                content = cb[:][::-1]
-        else:
-            content = cb[self._help_length:]
+        content, bottom = self._getHighlightedLines(highlight_number)
 
-        if use_fuzzy_engine:
-            self._highlight_pos = get_highlights(source=[getDigest(line)
-                                                         for line in content[:highlight_number:unit]])
-        else:
-            # e.g., self._highlight_pos = [ [ [2,3], [6,2] ], [ [1,4], [7,6], ... ], ... ]
-            # where [2, 3] indicates the highlight starts at the 2nd column with the
-            # length of 3 in bytes
-            self._highlight_pos = [get_highlights(getDigest(line))
-                                   for line in content[:highlight_number:unit]]
+        # e.g., self._highlight_pos = [ [ [2,3], [6,2] ], [ [1,4], [7,6], ... ], ... ]
+        # where [2, 3] indicates the highlight starts at the 2nd column with the
+        # length of 3 in bytes
+        self._highlight_pos = self._getHighlights(get_highlights,
+                                                  [getDigest(line) for line in content[:highlight_number:unit]],
+                                                  use_fuzzy_engine)
         if self._cli.isAndMode:
             self._highlight_pos_list.append(self._highlight_pos)
 
-        bottom = len(content)
+        pos_list = []
         for i, pos in enumerate(self._highlight_pos):
             start_pos = self._getDigestStartPos(content[unit*i], 0 if is_full_path else 1)
             if start_pos > 0:
                 for j in range(len(pos)):
                     pos[j][0] += start_pos
             if self._getInstance().isReverseOrder():
-                pos = [[bottom - unit*i] + p for p in pos]
+                pos_list.append([[bottom - unit*i] + p for p in pos])
             else:
-                pos = [[unit*i + 1 + self._help_length] + p for p in pos]
-            # The maximum number of positions is 8 in matchaddpos().
-            for j in range(0, len(pos), 8):
-                if self._getInstance().getWinPos() == 'popup':
-                    lfCmd("""call win_execute(%d, "let matchid = matchaddpos('%s', %s)")"""
-                            % (self._getInstance().getPopupWinId(), hl_group, str(pos[j:j+8])))
-                    id = int(lfEval("matchid"))
-                else:
-                    id = int(lfEval("matchaddpos('%s', %s)" % (hl_group, str(pos[j:j+8]))))
-                self._highlight_ids.append(id)
+                pos_list.append([[unit*i + 1 + self._help_length] + p for p in pos])
+
+        self._addHighlights(hl_group, pos_list)
 
     def _highlightRefine(self, first_get_highlights, get_highlights):
         # matchaddpos() is introduced by Patch 7.4.330
         if (lfEval("exists('*matchaddpos')") == '0' or
                 lfEval("g:Lf_HighlightIndividual") == '0'):
             return
-        cb = self._getInstance().buffer
         if self._getInstance().empty(): # buffer is empty.
             return
 
@@ -2234,82 +2636,72 @@ class Manager(object):
         getDigest = self._getDigest
         unit = self._getUnit()
 
-        if self._getInstance().isReverseOrder():
-            if self._help_length > 0:
-                content = cb[:-self._help_length][::-1]
-            else:
-                content = cb[:][::-1]
-        else:
-            content = cb[self._help_length:]
+        content, bottom = self._getHighlightedLines(highlight_number)
 
-        bottom = len(content)
-
-        self._highlight_pos = [first_get_highlights(getDigest(line, 1))
-                               for line in content[:highlight_number:unit]]
+        self._highlight_pos = self._getHighlights(first_get_highlights,
+                                                  [getDigest(line, 1) for line in content[:highlight_number:unit]])
+        pos_list = []
         for i, pos in enumerate(self._highlight_pos):
             start_pos = self._getDigestStartPos(content[unit*i], 1)
             if start_pos > 0:
                 for j in range(len(pos)):
                     pos[j][0] += start_pos
             if self._getInstance().isReverseOrder():
-                pos = [[bottom - unit*i] + p for p in pos]
+                pos_list.append([[bottom - unit*i] + p for p in pos])
             else:
-                pos = [[unit*i + 1 + self._help_length] + p for p in pos]
-            # The maximum number of positions is 8 in matchaddpos().
-            for j in range(0, len(pos), 8):
-                if self._getInstance().getWinPos() == 'popup':
-                    lfCmd("""call win_execute(%d, "let matchid = matchaddpos('Lf_hl_match', %s)")"""
-                            % (self._getInstance().getPopupWinId(), str(pos[j:j+8])))
-                    id = int(lfEval("matchid"))
-                else:
-                    id = int(lfEval("matchaddpos('Lf_hl_match', %s)" % str(pos[j:j+8])))
-                self._highlight_ids.append(id)
+                pos_list.append([[unit*i + 1 + self._help_length] + p for p in pos])
+
+        self._addHighlights('Lf_hl_match', pos_list)
 
-        self._highlight_refine_pos = [get_highlights(getDigest(line, 2))
-                                      for line in content[:highlight_number:unit]]
+        self._highlight_refine_pos = self._getHighlights(get_highlights,
+                                                         [getDigest(line, 2) for line in content[:highlight_number:unit]])
+        pos_list = []
         for i, pos in enumerate(self._highlight_refine_pos):
             start_pos = self._getDigestStartPos(content[unit*i], 2)
             if start_pos > 0:
                 for j in range(len(pos)):
                     pos[j][0] += start_pos
             if self._getInstance().isReverseOrder():
-                pos = [[bottom - unit*i] + p for p in pos]
+                pos_list.append([[bottom - unit*i] + p for p in pos])
             else:
-                pos = [[unit*i + 1 + self._help_length] + p for p in pos]
-            # The maximum number of positions is 8 in matchaddpos().
-            for j in range(0, len(pos), 8):
-                if self._getInstance().getWinPos() == 'popup':
-                    lfCmd("""call win_execute(%d, "let matchid = matchaddpos('Lf_hl_matchRefine', %s)")"""
-                            % (self._getInstance().getPopupWinId(), str(pos[j:j+8])))
-                    id = int(lfEval("matchid"))
-                else:
-                    id = int(lfEval("matchaddpos('Lf_hl_matchRefine', %s)" % str(pos[j:j+8])))
-                self._highlight_ids.append(id)
+                pos_list.append([[unit*i + 1 + self._help_length] + p for p in pos])
 
-    def _regexFilter(self, iterable):
-        def noErrMatch(text, pattern):
-            try:
-                return '-1' != lfEval("g:LfNoErrMsgMatch('%s', '%s')" % (text, pattern))
-            except TypeError:   # python 2
-                return '-1' != lfEval("g:LfNoErrMsgMatch('%s', '%s')" % (text.replace('\x00', '\x01'), pattern))
-            except ValueError:  # python 3
-                return '-1' != lfEval("g:LfNoErrMsgMatch('%s', '%s')" % (text.replace('\x00', '\x01'), pattern))
-            except:
-                return '-1' != lfEval("g:LfNoErrMsgMatch('%s', '%s')" % (text.replace('\x00', '\x01'), pattern))
+        self._addHighlights('Lf_hl_matchRefine', pos_list)
+
+    def _getRegex(self, pattern):
+        """
+        translate the vim regex `pattern` to a compiled python regex,
+        return None if it can not be translated
+        """
+        ignorecase = lfEval("&ignorecase") == '1'
+        if self._regex_cache[0] != (pattern, ignorecase):
+            self._regex_cache = ((pattern, ignorecase), vimRegexToPython(pattern, ignorecase))
+        return self._regex_cache[1]
 
+    def _regexFilter(self, iterable):
         try:
             if ('-2' == lfEval("g:LfNoErrMsgMatch('', '%s')" % escQuote(self._cli.pattern))):
                 return iter([])
-            else:
-                return (line for line in iterable
-                        if noErrMatch(escQuote(self._getDigest(line, 0)), escQuote(self._cli.pattern)))
+
+            regex = self._getRegex(self._cli.pattern)
+            if regex is not None:
+                return (line for line in iterable if regex.search(self._getDigest(line, 0)))
+
+            # filter the whole chunk by one call of vim's filter()
+            lines = list(iterable)
+            vim.vars['Lf_RegexFilterList'] = [self._getDigest(line, 0).replace('\x00', '\x01')
+                                              for line in lines]
+            indices = lfEval("g:LfNoErrMsgFilter(g:Lf_RegexFilterList, '%s')"
+                             % escQuote(self._cli.pattern))
+            lfCmd("unlet g:Lf_RegexFilterList")
+            return (lines[int(i)] for i in indices)
         except vim.error:
             return iter([])
 
     def _regexSearch(self, content, is_continue, step):
         if not is_continue and not self._cli.isPrefix:
             self._index = 0
-        self._result_content = self._filter(8000, self._regexFilter, content, is_continue)
+        self._result_content = self._filter(self._getChunkStep(8000), self._regexFilter, content, is_continue)
         self._getInstance().setBuffer(self._result_content[:self._initial_count])
         self._getInstance().setStlResultsCount(len(self._result_content), True)
 
@@ -2769,6 +3161,7 @@ class Manager(object):
             self._cli.setPattern(pattern)
             self._result_content = []
             self._cb_content = []
+            self._cb_index = 0
 
         if content is None:
             return
@@ -2832,6 +3225,7 @@ class Manager(object):
                 if not remember_last_status and not empty_query:
                     self._getInstance().appendBuffer(self._content[self._initial_count:])
                 elif remember_last_status and len(self._getInstance().buffer) < len(self._result_content):
+                    self._rankResults()
                     self._getInstance().appendBuffer(self._result_content[self._initial_count:])
 
                 lfCmd("echo")
@@ -2846,6 +3240,7 @@ class Manager(object):
                     self._guessSearch(self._content)
                     if self._result_content: # self._result_content is [] only if
                                              #  self._cur_buffer.name == '' or self._cur_buffer.options["buftype"] not in [b'', '']:
+                        self._rankResults()
                         self._getInstance().appendBuffer(self._result_content[self._initial_count:])
                     else:
                         self._getInstance().appendBuffer(self._content[self._initial_count:])
@@ -2918,21 +3313,53 @@ class Manager(object):
 
     def _readContent(self, content):
         try:
-            for line in content:
-                self._content.append(line)
-                if self._stop_reader_thread:
-                    break
+            if isinstance(content, AsyncExecutor.Result) and content.isChunked():
+                for lines in content.chunks():
+                    self._content.extend(lines)
+                    if self._stop_reader_thread:
+                        break
+                else:
+                    self._read_finished = 1
             else:
-                self._read_finished = 1
+                for line in content:
+                    self._content.append(line)
+                    if self._stop_reader_thread:
+                        break
+                else:
+                    self._read_finished = 1
         except Exception:
             self._read_finished = 1
             self._read_content_exception = sys.exc_info()
 
-    def _setResultContent(self):
+    def _setResultContent(self, count=None):
+        """
+        put the results into the buffer, only the first `count` of them if `count` is not None.
+        """
         if len(self._result_content) > len(self._getInstance().buffer):
-            self._getInstance().setBuffer(self._result_content)
+            if count is None or count >= len(self._result_content):
+                self._rankResults()
+                self._getInstance().setBuffer(self._result_content)
+            else:
+                self._rankResults(count)
+                self._getInstance().setBuffer(self._result_content[:count])
         elif self._index == 0:
-            self._getInstance().setBuffer(self._content, need_copy=True)
+            if count is None or count >= len(self._content):
+                self._getInstance().setBuffer(self._content, need_copy=True)
+            else:
+                self._getInstance().setBuffer(self._content[:count])
+
+    def _growResultContent(self):
+        """
+        when scrolling in INPUT mode, the buffer only holds the results that have been
+        scrolled through plus a margin, so that a huge result list never enters the buffer
+        at once. the size at least doubles each time, scrolling through n results costs O(n).
+        """
+        buffer_len = len(self._getInstance().buffer)
+        if len(self._result_content) <= buffer_len and (self._index != 0 or len(self._content) <= buffer_len):
+            return
+
+        self._setResultContent(max(buffer_len * 2,
+                                   buffer_len + self._getInstance().window.height * 2))
 
     @catchException
     def _workInIdle(self, content=None, bang=False):
@@ -2948,14 +3375,12 @@ class Manager(object):
                 raise self._read_content_exception[1]
 
         if self._is_content_list:
-            if self._cli.pattern and (self._index < len(self._content) or len(self._cb_content) > 0):
-                if self._fuzzy_engine:
-                    step = 60000 * cpu_count
-                elif is_fuzzyMatch_C:
-                    step = 10000
-                else:
-                    step = 2000
-                self._search(self._content, True, step)
+            if self._cli.pattern and (self._index < len(self._content) or len(self._cb_content) > 0
+                                      or self._match_job is not None):
+                if self._isMatchJobRunning():
+                    return None
+
+                self._search(self._content, True, self._getIdleStep())
                 return None
             else:
                 return 100
@@ -2972,68 +3397,69 @@ class Manager(object):
             if self._read_finished == 1:
                 self._read_finished += 1
                 self._getExplorer().setContent(self._content)
-                self._getInstance().setStlTotal(len(self._content)//self._getUnit())
-                self._getInstance().setStlRunning(False)
-
-                if self._cli.pattern:
-                    self._getInstance().setStlResultsCount(len(self._result_content))
-                elif self._empty_query and self._getExplorer().getStlCategory() in ["File"]:
-                    self._guessSearch(self._content)
-                    if bang:
-                        if self._result_content: # self._result_content is [] only if
-                                                 #  self._cur_buffer.name == '' or self._cur_buffer.options["buftype"] != b'':
-                            self._getInstance().appendBuffer(self._result_content[self._initial_count:])
-                        else:
-                            self._getInstance().appendBuffer(self._content[self._initial_count:])
-
-                        if self._timer_id is not None:
-                            lfCmd("call timer_stop(%s)" % self._timer_id)
-                            self._timer_id = None
-
-                        self._bangReadFinished()
-
-                        lfCmd("echohl WarningMsg | redraw | echo ' Done!' | echohl NONE")
-                else:
-                    if bang:
-                        if self._getInstance().empty():
-                            self._offset_in_content = len(self._content)
-                            if self._offset_in_content > 0:
-                                self._getInstance().appendBuffer(self._content[:self._offset_in_content])
-                        else:
-                            cur_len = len(self._content)
-                            if cur_len > self._offset_in_content:
-                                self._getInstance().appendBuffer(self._content[self._offset_in_content:cur_len])
-                                self._offset_in_content = cur_len
-
-                        if self._timer_id is not None:
-                            lfCmd("call timer_stop(%s)" % self._timer_id)
-                            self._timer_id = None
-
-                        self._bangReadFinished()
-
-                        lfCmd("echohl WarningMsg | redraw | echo ' Done!' | echohl NONE")
+                # the statusline is updated several times below, apply the updates in one vim command
+                with self._getInstance().batchStlUpdates():
+                    self._getInstance().setStlTotal(len(self._content)//self._getUnit())
+                    self._getInstance().setStlRunning(False)
+
+                    if self._cli.pattern:
+                        self._getInstance().setStlResultsCount(len(self._result_content))
+                    elif self._empty_query and self._getExplorer().getStlCategory() in ["File"]:
+                        self._guessSearch(self._content)
+                        if bang:
+                            if self._result_content: # self._result_content is [] only if
+                                                     #  self._cur_buffer.name == '' or self._cur_buffer.options["buftype"] != b'':
+                                self._rankResults()
+                                self._getInstance().appendBuffer(self._result_content[self._initial_count:])
+                            else:
+                                self._getInstance().appendBuffer(self._content[self._initial_count:])
+
+                            if self._timer_id is not None:
+                                lfCmd("call timer_stop(%s)" % self._timer_id)
+                                self._timer_id = None
+
+                            self._bangReadFinished()
+
+                            lfCmd("echohl WarningMsg | redraw | echo ' Done!' | echohl NONE")
                     else:
-                        self._getInstance().setBuffer(self._content[:self._initial_count])
+                        if bang:
+                            if self._getInstance().empty():
+                                self._offset_in_content = len(self._content)
+                                if self._offset_in_content > 0:
+                                    self._getInstance().appendBuffer(self._content[:self._offset_in_content])
+                            else:
+                                cur_len = len(self._content)
+                                if cur_len > self._offset_in_content:
+                                    self._getInstance().appendBuffer(self._content[self._offset_in_content:cur_len])
+                                    self._offset_in_content = cur_len
+
+                            if self._timer_id is not None:
+                                lfCmd("call timer_stop(%s)" % self._timer_id)
+                                self._timer_id = None
+
+                            self._bangReadFinished()
+
+                            lfCmd("echohl WarningMsg | redraw | echo ' Done!' | echohl NONE")
+                        else:
+                            self._getInstance().setBuffer(self._content[:self._initial_count])
 
-                    self._getInstance().setStlResultsCount(len(self._content))
+                        self._getInstance().setStlResultsCount(len(self._content))
 
-                if not self.isPreviewWindowOpen():
-                    self._previewResult(False)
+                    if not self.isPreviewWindowOpen():
+                        self._previewResult(False)
 
-                if self._getInstance().getWinPos() not in ('popup', 'floatwin'):
-                    lfCmd("redrawstatus")
+                    if self._getInstance().getWinPos() not in ('popup', 'floatwin'):
+                        self._getInstance().redrawStatusline()
 
             if self._cli.pattern:
-                if self._index < len(self._content) or len(self._cb_content) > 0:
-                    if self._fuzzy_engine:
-                        step = 60000 * cpu_count
-                    elif is_fuzzyMatch_C:
-                        step = 10000
-                    else:
-                        step = 2000
-                    self._search(self._content, True, step)
+                if self._index < len(self._content) or len(self._cb_content) > 0 or self._match_job is not None:
+                    if self._isMatchJobRunning():
+                        return None
+
+                    self._search(self._content, True, self._getIdleStep())
 
                     if bang:
+                        self._rankResults()
                         self._getInstance().appendBuffer(self._result_content[self._initial_count:])
                 else:
                     return 100
@@ -3043,26 +3469,22 @@ class Manager(object):
             cur_len = len(self._content)
             if time.time() - self._start_time > 0.1:
                 self._start_time = time.time()
-                self._getInstance().setStlTotal(cur_len//self._getUnit())
-                self._getInstance().setStlRunning(True)
+                with self._getInstance().batchStlUpdates():
+                    self._getInstance().setStlTotal(cur_len//self._getUnit())
+                    self._getInstance().setStlRunning(True)
 
-                if self._cli.pattern:
-                    self._getInstance().setStlResultsCount(len(self._result_content))
-                else:
-                    self._getInstance().setStlResultsCount(cur_len)
+                    if self._cli.pattern:
+                        self._getInstance().setStlResultsCount(len(self._result_content))
+                    else:
+                        self._getInstance().setStlResultsCount(cur_len)
 
-                if self._getInstance().getWinPos() not in ('popup', 'floatwin'):
-                    lfCmd("redrawstatus")
+                    if self._getInstance().getWinPos() not in ('popup', 'floatwin'):
+                        self._getInstance().redrawStatusline()
 
             if self._cli.pattern:
-                if self._index < cur_len or len(self._cb_content) > 0:
-                    if self._fuzzy_engine:
-                        step = 60000 * cpu_count
-                    elif is_fuzzyMatch_C:
-                        step = 10000
-                    else:
-                        step = 2000
-                    self._search(self._content[:cur_len], True, step)
+                if ((self._index < cur_len or len(self._cb_content) > 0 or self._match_job is not None)
+                        and not self._isMatchJobRunning()):
+                    self._search(ContentView(self._content, cur_len), True, self._getIdleStep())
             else:
                 if bang:
                     if self._getInstance().empty():
@@ -3122,7 +3544,7 @@ class Manager(object):
 
         for cmd in self._cli.input(self._callback):
             cur_len = len(self._content)
-            cur_content = self._content[:cur_len]
+            cur_content = ContentView(self._content, cur_len)
             if equal(cmd, '<Update>'):
                 if self._getInstance().getWinPos() == 'popup':
                     if self._getInstance()._window_object.cursor[0] > 1:
@@ -143,6 +143,214 @@ def escQuote(str):
 def escSpecial(str):
     return re.sub('([%#$" ])', r"\\\1", str)
 
+_vim_char_class = {
+    's': r'[ \t]',
+    'S': r'[^ \t]',
+    'd': r'[0-9]',
+    'D': r'[^0-9]',
+    'w': r'[0-9A-Za-z_]',
+    'W': r'[^0-9A-Za-z_]',
+    'h': r'[A-Za-z_]',
+    'H': r'[^A-Za-z_]',
+    'a': r'[A-Za-z]',
+    'A': r'[^A-Za-z]',
+    'l': r'[a-z]',
+    'L': r'[^a-z]',
+    'u': r'[A-Z]',
+    'U': r'[^A-Z]',
+    'x': r'[0-9A-Fa-f]',
+    'X': r'[^0-9A-Fa-f]',
+    'o': r'[0-7]',
+    'O': r'[^0-7]',
+    'e': r'\x1b',
+    't': r'\t',
+    'r': r'\r',
+    'n': r'\n',
+}
+
+# characters that are special without a backslash in each magic mode
+_vim_magic_chars = {
+    'v': '()|+?={}<>@%.*[~^$&',
+    'm': '.*[~^$',
+    'M': '^$',
+    'V': '',
+}
+
+def _vimRegexTokens(regex):
+    """
+    split a vim regex into (char, is_special, is_escaped) tuples, resolving
+    \\v, \\m, \\M and \\V so that the caller does not need to care about the
+    magic mode. a backslash followed by a letter or digit is returned as one
+    special token, e.g. ('\\s', True, True).
+    """
+    mode = 'm'
+    tokens = []
+    i = 0
+    length = len(regex)
+    while i < length:
+        c = regex[i]
+        if c == '\\' and i + 1 < length:
+            c = regex[i + 1]
+            i += 2
+            if c in 'vmMV':
+                mode = c
+            elif c.isalnum() or c == '_':
+                tokens.append(('\\' + c, True, True))
+            elif mode == 'v' or c == '\\' or c == '/':
+                tokens.append((c, False, True))
+            else:
+                tokens.append((c, c not in _vim_magic_chars[mode], True))
+        else:
+            i += 1
+            tokens.append((c, c in _vim_magic_chars[mode], False))
+
+    return tokens
+
+def _vimCharCollection(tokens, i):
+    """
+    translate a vim [] collection starting after the '[' at tokens[i],
+    return (python_regex, next_index), or (None, i) if it is not terminated.
+    """
+    result = ''
+    j = i
+    if j < len(tokens) and tokens[j][0] == '^' and not tokens[j][2]:
+        result += '^'
+        j += 1
+    if j < len(tokens) and tokens[j][0] == ']' and not tokens[j][2]:
+        result += r'\]'
+        j += 1
+    while j < len(tokens):
+        c, special, escaped = tokens[j]
+        if c == ']' and not escaped:
+            return ('[' + result + ']', j + 1)
+        elif c == '[' and j + 1 < len(tokens) and tokens[j + 1][0] in ':=.':
+            raise ValueError("character class")
+        elif c.startswith('\\'):
+            if c[1] in 'etrn':
+                result += _vim_char_class[c[1]]
+            else:
+                raise ValueError("escape in collection")
+        elif c == '-' and not escaped:
+            result += '-'
+        elif escaped and c not in ']^-\\':
+            # vim keeps the backslash itself, e.g. [\.] matches '\' or '.'
+            result += r'\\' + re.escape(c)
+        else:
+            result += re.escape(c)
+        j += 1
+
+    return (None, i)
+
+def vimRegexToPython(regex, ignorecase=False):
+    """
+    translate a vim regex, as used by match(), into a compiled python regex.
+    only the commonly used subset is supported, None is returned for anything
+    else (e.g. \\zs, \\@=, \\%[, ~), so the caller can fall back to vim.
+    """
+    try:
+        tokens = _vimRegexTokens(regex)
+        result = []
+        i = 0
+        length = len(tokens)
+        while i < length:
+            c, special, escaped = tokens[i]
+            i += 1
+            if not special:
+                result.append(re.escape(c))
+            elif c.startswith('\\'):
+                c = c[1]
+                if c == 'c':
+                    ignorecase = True
+                elif c == 'C':
+                    ignorecase = False
+                elif c.isdigit():
+                    if c == '0':
+                        return None
+                    result.append('\\' + c)
+                elif c == '_':
+                    if i == length:
+                        return None
+                    c = tokens[i][0]
+                    i += 1
+                    if c == '.':
+                        result.append('.')
+                    elif c in ('^', '$'):
+                        result.append(c)
+                    elif c.startswith('\\') and c[1] in _vim_char_class:
+                        result.append(_vim_char_class[c[1]])
+                    else:
+                        return None
+                elif c in _vim_char_class:
+                    if c in 'lLuU':
+                        return None
+                    result.append(_vim_char_class[c])
+                else:
+                    return None
+            elif c == '.':
+                result.append('.')
+            elif c == '^':
+                if not result or result[-1] in ('(', '(?:', '|'):
+                    result.append('^')
+                else:
+                    result.append(r'\^')
+            elif c == '$':
+                if i == length or tokens[i][:2] in ((')', True), ('|', True)):
+                    result.append('$')
+                else:
+                    result.append(r'\$')
+            elif c in ('*', '+', '?', '='):
+                if not result or result[-1] in ('(', '(?:', '|', '^'):
+                    return None
+                result.append('?' if c == '=' else c)
+            elif c == '{':
+                end = i
+                while end < length and tokens[end][0] != '}':
+                    end += 1
+                if end == length or not result or result[-1] in ('(', '(?:', '|', '^'):
+                    return None
+                m = re.match(r'^(-?)(\d*)(?:(,)(\d*))?$',
+                             ''.join(t[0] for t in tokens[i:end]))
+                if m is None:
+                    return None
+                i = end + 1
+                lazy, low, comma, high = m.groups()
+                if not low and not high:
+                    result.append('*')
+                elif comma:
+                    result.append('{%s,%s}' % (low or '0', high))
+                else:
+                    result.append('{%s}' % low)
+                if lazy:
+                    result[-1] += '?'
+            elif c == '(':
+                result.append('(')
+            elif c == '%':
+                if i < length and tokens[i][0] == '(':
+                    i += 1
+                    result.append('(?:')
+                else:
+                    return None
+            elif c == ')':
+                result.append(')')
+            elif c == '|':
+                result.append('|')
+            elif c == '<':
+                result.append(r'\b(?=\w)')
+            elif c == '>':
+                result.append(r'\b(?<=\w)')
+            elif c == '[':
+                collection, i = _vimCharCollection(tokens, i)
+                if collection is None:
+                    result.append(r'\[')
+                else:
+                    result.append(collection)
+            else:
+                return None
+
+        return re.compile(''.join(result), re.IGNORECASE if ignorecase else 0)
+    except (ValueError, re.error):
+        return None
+
 def equal(str1, str2, ignorecase=True):
     if ignorecase:
         return str1.upper() == str2.upper()
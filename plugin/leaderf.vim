@@ -57,6 +57,14 @@ function! g:LfNoErrMsgMatch(expr, pat)
     return -2
 endfunction
 
+function! g:LfNoErrMsgFilter(list, pat)
+    try
+        return filter(range(len(a:list)), 'match(a:list[v:val], a:pat) != -1')
+    catch /^Vim\%((\a\+)\)\=:E/
+    endtry
+    return []
+endfunction
+
 function! g:LfNoErrMsgCmd(cmd)
     try
         exec a:cmd